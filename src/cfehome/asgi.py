@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cfehome.settings")
 
 application = get_asgi_application()
+
+# 存在しない public_id をデータベースに問い合わせずに判定するブルームフィルターを、最初のリクエストの前に作成します
+from courses.negative_cache import warm_up_known_public_ids  # noqa: E402
+
+warm_up_known_public_ids()
@@ -0,0 +1,9 @@
+"""
+ASGI 用の URL 設定。コースとメール確認のルートを非同期ビューで提供します。
+
+ASYNC_VIEWS_ENABLED が有効な場合に ROOT_URLCONF として使用されます。
+"""
+
+from .urls import get_urlpatterns
+
+urlpatterns = get_urlpatterns(async_views=True)
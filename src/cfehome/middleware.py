@@ -0,0 +1,77 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from helpers.metrics import start_request_metrics, stop_request_metrics
+
+logger = logging.getLogger("cfehome.metrics")
+
+
+class RequestMetricsMiddleware:
+    """
+    ビューごとのクエリ数、SQL の合計時間、テンプレートのレンダリング時間、
+    Cloudinary の URL 生成回数を計測します。
+
+    結果は `Server-Timing` ヘッダーと1行の JSON ログとして出力されます。
+    同じクエリの重複や、N+1 の兆候 (同じ SQL の繰り返し) がある場合は WARNING で記録します。
+    REQUEST_METRICS_ENABLED が有効な場合のみ MIDDLEWARE に追加されます。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.repeat_threshold = getattr(settings, "REQUEST_METRICS_REPEAT_THRESHOLD", 5)
+
+    def __call__(self, request):
+        metrics, token = start_request_metrics()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.record_query))
+                response = self.get_response(request)
+        finally:
+            stop_request_metrics(token)
+        total_time = time.perf_counter() - started
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={metrics.sql_time * 1000:.1f};desc="{metrics.query_count} queries"',
+                f"template;dur={metrics.template_time * 1000:.1f}",
+                f'cloudinary;desc="{metrics.cloudinary_builds} url builds"',
+                f"total;dur={total_time * 1000:.1f}",
+            ]
+        )
+        self.log(request, response, metrics, total_time)
+        return response
+
+    def get_view_name(self, request):
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return None
+        func = getattr(match.func, "view_class", match.func)
+        return f"{func.__module__}.{func.__qualname__}"
+
+    def log(self, request, response, metrics, total_time):
+        repeated = metrics.get_repeated_sql(threshold=self.repeat_threshold)
+        data = {
+            "view": self.get_view_name(request),
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": metrics.query_count,
+            "duplicate_queries": metrics.duplicate_count,
+            "sql_ms": round(metrics.sql_time * 1000, 2),
+            "template_ms": round(metrics.template_time * 1000, 2),
+            "cloudinary_builds": metrics.cloudinary_builds,
+            "total_ms": round(total_time * 1000, 2),
+        }
+        if metrics.duplicate_count or repeated:
+            data["repeated_sql"] = [
+                {"sql": sql, "count": count} for sql, count in repeated
+            ]
+            logger.warning(json.dumps(data))
+            return
+        logger.info(json.dumps(data))
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 
 BASE_URL = config("BASE_URL", default="http://127.0.0.1:8000")
@@ -23,6 +23,19 @@ EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD", cast=str, default=None)
 EMAIL_USE_TLS = config(
     "EMAIL_USE_TLS", cast=bool, default=True
 )  # Use EMAIL_PORT 587 for TLS
+EMAIL_BACKEND = config(
+    "EMAIL_BACKEND", default="django.core.mail.backends.smtp.EmailBackend"
+)  # e.g. django.core.mail.backends.console.EmailBackend for local workers
+# queue verification emails and send them with `manage.py process_email_outbox`
+EMAIL_OUTBOX_ENABLED = config("EMAIL_OUTBOX_ENABLED", cast=bool, default=False)
+EMAIL_SEND_BATCH_SIZE = config("EMAIL_SEND_BATCH_SIZE", cast=int, default=100)
+# keep verified email ids in a signed cookie instead of the session
+EMAIL_ACCESS_COOKIE_ENABLED = config(
+    "EMAIL_ACCESS_COOKIE_ENABLED", cast=bool, default=False
+)
+EMAIL_ACCESS_COOKIE_MAX_AGE = config(
+    "EMAIL_ACCESS_COOKIE_MAX_AGE", cast=int, default=60 * 60 * 24 * 14
+)
 
 ADMIN_USER_NAME = config("ADMIN_USER_NAME", default="Bad")
 ADMIN_USER_EMAIL = config("ADMIN_USER_EMAIL", default=None)
@@ -45,6 +58,8 @@ TEMPLATE_DIR = BASE_DIR / "templates"
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = "django-insecure-3cc(m%@ha67-bg%sir^^m+h)y4s2m4+)m2ak46y=c6@qf1nir7"
+# previous keys, still accepted for signed cookies while rotating SECRET_KEY
+SECRET_KEY_FALLBACKS = config("SECRET_KEY_FALLBACKS", cast=Csv(), default="")
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
@@ -92,6 +107,10 @@ if DEBUG:
     MIDDLEWARE.append("django_browser_reload.middleware.BrowserReloadMiddleware")
 
 ROOT_URLCONF = "cfehome.urls"
+# serve courses and email verification with the async views (run under ASGI)
+ASYNC_VIEWS_ENABLED = config("ASYNC_VIEWS_ENABLED", cast=bool, default=False)
+if ASYNC_VIEWS_ENABLED:
+    ROOT_URLCONF = "cfehome.async_urls"
 
 TEMPLATES = [
     {
@@ -104,11 +123,37 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "emails.context_processors.email_access",
             ],
         },
     },
 ]
 
+# per-request query count, SQL / template time and Cloudinary url builds
+# reported as a Server-Timing header and a JSON log line (cfehome.metrics)
+REQUEST_METRICS_ENABLED = config("REQUEST_METRICS_ENABLED", cast=bool, default=False)
+REQUEST_METRICS_REPEAT_THRESHOLD = config(
+    "REQUEST_METRICS_REPEAT_THRESHOLD", cast=int, default=5
+)
+if REQUEST_METRICS_ENABLED:
+    MIDDLEWARE.insert(0, "cfehome.middleware.RequestMetricsMiddleware")
+    TEMPLATES[0]["BACKEND"] = "helpers.metrics.InstrumentedDjangoTemplates"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "cfehome.metrics": {
+            "handlers": ["console"],
+            "level": config("REQUEST_METRICS_LOG_LEVEL", default="INFO"),
+            "propagate": False,
+        },
+    },
+}
+
 WSGI_APPLICATION = "cfehome.wsgi.application"
 
 
@@ -123,6 +168,25 @@ DATABASES = {
 }
 
 
+# Cache and sessions
+# https://docs.djangoproject.com/en/5.1/topics/http/sessions/#using-cached-sessions
+# use a shared cache (e.g. redis / memcached) when running more than one process
+
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("CACHE_LOCATION", default=""),
+    }
+}
+
+SESSION_ENGINE = config(
+    "SESSION_ENGINE", default="django.contrib.sessions.backends.cached_db"
+)
+SESSION_CACHE_ALIAS = "default"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -166,8 +230,34 @@ MEDIA_ROOT = LOCAL_CDN / "media"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# course list / detail fragment cache (seconds, 0 disables)
+COURSES_CACHE_TIMEOUT = config("COURSES_CACHE_TIMEOUT", cast=int, default=60 * 5)
+COURSES_PAGE_SIZE = config("COURSES_PAGE_SIZE", cast=int, default=12)
+LESSONS_PAGE_SIZE = config("LESSONS_PAGE_SIZE", cast=int, default=24)
+# unknown course / lesson public_ids (seconds)
+COURSES_NEGATIVE_CACHE_TIMEOUT = config(
+    "COURSES_NEGATIVE_CACHE_TIMEOUT", cast=int, default=60
+)
+COURSES_KNOWN_IDS_REFRESH = config("COURSES_KNOWN_IDS_REFRESH", cast=int, default=60 * 5)
+# lessons per page in the course admin inline
+ADMIN_LESSONS_PER_PAGE = config("ADMIN_LESSONS_PER_PAGE", cast=int, default=20)
+
 
 # cloudinary video config
 CLOUDINARY_CLOUD_NAME = config("CLOUDINARY_CLOUD_NAME", default="")
 CLOUDINARY_PUBLIC_API_KEY = config("CLOUDINARY_PUBLIC_API_KEY", default="")
 CLOUDINARY_SECRET_API_KEY = config("CLOUDINARY_SECRET_API_KEY")
+CLOUDINARY_URL_CACHE_SIZE = config("CLOUDINARY_URL_CACHE_SIZE", cast=int, default=2048)
+# image widths offered in srcset (f_auto / q_auto urls)
+CLOUDINARY_SRCSET_WIDTHS = config(
+    "CLOUDINARY_SRCSET_WIDTHS",
+    cast=Csv(cast=int),
+    default="320,480,640,768,1024,1280,1600",
+)
+CLOUDINARY_URL_CACHE_TIMEOUT = config(
+    "CLOUDINARY_URL_CACHE_TIMEOUT", cast=int, default=60 * 60 * 24
+)
+# must stay shorter than the validity window of signed private video urls
+CLOUDINARY_SIGNED_URL_CACHE_TIMEOUT = config(
+    "CLOUDINARY_SIGNED_URL_CACHE_TIMEOUT", cast=int, default=60 * 5
+)
@@ -24,22 +24,40 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
 
-from emails.views import verify_email_token_view, email_token_login_view
+from emails import views as emails_views
 from . import views
 
-urlpatterns = [
-    path("", views.home_view),
-    path("login/", views.login_logout_template_view),
-    path("logout/", views.login_logout_template_view),
-    path("hx/login/", email_token_login_view),
-    path("admin/", admin.site.urls),
-    path("courses/", include("courses.urls")),
-    path("verify/<uuid:token>/", verify_email_token_view),
-]
-
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += [
-        path("__reload__/", include("django_browser_reload.urls")),
+
+def get_urlpatterns(async_views=False):
+    """
+    URL パターンを返します。
+
+    async_views が True の場合、コースとメール確認のルートは非同期ビューになります
+    (ASGI 用の cfehome.async_urls)。
+    """
+    if async_views:
+        courses_urls = "courses.async_urls"
+        email_token_login_view = emails_views.aemail_token_login_view
+        verify_email_token_view = emails_views.averify_email_token_view
+    else:
+        courses_urls = "courses.urls"
+        email_token_login_view = emails_views.email_token_login_view
+        verify_email_token_view = emails_views.verify_email_token_view
+    patterns = [
+        path("", views.home_view),
+        path("login/", views.login_logout_template_view),
+        path("logout/", views.login_logout_template_view),
+        path("hx/login/", email_token_login_view),
+        path("admin/", admin.site.urls),
+        path("courses/", include(courses_urls)),
+        path("verify/<uuid:token>/", verify_email_token_view),
     ]
+    if settings.DEBUG:
+        patterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+        patterns += [
+            path("__reload__/", include("django_browser_reload.urls")),
+        ]
+    return patterns
+
+
+urlpatterns = get_urlpatterns()
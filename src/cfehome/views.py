@@ -18,7 +18,7 @@ def home_view(request, *args, **kwargs):
 
     フォームが無効な場合、フォームのエラーを出力します。
 
-    また、セッションにメールIDが存在する場合は、それを出力します。
+    このビューはセッションに書き込まないため、匿名の訪問者に対してセッション行は作成されません。
 
     :param request: リクエストオブジェクト
     :param args: 位置引数
@@ -37,5 +37,4 @@ def home_view(request, *args, **kwargs):
         )
     else:
         print(form.errors)
-    print("email_id", request.session.get("email_id"))
     return render(request, template_name, context)
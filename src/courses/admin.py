@@ -1,49 +1,90 @@
+import codecs
+
 import helpers
 from cloudinary import CloudinaryImage
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db.models import Count, OuterRef, Subquery
+from django.forms.models import BaseInlineFormSet
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.urls import path, reverse
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 
 # Register your models here.
+from .forms import CatalogImportForm
 from .models import Course, Lesson
+from .templatetags.responsive_images import srcset_img
+from .transfer import FORMATS, import_catalog, iter_catalog_rows
+
+ADMIN_LESSONS_PER_PAGE = getattr(settings, "ADMIN_LESSONS_PER_PAGE", 20)
+
+
+class PaginatedLessonFormSet(BaseInlineFormSet):
+    """
+    コースのレッスンを1ページ分だけ編集するインラインフォームセット。
+
+    ページ番号は `?lessons_page=` で指定し、保存時も同じページのレッスンだけを対象にします。
+    """
+
+    per_page = ADMIN_LESSONS_PER_PAGE
+    page_number = 1
+
+    @cached_property
+    def page(self):
+        paginator = Paginator(super().get_queryset(), self.per_page)
+        return paginator.get_page(self.page_number)
+
+    def get_queryset(self):
+        return self.page.object_list
 
 
 class LessonInline(admin.StackedInline):
     model = Lesson
+    formset = PaginatedLessonFormSet
+    template = "admin/courses/lesson/paginated_stacked.html"
+    classes = ["collapse"]
+    exclude = ["course_public_id", "course_access", "url_path", "thumbnail_placeholder"]
     readonly_fields = [
         "public_id",
         "updated",
-        "display_image",
-        "display_video",
+        "display_preview",
     ]
     extra = 0
 
-    def display_image(self, obj, *args, **kwargs):
-        url = helpers.get_cloudinary_image_object(
-            obj,
-            field_name="thumbnail",
-            width=200,
-        )
-        return format_html(f"<img src={url} />")
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.page_number = request.GET.get("lessons_page", 1)
+        return formset
 
-    display_image.short_description = "Current Image"
-
-    def display_video(self, obj, *args, **kwargs):
-        video_embed_html = helpers.get_cloudinary_video_object(
-            obj,
-            field_name="video",
-            as_html=True,
-            width=550,
+    def display_preview(self, obj, *args, **kwargs):
+        """
+        画像と動画は、プレビューを開いたときに HTMX で読み込みます。
+        """
+        if obj.pk is None:
+            return "-"
+        url = reverse(
+            "admin:courses_course_lesson_preview",
+            args=[obj.course_id, obj.pk],
+        )
+        return format_html(
+            '<details hx-get="{}" hx-trigger="toggle once" hx-target="find div">'
+            "<summary>Show preview</summary><div>Loading...</div></details>",
+            url,
         )
-        return video_embed_html
 
-    display_video.short_description = "Current Video"
+    display_preview.short_description = "Preview"
 
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
     inlines = [LessonInline]
-    list_display = ["title", "status", "access"]
+    list_display = ["title", "status", "access", "lesson_count"]
     list_filter = ["status", "access"]
+    show_full_result_count = False
     fields = [
         "public_id",
         "title",
@@ -54,16 +95,143 @@ class CourseAdmin(admin.ModelAdmin):
         "display_image",
     ]
     readonly_fields = ["public_id", "display_image"]
+    actions = ["export_jsonl", "export_csv"]
+    change_list_template = "admin/courses/course/change_list.html"
+
+    def get_queryset(self, request):
+        # 表示する行だけで評価される相関サブクエリで数えます (全件の GROUP BY を避けるため)
+        lesson_count = (
+            Lesson.objects.filter(course=OuterRef("pk"))
+            .order_by()
+            .values("course")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return (
+            super().get_queryset(request).annotate(lesson_count=Subquery(lesson_count))
+        )
+
+    def lesson_count(self, obj):
+        return obj.lesson_count or 0
+
+    lesson_count.short_description = "Lessons"
+    lesson_count.admin_order_field = "lesson_count"
+
+    def get_urls(self):
+        urls = [
+            path(
+                "<path:object_id>/lessons/<int:lesson_id>/preview/",
+                self.admin_site.admin_view(self.lesson_preview_view),
+                name="courses_course_lesson_preview",
+            ),
+            path(
+                "import/",
+                self.admin_site.admin_view(self.import_view),
+                name="courses_course_import",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def lesson_preview_view(self, request, object_id, lesson_id):
+        """
+        インラインの1レッスン分のサムネイルと動画 (自動再生なし) を返します。
+        """
+        course = self.get_object(request, object_id)
+        if course is None or not self.has_view_permission(request, course):
+            raise Http404
+        lesson = Lesson.objects.filter(course=course, pk=lesson_id).first()
+        if lesson is None:
+            raise Http404
+        context = {
+            "image": helpers.get_cloudinary_image_srcset(
+                lesson,
+                field_name="thumbnail",
+                width=200,
+            ),
+            "video_url": helpers.get_cloudinary_video_object(
+                lesson,
+                field_name="video",
+                width=550,
+                autoplay=False,
+            ),
+        }
+        return render(request, "admin/courses/lesson/preview.html", context)
 
     def display_image(self, obj, *args, **kwargs):
-        url = helpers.get_cloudinary_image_object(
+        image = helpers.get_cloudinary_image_srcset(
             obj,
             field_name="image",
             width=200,
         )
-        return format_html(f"<img src={url} />")
+        return srcset_img(image)
 
     display_image.short_description = "Current Image"
 
+    def export(self, queryset, format_name):
+        """
+        選択したコースとレッスンを1行ずつストリーミングでダウンロードさせます。
+        """
+        serialize, _, content_type = FORMATS[format_name]
+        response = StreamingHttpResponse(
+            serialize(iter_catalog_rows(queryset)),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="courses.{format_name}"'
+        )
+        return response
+
+    def export_jsonl(self, request, queryset):
+        return self.export(queryset, "jsonl")
+
+    export_jsonl.short_description = "Export selected courses (JSONL)"
+
+    def export_csv(self, request, queryset):
+        return self.export(queryset, "csv")
+
+    export_csv.short_description = "Export selected courses (CSV)"
+
+    def import_view(self, request):
+        """
+        エクスポートと同じ形式 (JSONL / CSV) のファイルをアップロードしてインポートします。
+
+        import_catalog コマンドと同じく1行ずつ読み込みます。大きなファイルはコマンドを使ってください。
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        form = CatalogImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            read = FORMATS[form.cleaned_data["format"]][1]
+            lines = codecs.iterdecode(form.cleaned_data["file"], "utf-8")
+            stats = import_catalog(
+                read(lines), skip_media=form.cleaned_data["skip_media"]
+            )
+            summary = ", ".join(
+                f"{name}: {count}" for name, count in sorted(stats.items())
+            )
+            self.message_user(request, f"Imported courses ({summary})")
+            return redirect("admin:courses_course_changelist")
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Import courses",
+            "form": form,
+        }
+        return render(request, "admin/courses/course/import.html", context)
+
+
+@admin.register(Lesson)
+class LessonAdmin(admin.ModelAdmin):
+    list_display = ["title", "course", "order", "status", "updated"]
+    list_filter = ["status"]
+    list_select_related = ["course"]
+    search_fields = ["title", "public_id"]
+    raw_id_fields = ["course"]
+    exclude = ["course_public_id", "course_access", "url_path", "thumbnail_placeholder"]
+    readonly_fields = ["public_id", "updated"]
+    show_full_result_count = False
+
 
 # admin.site.register(Course)
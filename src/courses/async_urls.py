@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import views
+
+
+# courses.urls と同じルートを非同期ビューで提供します (ASYNC_VIEWS_ENABLED)。
+urlpatterns = [
+    path("export.ndjson", views.acourse_catalog_export_view),
+    path("<slug:course_id>/lessons/<slug:lesson_id>/", views.alesson_detail_view),
+    path("<slug:course_id>/", views.acourse_detail_view),
+    path("", views.acourse_list_view),
+]
@@ -0,0 +1,93 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+COURSES_CACHE_TIMEOUT = getattr(settings, "COURSES_CACHE_TIMEOUT", 60 * 5)
+CATALOG_VERSION_KEY = "courses:catalog-version"
+
+
+def get_catalog_version():
+    """
+    コースカタログのバージョン番号を返します。
+
+    Course または Lesson が保存・削除されるたびに `bump_catalog_version` で更新され、
+    フラグメントキャッシュのキーに含めることで古いキャッシュを無効化します。
+
+    キャッシュから消えた場合は現在時刻 (ミリ秒) から始め直すため、
+    消える前のバージョンと同じ値が再び使われることはありません。
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        initial = get_initial_version()
+        cache.add(CATALOG_VERSION_KEY, initial, None)
+        version = cache.get(CATALOG_VERSION_KEY, initial)
+    return version
+
+
+async def aget_catalog_version():
+    """
+    `get_catalog_version` の非同期版です。キャッシュの非同期 API を使います。
+    """
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        initial = get_initial_version()
+        await cache.aadd(CATALOG_VERSION_KEY, initial, None)
+        version = await cache.aget(CATALOG_VERSION_KEY, initial)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        version = get_initial_version()
+        cache.set(CATALOG_VERSION_KEY, version, None)
+        return version
+
+
+def get_initial_version():
+    return int(time.time() * 1000)
+
+
+def get_cache_key(name, *parts):
+    """
+    カタログのバージョンを含むキャッシュキーを生成します。
+    """
+    return make_cache_key(name, get_catalog_version(), *parts)
+
+
+async def aget_cache_key(name, *parts):
+    """
+    `get_cache_key` の非同期版です。
+    """
+    return make_cache_key(name, await aget_catalog_version(), *parts)
+
+
+def make_cache_key(name, version, *parts):
+    key_parts = ":".join(f"{part}" for part in parts)
+    digest = hashlib.md5(key_parts.encode("utf-8")).hexdigest()
+    return f"courses:{name}:{version}:{digest}"
+
+
+def get_cache_context():
+    """
+    テンプレートの {% cache %} タグで使うコンテキストを返します。
+
+    COURSES_CACHE_TIMEOUT が 0 の場合、フラグメントは即座に期限切れになります。
+    """
+    return {
+        "cache_timeout": COURSES_CACHE_TIMEOUT,
+        "catalog_version": get_catalog_version(),
+    }
+
+
+async def aget_cache_context():
+    """
+    `get_cache_context` の非同期版です。
+    """
+    return {
+        "cache_timeout": COURSES_CACHE_TIMEOUT,
+        "catalog_version": await aget_catalog_version(),
+    }
@@ -0,0 +1,76 @@
+import hashlib
+
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def get_page_validators(request, email_id, last_modified, *parts):
+    """
+    ページの条件付き GET に使う ETag と Last-Modified (UNIX 時刻) を返します。
+
+    ページにはナビゲーションのログイン状態と CSRF トークンも含まれるため、
+    ETag には更新日時と parts に加えて、URL (カーソルを含む)、htmx リクエストかどうか、
+    確認済みのメールID、CSRF のシークレットを含めます。ETag は If-Modified-Since より優先されます。
+
+    CSRF のシークレットは描画時と同じ `get_token` で確定させるため、初回の訪問で発行された
+    Cookie を持つ次のリクエストから 304 になります。
+
+    Args:
+        request (HttpRequest): リクエストオブジェクト
+        email_id (str): 確認済みのメールID (ない場合は None)
+        last_modified (datetime): ページの内容の最終更新日時
+        *parts: ページの内容に影響するその他の値
+
+    Returns:
+        tuple: (ETag, Last-Modified の UNIX 時刻)
+    """
+    get_token(request)
+    key = ":".join(
+        f"{part}"
+        for part in [
+            last_modified.isoformat() if last_modified else "",
+            *parts,
+            request.get_full_path(),
+            bool(request.htmx),
+            email_id or "",
+            request.META["CSRF_COOKIE"],
+        ]
+    )
+    etag = quote_etag(hashlib.md5(key.encode("utf-8")).hexdigest())
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return etag, timestamp
+
+
+def get_not_modified_response(request, validators):
+    """
+    クライアントのキャッシュが最新の場合は 304 (または 412) のレスポンスを、それ以外は None を返します。
+    """
+    etag, timestamp = validators
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_page_validators(request, response, validators):
+    """
+    レスポンスに ETag と Last-Modified を設定します。
+
+    ログイン状態によって内容が変わるため `Cache-Control: private, no-cache` も設定し、
+    ブラウザには毎回再検証させ、共有キャッシュには保存させません。
+    """
+    if request.method not in ("GET", "HEAD") or response.status_code != 200:
+        return response
+    etag, timestamp = validators
+    if not response.has_header("ETag"):
+        response.headers["ETag"] = etag
+    if timestamp is not None and not response.has_header("Last-Modified"):
+        response.headers["Last-Modified"] = http_date(timestamp)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def get_last_modified(*values):
+    """
+    None を除いた中で最も新しい日時を返します (すべて None の場合は None)。
+    """
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
@@ -0,0 +1,26 @@
+from django import forms
+
+from .transfer import FORMATS
+
+
+class CatalogImportForm(forms.Form):
+    file = forms.FileField(help_text="JSONL または CSV (エクスポートと同じ形式)")
+    format = forms.ChoiceField(
+        choices=[("", "ファイルの拡張子から判定")] + [(name, name) for name in FORMATS],
+        required=False,
+    )
+    skip_media = forms.BooleanField(
+        required=False,
+        help_text="画像・動画の列を無視します (既存の画像・動画は変更されません)",
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        uploaded = cleaned_data.get("file")
+        if uploaded is None:
+            return cleaned_data
+        format_name = cleaned_data.get("format") or uploaded.name.rsplit(".", 1)[-1]
+        if format_name not in FORMATS:
+            raise forms.ValidationError(f"Unknown format: {format_name}")
+        cleaned_data["format"] = format_name
+        return cleaned_data
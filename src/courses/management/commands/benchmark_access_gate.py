@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from courses.models import AccessRequirement, Course, Lesson, PublishStatus
+from emails import services as emails_services
+from helpers.benchmarks import benchmark_database
+
+
+class Command(BaseCommand):
+    help = "メール必須レッスンの表示速度をセッション方式と署名付き Cookie 方式で比較します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = options["requests"]
+        with benchmark_database():
+            course = Course.objects.create(
+                title="Benchmark",
+                status=PublishStatus.PUBLISHED,
+                access=AccessRequirement.EMAIL_REQUIRED,
+            )
+            lesson = Lesson.objects.create(course=course, title="Gated lesson")
+            url = f"{lesson.path}/"
+            for cookie_mode in [False, True]:
+                with override_settings(EMAIL_ACCESS_COOKIE_ENABLED=cookie_mode):
+                    client = Client()
+                    verify_obj, _ = emails_services.start_verification_event(
+                        "benchmark@example.com"
+                    )
+                    client.get(f"/verify/{verify_obj.token}/")
+                    per_second, queries = self.run(client, url, total)
+                name = "signed cookie" if cookie_mode else "session"
+                self.stdout.write(
+                    f"{name:<14} {per_second:8.1f} req/s  {queries} queries/request"
+                )
+
+    def run(self, client, url, total):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        assert response.status_code == 200
+        queries = len(ctx.captured_queries)
+        started = time.perf_counter()
+        for _ in range(total):
+            client.get(url)
+        elapsed = time.perf_counter() - started
+        return total / elapsed, queries
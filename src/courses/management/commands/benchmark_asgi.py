@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+from courses.models import Course, Lesson
+from courses.seeds import seed_catalog
+from helpers.benchmarks import benchmark_database, summarize
+
+# (モード名, サーバーの種類, ROOT_URLCONF)
+MODES = [
+    ("wsgi", "wsgi", "cfehome.urls"),
+    ("asgi-sync-views", "asgi", "cfehome.urls"),
+    ("asgi-async-views", "asgi", "cfehome.async_urls"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "ベンチマーク用データベースにカタログを作成し、同時接続数ごとに "
+        "WSGI (スレッド) と ASGI (同期ビュー / 非同期ビュー) のスループットと "
+        "p50 / p95 レイテンシーを計測します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lessons", type=int, default=1000)
+        parser.add_argument("--lessons-per-course", type=int, default=100)
+        parser.add_argument(
+            "--concurrency",
+            default="1,50,200",
+            help="カンマ区切りの同時リクエスト数",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=1000,
+            help="同時接続数・シナリオ・モードごとのリクエスト数",
+        )
+        parser.add_argument(
+            "--wsgi-threads",
+            type=int,
+            default=0,
+            help="WSGI のワーカースレッド数 (0 の場合は同時リクエスト数と同じ)",
+        )
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="各モードの計測前にキャッシュを削除します",
+        )
+
+    def handle(self, *args, **options):
+        levels = sorted(int(level) for level in options["concurrency"].split(","))
+        total = options["requests"]
+        with benchmark_database():
+            seed_catalog(
+                options["lessons"],
+                lessons_per_course=options["lessons_per_course"],
+            )
+            for concurrency in levels:
+                self.stdout.write(f"concurrency: {concurrency}")
+                threads = options["wsgi_threads"] or concurrency
+                for scenario, url in self.get_urls().items():
+                    urls = [url] * total
+                    for mode, server, urlconf in MODES:
+                        if options["cold"]:
+                            cache.clear()
+                        with override_settings(ROOT_URLCONF=urlconf, DEBUG=False):
+                            if server == "wsgi":
+                                stats = self.run_wsgi(urls, threads)
+                            else:
+                                stats = asyncio.run(self.run_asgi(urls, concurrency))
+                        self.stdout.write(
+                            f"  {scenario:<14} {mode:<17}"
+                            f" {stats['rps']:8.0f} req/s"
+                            f"  p50 {stats['p50_ms']:8.2f}ms"
+                            f"  p95 {stats['p95_ms']:8.2f}ms"
+                        )
+
+    def get_urls(self):
+        """
+        読み取り専用のシナリオ名と URL の辞書を返します。
+
+        同時に書き込むと SQLite のロックを計測してしまうため、
+        セッションに書き込まないページ (メール不要のコース) だけを対象にします。
+        """
+        course = Course.published.first()
+        lesson = Lesson.objects.for_listing(course).first()
+        return {
+            "course_list": "/courses/",
+            "course_detail": f"{course.path}/",
+            "lesson_detail": f"{lesson.path}/",
+        }
+
+    def run_wsgi(self, urls, threads):
+        """
+        スレッド数 threads のスレッドプールで、WSGI ハンドラーにリクエストを送ります。
+        """
+        local = threading.local()
+
+        def request(url):
+            if not hasattr(local, "client"):
+                local.client = Client()
+            started = time.perf_counter()
+            response = local.client.get(url)
+            elapsed = time.perf_counter() - started
+            self.check_response(url, response)
+            return elapsed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            samples = list(pool.map(request, urls))
+        return self.get_stats(samples, time.perf_counter() - started)
+
+    async def run_asgi(self, urls, concurrency):
+        """
+        1つのイベントループから、同時に最大 concurrency 件のリクエストを ASGI ハンドラーに送ります。
+        """
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request(url):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url)
+                elapsed = time.perf_counter() - started
+            self.check_response(url, response)
+            return elapsed
+
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(request(url) for url in urls))
+        return self.get_stats(samples, time.perf_counter() - started)
+
+    def get_stats(self, samples, elapsed):
+        stats = summarize(samples)
+        stats["rps"] = len(samples) / elapsed if elapsed else 0.0
+        return stats
+
+    def check_response(self, url, response):
+        if response.status_code >= 400:
+            raise AssertionError(f"{url}: {response.status_code}")
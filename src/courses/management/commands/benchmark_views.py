@@ -0,0 +1,131 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from courses.models import Course, Lesson
+from courses.pagination import paginate_courses
+from courses.seeds import seed_catalog
+from emails.models import Email, EmailVerificationEvent
+from helpers.benchmarks import benchmark_database, summarize, timed
+
+SCENARIOS = [
+    "course_list",
+    "course_list_hx",
+    "course_detail",
+    "lesson_detail",
+    "email_token_login",
+    "verify_email_token",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "ベンチマーク用データベースにカタログを作成し、コース閲覧とログインの各ビューの"
+        "p50 / p95 レイテンシーとクエリ数をレッスン数ごとに計測します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="10,1000,100000",
+            help="カンマ区切りのレッスン数",
+        )
+        parser.add_argument("--repeat", type=int, default=100)
+        parser.add_argument("--lessons-per-course", type=int, default=100)
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="各リクエストの前にキャッシュを削除します",
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options["sizes"].split(","))
+        repeat = options["repeat"]
+        self.cold = options["cold"]
+        with benchmark_database():
+            seeded = 0
+            for size in sizes:
+                if size > seeded:
+                    seed_catalog(
+                        size - seeded,
+                        lessons_per_course=options["lessons_per_course"],
+                    )
+                    seeded = size
+                self.stdout.write(f"lessons: {Lesson.objects.count()}")
+                for name, stats in self.run_scenarios(repeat).items():
+                    self.stdout.write(
+                        f"  {name:<20} p50 {stats['p50_ms']:8.2f}ms"
+                        f"  p95 {stats['p95_ms']:8.2f}ms"
+                        f"  {stats['queries']:3d} queries"
+                    )
+
+    def get_requests(self, repeat):
+        """
+        シナリオ名と、(メソッド, URL, データ, ヘッダー) を返す関数の辞書を返します。
+
+        検証トークンは1回ずつ使うため、計測前に repeat 件作成しておきます。
+        """
+        course = Course.published.first()
+        lesson = Lesson.objects.for_listing(course).first()
+        next_url = paginate_courses(Course.published.all(), base_url="/courses/").next_url
+        hx = {"HTTP_HX_REQUEST": "true"}
+        email_obj, _ = Email.objects.get_or_create(email="benchmark@example.com")
+        tokens = iter(
+            [
+                event.token
+                for event in EmailVerificationEvent.objects.bulk_create(
+                    EmailVerificationEvent(parent=email_obj, email=email_obj.email)
+                    for _ in range(repeat + 1)
+                )
+            ]
+        )
+        return {
+            "course_list": lambda: ("get", "/courses/", None, {}),
+            "course_list_hx": lambda: ("get", next_url or "/courses/", None, hx),
+            "course_detail": lambda: ("get", f"{course.path}/", None, {}),
+            "lesson_detail": lambda: ("get", f"{lesson.path}/", None, {}),
+            "email_token_login": lambda: (
+                "post",
+                "/hx/login/",
+                {"email": email_obj.email},
+                hx,
+            ),
+            "verify_email_token": lambda: (
+                "get",
+                f"/verify/{next(tokens)}/",
+                None,
+                {},
+            ),
+        }
+
+    def run_scenarios(self, repeat):
+        """
+        各シナリオを repeat 回実行し、シナリオ名ごとの統計 (summarize の結果とクエリ数) を返します。
+
+        最初の1回はウォームアップとして、クエリ数の計測だけに使います。
+        """
+        results = {}
+        for name, get_request in self.get_requests(repeat).items():
+            client = Client()
+            with CaptureQueriesContext(connection) as ctx:
+                self.request(client, get_request())
+            queries = len(ctx.captured_queries)
+            samples = []
+            for _ in range(repeat):
+                request = get_request()
+                samples.extend(timed(lambda: self.request(client, request)))
+            stats = summarize(samples)
+            stats["queries"] = queries
+            results[name] = stats
+        return results
+
+    def request(self, client, request):
+        method, url, data, headers = request
+        if self.cold:
+            cache.clear()
+        response = getattr(client, method)(url, data, **headers)
+        if response.status_code >= 400:
+            raise AssertionError(f"{url}: {response.status_code}")
+        return response
@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from courses.models import Course
+from courses.transfer import FORMATS, iter_catalog_rows
+
+
+class Command(BaseCommand):
+    help = "コースとレッスンを JSONL または CSV に1行ずつ書き出します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=list(FORMATS),
+            help="省略時は出力先の拡張子から判定し、判定できない場合は jsonl です",
+        )
+        parser.add_argument(
+            "--output",
+            help="出力先のファイル (省略時は標準出力)",
+        )
+        parser.add_argument(
+            "--course",
+            action="append",
+            default=[],
+            help="書き出すコースの public_id (複数指定できます)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        format_name = options["format"]
+        if format_name is None:
+            suffix = Path(output).suffix.lstrip(".") if output else ""
+            format_name = suffix if suffix in FORMATS else "jsonl"
+        serialize = FORMATS[format_name][0]
+        courses = Course.objects.all()
+        if options["course"]:
+            courses = courses.filter(public_id__in=options["course"])
+        lines = serialize(iter_catalog_rows(courses, chunk_size=options["chunk_size"]))
+        if output is None:
+            sys.stdout.writelines(lines)
+            return
+        with open(output, "w", newline="", encoding="utf-8") as f:
+            f.writelines(lines)
@@ -0,0 +1,48 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.transfer import FORMATS, import_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "JSONL または CSV のコースとレッスンを1行ずつ読み込み、"
+        "bulk_create / bulk_update でまとめてインポートします。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=list(FORMATS),
+            help="省略時はファイルの拡張子から判定します",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--skip-media",
+            action="store_true",
+            help=(
+                "画像・動画の列を無視します (既存の画像・動画は変更されず、"
+                "新しい行は画像・動画なしで作成されます)"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        format_name = options["format"] or path.suffix.lstrip(".")
+        if format_name not in FORMATS:
+            raise CommandError(f"Unknown format: {format_name}")
+        read = FORMATS[format_name][1]
+        started = time.perf_counter()
+        with open(path, newline="", encoding="utf-8") as f:
+            stats = import_catalog(
+                read(f),
+                batch_size=options["batch_size"],
+                skip_media=options["skip_media"],
+            )
+        elapsed = time.perf_counter() - started
+        for name, count in sorted(stats.items()):
+            self.stdout.write(f"{name:<16} {count:>10}")
+        self.stdout.write(self.style.SUCCESS(f"done in {elapsed:.2f}s"))
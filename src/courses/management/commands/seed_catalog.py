@@ -0,0 +1,57 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from courses.seeds import seed_catalog
+from emails.seeds import seed_emails
+
+
+class Command(BaseCommand):
+    help = (
+        "スケールテスト用に Course / Lesson / Email / EmailVerificationEvent を"
+        "bulk_create でまとめて作成し、1秒あたりの行数を表示します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lessons", type=int, default=100_000)
+        parser.add_argument("--lessons-per-course", type=int, default=100)
+        parser.add_argument("--emails", type=int, default=10_000)
+        parser.add_argument("--events-per-email", type=int, default=1)
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        self.rows = Counter()
+        self.started = time.perf_counter()
+        batch_size = options["batch_size"]
+        if options["lessons"]:
+            seed_catalog(
+                options["lessons"],
+                lessons_per_course=options["lessons_per_course"],
+                batch_size=batch_size,
+                report=self.report,
+            )
+        if options["emails"]:
+            seed_emails(
+                options["emails"],
+                events_per_email=options["events_per_email"],
+                batch_size=batch_size,
+                report=self.report,
+            )
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.rows.values())
+        for name, rows in self.rows.items():
+            self.stdout.write(f"{name:<24} {rows:>10}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} rows in {elapsed:.2f}s ({total / elapsed:.0f} rows/s)"
+            )
+        )
+
+    def report(self, name, rows):
+        self.rows[name] += rows
+        if self.verbosity > 1:
+            elapsed = time.perf_counter() - self.started
+            total = sum(self.rows.values())
+            self.stdout.write(f"{total} rows ({total / elapsed:.0f} rows/s)")
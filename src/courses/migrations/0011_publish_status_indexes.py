@@ -0,0 +1,26 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0010_lesson_public_id"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["status", "public_id"], name="courses_cou_status_cbd215_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="lesson",
+            index=models.Index(
+                fields=["course", "order", "-updated", "status"],
+                name="courses_les_course__02a641_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0011_publish_status_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["status", "-timestamp", "-id"],
+                name="courses_cou_status_b1ce95_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:18
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Concat
+
+
+def backfill_course_fields(apps, schema_editor):
+    Course = apps.get_model("courses", "Course")
+    Lesson = apps.get_model("courses", "Lesson")
+    course_qs = Course.objects.filter(pk=OuterRef("course_id"))
+    course_public_id = Subquery(course_qs.values("public_id")[:1])
+    Lesson.objects.update(
+        course_public_id=course_public_id,
+        course_access=Subquery(course_qs.values("access")[:1]),
+        url_path=Concat(
+            Value("/courses/"),
+            course_public_id,
+            Value("/lessons/"),
+            F("public_id"),
+            output_field=models.CharField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0012_course_keyset_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lesson",
+            name="course_access",
+            field=models.CharField(
+                blank=True,
+                choices=[("any", "anyone"), ("email", "Email required")],
+                max_length=5,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="course_public_id",
+            field=models.CharField(blank=True, max_length=130, null=True),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="url_path",
+            field=models.CharField(blank=True, max_length=300, null=True),
+        ),
+        migrations.RunPython(backfill_course_fields, migrations.RunPython.noop),
+    ]
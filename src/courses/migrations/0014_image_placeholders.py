@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0013_lesson_denormalized_course_fields"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="image_placeholder",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="thumbnail_placeholder",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.core.files.uploadedfile import UploadedFile
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Concat
 from django.utils.text import slugify
 from cloudinary.models import CloudinaryField
 import helpers
@@ -20,6 +23,40 @@ class PublishStatus(models.TextChoices):
     DRAFT = "draft", "Draft"
 
 
+def update_image_placeholder(instance, field_name, placeholder_field):
+    """
+    アップロードされる画像からプレースホルダー (ぼかし画像と代表色) を計算して設定します。
+
+    CloudinaryField がファイルをアップロードする前 (save の前) に呼び出すため、
+    Cloudinary からダウンロードし直す必要はありません。画像が削除された場合や、
+    アップロード以外の値 (既存の public_id や URL) に変更された場合はプレースホルダーを削除します。
+    """
+    value = getattr(instance, field_name)
+    if isinstance(value, UploadedFile):
+        setattr(instance, placeholder_field, helpers.get_image_placeholder(value))
+    elif not value or is_image_changed(instance, field_name, value):
+        setattr(instance, placeholder_field, None)
+
+
+def remember_stored_image(instance, field_name):
+    """
+    データベースに保存されている画像の値を記録します (遅延読み込みの場合は記録しません)。
+
+    `update_image_placeholder` が、画像がアップロード以外の値に変更されたかを判定するために使います。
+    """
+    if field_name in instance.__dict__:
+        instance.__dict__[f"_stored_{field_name}"] = instance.__dict__[field_name]
+
+
+def is_image_changed(instance, field_name, value):
+    key = f"_stored_{field_name}"
+    if key not in instance.__dict__:
+        # 新しいインスタンスは変更とみなし、保存済みの値が分からない場合は変更なしとみなします
+        return instance._state.adding
+    field = instance._meta.get_field(field_name)
+    return field.get_prep_value(instance.__dict__[key]) != field.get_prep_value(value)
+
+
 def handle_upload(instance, filename):
     return f"{filename}"
 
@@ -93,6 +130,24 @@ def get_display_name(instance, *args, **kwargs):
     return f"{model_name} Upload"
 
 
+class PublishedCourseManager(models.Manager):
+    """
+    公開済みのコースだけを返すマネージャー。
+
+    一覧表示では使わない description を遅延読み込みにし、
+    ページネーションが安定するように新しい順 (timestamp, id) で並べます。
+    """
+
+    def get_queryset(self):
+        return (
+            super()
+            .get_queryset()
+            .filter(status=PublishStatus.PUBLISHED)
+            .defer("description")
+            .order_by("-timestamp", "-id")
+        )
+
+
 class Course(models.Model):
     title = models.CharField(max_length=120)
     description = models.TextField(blank=True, null=True)
@@ -104,6 +159,8 @@ class Course(models.Model):
         display_name=get_display_name,
         tags=["courses", "thumbnail"],
     )
+    # アップロード時に計算したぼかし画像と代表色 (helpers.get_image_placeholder)
+    image_placeholder = models.JSONField(blank=True, null=True)
     access = models.CharField(
         max_length=5,
         choices=AccessRequirement.choices,
@@ -117,10 +174,32 @@ class Course(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = models.Manager()
+    published = PublishedCourseManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "public_id"]),
+            models.Index(fields=["status", "-timestamp", "-id"]),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        remember_stored_image(instance, "image")
+        return instance
+
     def save(self, *args, **kwargs):
         if self.public_id == "" or self.public_id is None:
             self.public_id = generate_public_id(self)
+        update_image_placeholder(self, "image", "image_placeholder")
         super().save(*args, **kwargs)
+        remember_stored_image(self, "image")
+        self.lesson_set.exclude(
+            course_public_id=self.public_id,
+            course_access=self.access,
+        ).sync_course_fields()
+        helpers.invalidate_cloudinary_cache(self)
 
     def get_absolute_url(self):
         return self.path
@@ -135,7 +214,7 @@ class Course(models.Model):
     def get_display_name(self):
         return f"{self.title} - Course"
 
-    def get_thumbnail(self):
+    def get_thumbnail(self, cache=True):
         if not self.image:
             return None
         return helpers.get_cloudinary_image_object(
@@ -143,6 +222,7 @@ class Course(models.Model):
             field_name="image",
             as_html=False,
             width=382,
+            cache=cache,
         )
 
     def get_display_image(self):
@@ -155,6 +235,16 @@ class Course(models.Model):
             width=750,
         )
 
+    def get_thumbnail_srcset(self):
+        return helpers.get_cloudinary_image_srcset(
+            self, field_name="image", width=382, placeholder=self.image_placeholder
+        )
+
+    def get_display_image_srcset(self):
+        return helpers.get_cloudinary_image_srcset(
+            self, field_name="image", width=750, placeholder=self.image_placeholder
+        )
+
     @property
     def is_coming_soon(self):
         return self.status == PublishStatus.COMING_SOON
@@ -164,6 +254,54 @@ class Course(models.Model):
         return self.status == PublishStatus.PUBLISHED
 
 
+class LessonQuerySet(models.QuerySet):
+    def published(self):
+        return self.filter(
+            course__status=PublishStatus.PUBLISHED,
+            status__in=[PublishStatus.PUBLISHED, PublishStatus.COMING_SOON],
+        )
+
+    def for_listing(self, course):
+        """
+        コース詳細ページのレッスン一覧用のクエリセットを返します。
+
+        レッスンの path と access はコースの値を保存した列から読み取るため、
+        テンプレートで `get_absolute_url` などを何度呼び出しても
+        レッスンごとに Course を取得するクエリは発生しません。
+
+        Args:
+            course: レッスンを取得する Course インスタンス
+
+        Returns:
+            QuerySet: 公開済み・近日公開予定のレッスンのクエリセット
+        """
+        return self.filter(course=course).published()
+
+    def sync_course_fields(self):
+        """
+        レッスンに保存されているコースの public_id、access、path を
+        親コースの値で一括更新します。
+
+        コースを queryset.update() などで一括更新した後に呼び出してください。
+
+        Returns:
+            int: 更新されたレッスンの数
+        """
+        course_qs = Course.objects.filter(pk=OuterRef("course_id"))
+        course_public_id = Subquery(course_qs.values("public_id")[:1])
+        return self.update(
+            course_public_id=course_public_id,
+            course_access=Subquery(course_qs.values("access")[:1]),
+            url_path=Concat(
+                Value("/courses/"),
+                course_public_id,
+                Value("/lessons/"),
+                F("public_id"),
+                output_field=models.CharField(),
+            ),
+        )
+
+
 class Lesson(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     public_id = models.CharField(max_length=130, blank=True, null=True, db_index=True)
@@ -177,6 +315,7 @@ class Lesson(models.Model):
         blank=True,
         null=True,
     )
+    thumbnail_placeholder = models.JSONField(blank=True, null=True)
     video = CloudinaryField(
         "video",
         public_id_prefix=get_public_id_prefix,
@@ -197,33 +336,70 @@ class Lesson(models.Model):
         choices=PublishStatus.choices,
         default=PublishStatus.PUBLISHED,
     )
+    # 親コースの値の非正規化コピー (Course.save で同期されます)
+    course_public_id = models.CharField(max_length=130, blank=True, null=True)
+    course_access = models.CharField(
+        max_length=5,
+        choices=AccessRequirement.choices,
+        blank=True,
+        null=True,
+    )
+    url_path = models.CharField(max_length=300, blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = LessonQuerySet.as_manager()
+
     class Meta:
         ordering = ["order", "-updated"]
+        indexes = [models.Index(fields=["course", "order", "-updated", "status"])]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        remember_stored_image(instance, "thumbnail")
+        return instance
 
     def save(self, *args, **kwargs):
         if self.public_id == "" or self.public_id is None:
             self.public_id = generate_public_id(self)
+        self.course_public_id = self.course.public_id
+        self.course_access = self.course.access
+        self.url_path = self.get_course_path()
+        update_image_placeholder(self, "thumbnail", "thumbnail_placeholder")
         super().save(*args, **kwargs)
+        remember_stored_image(self, "thumbnail")
+        helpers.invalidate_cloudinary_cache(self)
 
     def get_absolute_url(self):
         return self.path
 
+    def get_course_public_id(self):
+        """
+        親コースの public_id を返します (保存済みの場合は非正規化コピーを使い、コースを読み込みません)。
+        """
+        if self.course_public_id:
+            return self.course_public_id
+        return self.course.public_id
+
+    def get_course_path(self):
+        return f"/courses/{self.get_course_public_id()}/lessons/{self.public_id}"
+
     @property
     def path(self):
-        course_path = self.course.path
-        if course_path.endswith("/"):
-            course_path = course_path[:-1]
-        return f"{course_path}/lessons/{self.public_id}"
+        if self.url_path:
+            return self.url_path
+        return self.get_course_path()
 
     @property
     def requires_email(self):
-        return self.course.access == AccessRequirement.EMAIL_REQUIRED
+        access = self.course_access
+        if access is None:
+            access = self.course.access
+        return access == AccessRequirement.EMAIL_REQUIRED
 
     def get_display_name(self):
-        return f"{self.title} - {self.course.get_display_name()}"
+        return f"{self.title} - {self.get_course_public_id()}"
 
     @property
     def is_coming_soon(self):
@@ -233,7 +409,7 @@ class Lesson(models.Model):
     def has_video(self):
         return self.video is not None
 
-    def get_thumbnail(self):
+    def get_thumbnail(self, cache=True):
         width = 382
         if self.thumbnail:
             return helpers.get_cloudinary_image_object(
@@ -242,6 +418,7 @@ class Lesson(models.Model):
                 format="jpg",
                 as_html=False,
                 width=width,
+                cache=cache,
             )
         elif self.video:
             return helpers.get_cloudinary_image_object(
@@ -250,5 +427,22 @@ class Lesson(models.Model):
                 format="jpg",
                 as_html=False,
                 width=width,
+                cache=cache,
             )
         return
+
+    def get_thumbnail_srcset(self):
+        """
+        get_thumbnail と同じ画像 (サムネイル、なければ動画から切り出した画像) の srcset を返します。
+        """
+        if self.thumbnail:
+            return helpers.get_cloudinary_image_srcset(
+                self,
+                field_name="thumbnail",
+                format="jpg",
+                width=382,
+                placeholder=self.thumbnail_placeholder,
+            )
+        return helpers.get_cloudinary_image_srcset(
+            self, field_name="video", format="jpg", width=382
+        )
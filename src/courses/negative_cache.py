@@ -0,0 +1,257 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db import DatabaseError, connection
+
+from helpers.bloom import BloomFilter
+
+from .cache import (
+    aget_cache_key,
+    aget_catalog_version,
+    get_cache_key,
+    get_catalog_version,
+    make_cache_key,
+)
+from .models import Course, Lesson, PublishStatus
+
+COURSES_NEGATIVE_CACHE_TIMEOUT = getattr(settings, "COURSES_NEGATIVE_CACHE_TIMEOUT", 60)
+COURSES_KNOWN_IDS_REFRESH = getattr(settings, "COURSES_KNOWN_IDS_REFRESH", 60 * 5)
+COURSES_KNOWN_IDS_ERROR_RATE = getattr(settings, "COURSES_KNOWN_IDS_ERROR_RATE", 0.01)
+
+
+class KnownPublicIds:
+    """
+    公開済みの public_id のブルームフィルターをプロセス内に保持します。
+
+    フィルターにない public_id は存在しないことが確実なため、データベースに問い合わせずに 404 にできます。
+    フィルターは起動時 (`load_known_public_ids`) に作成されます。
+    このプロセスでの保存・削除はシグナルから `advance` で反映されるため、作り直しは発生しません。
+
+    カタログのバージョンが変わった場合 (他のプロセスでの保存、インポートなど) はフィルターを使わずに
+    データベースで確認し、リクエストの処理が終わった後 (request_finished) に作り直します。
+    COURSES_KNOWN_IDS_REFRESH 秒ごとにも同様に作り直し、削除された public_id を取り除きます。
+    そのため、リクエストの処理中に public_id の全件を読み込むことはありません。
+
+    queryset.update() や bulk_create はシグナルを送信しないため、公開状態を一括で変更した場合は
+    `bump_catalog_version` を呼び出してください (seed_catalog とインポートはバッチごとに呼び出します)。
+    """
+
+    def __init__(self, get_queryset, refresh=COURSES_KNOWN_IDS_REFRESH):
+        self.get_queryset = get_queryset
+        self.refresh = refresh
+        self.bloom = None
+        self.version = None
+        self.built_at = 0.0
+        self.needs_build = False
+        self._lock = threading.Lock()
+
+    def is_usable(self, version=None):
+        if version is None:
+            version = get_catalog_version()
+        return self.bloom is not None and self.version == version
+
+    def is_stale(self, version=None):
+        if not self.is_usable(version):
+            return True
+        return time.monotonic() - self.built_at > self.refresh
+
+    def build(self):
+        """
+        データベースから public_id を読み込んでフィルターを作り直します。
+
+        同時に呼び出された場合は、1つのスレッドだけが作成します。
+        """
+        with self._lock:
+            if not self.is_stale():
+                self.needs_build = False
+                return
+            version = get_catalog_version()
+            public_ids = self.get_queryset().values_list("public_id", flat=True)
+            self.bloom = BloomFilter.from_values(
+                public_ids.iterator(chunk_size=5000),
+                error_rate=COURSES_KNOWN_IDS_ERROR_RATE,
+            )
+            self.version = version
+            self.built_at = time.monotonic()
+            self.needs_build = False
+
+    def can_advance(self, version):
+        return self.bloom is not None and self.version == version - 1
+
+    def advance(self, version, public_ids=()):
+        """
+        このプロセスでのカタログの変更をフィルターに反映し、バージョンを version に進めます。
+
+        保存された public_ids を追加します。削除された public_id はフィルターに残りますが、
+        偽陽性としてデータベースで確認されるだけなので、作り直す必要はありません。
+        バージョンがこの変更の直前のものでない場合 (他のプロセスの変更やキャッシュの削除を
+        見逃している場合) は、次に使われたときに作り直されます。
+        """
+        with self._lock:
+            if not self.can_advance(version):
+                self.version = None
+                return
+            for public_id in public_ids:
+                self.bloom.add(public_id)
+            self.version = version
+
+    def contains(self, public_id, version=None):
+        """
+        public_id が存在する可能性がある場合に True を返します。
+
+        フィルターが古い場合は作り直しを予約し、確認できないため True を返します
+        (呼び出し側はデータベースで確認します)。
+        """
+        if version is None:
+            version = get_catalog_version()
+        if self.is_stale(version):
+            self.needs_build = True
+        if not self.is_usable(version):
+            return True
+        return public_id in self.bloom
+
+    def __contains__(self, public_id):
+        return self.contains(public_id)
+
+
+known_courses = KnownPublicIds(lambda: Course.published.order_by())
+known_lessons = KnownPublicIds(lambda: Lesson.objects.published().order_by())
+
+
+def advance_known_public_ids(instance, version, saved=True):
+    """
+    Course / Lesson の保存・削除をこのプロセスのブルームフィルターに反映します。
+
+    公開されたコースを保存した場合は、そのコースの既存のレッスンも公開済みになるため、
+    レッスンの public_id もまとめて追加します。
+    """
+    course_ids = []
+    lesson_ids = []
+    if saved and isinstance(instance, Course):
+        course_ids.append(instance.public_id)
+        if instance.status == PublishStatus.PUBLISHED and known_lessons.can_advance(
+            version
+        ):
+            lesson_ids = list(
+                Lesson.objects.published()
+                .filter(course=instance)
+                .values_list("public_id", flat=True)
+            )
+    elif saved:
+        lesson_ids.append(instance.public_id)
+    known_courses.advance(version, course_ids)
+    known_lessons.advance(version, lesson_ids)
+
+
+def load_known_public_ids():
+    """
+    コースとレッスンのブルームフィルターが古い場合に作り直します。
+
+    起動時 (cfehome.wsgi / cfehome.asgi) と、作り直しが予約されたリクエストの終了後に呼び出されます。
+    """
+    for known_ids in (known_courses, known_lessons):
+        if known_ids.is_stale():
+            known_ids.build()
+
+
+def warm_up_known_public_ids():
+    """
+    起動時にブルームフィルターを作成します。
+
+    マイグレーション前などでテーブルがない場合は何もせず、最初のリクエストの後に作成します。
+    """
+    try:
+        load_known_public_ids()
+    except DatabaseError:
+        pass
+    finally:
+        # gunicorn --preload などで、fork する前に開いた接続をワーカー間で共有しないようにします
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def rebuild_pending_public_ids():
+    """
+    作り直しが予約されたフィルターを作り直します (レスポンスの送信後に request_finished から呼び出されます)。
+    """
+    if known_courses.needs_build or known_lessons.needs_build:
+        try:
+            load_known_public_ids()
+        except (DatabaseError, SynchronousOnlyOperation):
+            # 作り直しは予約されたまま残り、それまではデータベースで確認します
+            # (イベントループ上で request_finished が送信された場合は、次のリクエストの後に作り直します)
+            pass
+
+
+def get_course_missing_key(course_id):
+    return get_cache_key("missing-course", course_id)
+
+
+def get_lesson_missing_key(course_id, lesson_id):
+    return get_cache_key("missing-lesson", course_id, lesson_id)
+
+
+def is_course_missing(course_id):
+    """
+    コースが存在しない (公開されていない) ことがデータベースに問い合わせずに分かる場合に True を返します。
+    """
+    if course_id not in known_courses:
+        return True
+    return cache.get(get_course_missing_key(course_id)) is not None
+
+
+def is_lesson_missing(course_id, lesson_id):
+    if course_id not in known_courses or lesson_id not in known_lessons:
+        return True
+    return cache.get(get_lesson_missing_key(course_id, lesson_id)) is not None
+
+
+async def ais_course_missing(course_id):
+    """
+    `is_course_missing` の非同期版です。
+    """
+    version = await aget_catalog_version()
+    if not known_courses.contains(course_id, version):
+        return True
+    key = make_cache_key("missing-course", version, course_id)
+    return await cache.aget(key) is not None
+
+
+async def ais_lesson_missing(course_id, lesson_id):
+    version = await aget_catalog_version()
+    if not known_courses.contains(course_id, version):
+        return True
+    if not known_lessons.contains(lesson_id, version):
+        return True
+    key = make_cache_key("missing-lesson", version, course_id, lesson_id)
+    return await cache.aget(key) is not None
+
+
+def remember_missing_course(course_id):
+    """
+    データベースに存在しなかったコースを COURSES_NEGATIVE_CACHE_TIMEOUT 秒だけ記録します。
+
+    キーにカタログのバージョンを含むため、コースやレッスンが保存されるとすぐに無効になります。
+    """
+    cache.set(get_course_missing_key(course_id), True, COURSES_NEGATIVE_CACHE_TIMEOUT)
+
+
+def remember_missing_lesson(course_id, lesson_id):
+    cache.set(
+        get_lesson_missing_key(course_id, lesson_id),
+        True,
+        COURSES_NEGATIVE_CACHE_TIMEOUT,
+    )
+
+
+async def aremember_missing_course(course_id):
+    key = await aget_cache_key("missing-course", course_id)
+    await cache.aset(key, True, COURSES_NEGATIVE_CACHE_TIMEOUT)
+
+
+async def aremember_missing_lesson(course_id, lesson_id):
+    key = await aget_cache_key("missing-lesson", course_id, lesson_id)
+    await cache.aset(key, True, COURSES_NEGATIVE_CACHE_TIMEOUT)
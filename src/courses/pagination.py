@@ -0,0 +1,156 @@
+import base64
+import json
+from functools import cached_property
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+COURSES_PAGE_SIZE = getattr(settings, "COURSES_PAGE_SIZE", 12)
+LESSONS_PAGE_SIZE = getattr(settings, "LESSONS_PAGE_SIZE", 24)
+COURSE_ORDERING = ["-timestamp", "-id"]
+LESSON_ORDERING = ["order", "-updated", "id"]
+
+
+def encode_cursor(values):
+    data = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    カーソル文字列を値のリストに戻します。不正なカーソルの場合は None を返します。
+    """
+    if not cursor:
+        return None
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list):
+        return None
+    return values
+
+
+def get_keyset_filter(model, ordering, values):
+    """
+    並び順のキー (ordering) で values より後ろにある行を表す Q オブジェクトを返します。
+
+    例えば ordering が ["-timestamp", "-id"] の場合、
+    `timestamp < t OR (timestamp = t AND id < i)` を生成します。
+    """
+    condition = Q()
+    equal = Q()
+    for name, value in zip(ordering, values):
+        descending = name.startswith("-")
+        field_name = name.lstrip("-")
+        value = model._meta.get_field(field_name).to_python(value)
+        lookup = "lt" if descending else "gt"
+        condition |= equal & Q(**{f"{field_name}__{lookup}": value})
+        equal &= Q(**{field_name: value})
+    return condition
+
+
+class KeysetPage:
+    """
+    OFFSET を使わないカーソル (キーセット) 方式のページ。
+
+    前のページの最後の行の並び順キーをカーソルとして受け取り、その続きを取得するため、
+    何ページ目でも1ページ目と同じコストで取得できます。
+    クエリはテンプレートで反復されるまで実行されません (非同期ビューでは `aload` で先に読み込みます)。
+    不正なカーソルは無視され、`cursor` は None (1ページ目) になります。
+    params はカーソル以外に `next_url` に引き継ぐクエリパラメーターです。
+    """
+
+    def __init__(
+        self, queryset, ordering, cursor=None, page_size=12, base_url="", params=None
+    ):
+        self.ordering = ordering
+        self.page_size = page_size
+        self.base_url = base_url
+        self.params = params or {}
+        self.cursor = None
+        queryset = queryset.order_by(*ordering)
+        values = decode_cursor(cursor)
+        if values is not None and len(values) == len(ordering):
+            try:
+                keyset_filter = get_keyset_filter(queryset.model, ordering, values)
+            except ValidationError:
+                keyset_filter = None
+            if keyset_filter is not None:
+                queryset = queryset.filter(keyset_filter)
+                self.cursor = cursor
+        self.queryset = queryset
+
+    @cached_property
+    def _rows(self):
+        return list(self.queryset[: self.page_size + 1])
+
+    async def aload(self):
+        """
+        非同期ビュー用に、ページの行を非同期 ORM で先に読み込みます。
+
+        読み込み後はテンプレートから同期的に反復してもクエリは発生しません。
+        """
+        if "_rows" not in self.__dict__:
+            self.__dict__["_rows"] = [
+                obj async for obj in self.queryset[: self.page_size + 1]
+            ]
+        return self
+
+    @property
+    def object_list(self):
+        return self._rows[: self.page_size]
+
+    @property
+    def has_next(self):
+        return len(self._rows) > self.page_size
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        last = self.object_list[-1]
+        values = []
+        for name in self.ordering:
+            field = last._meta.get_field(name.lstrip("-"))
+            values.append(field.value_to_string(last))
+        return encode_cursor(values)
+
+    @property
+    def next_url(self):
+        cursor = self.next_cursor
+        if cursor is None:
+            return None
+        return f"{self.base_url}?{urlencode({**self.params, 'cursor': cursor})}"
+
+
+def paginate_courses(
+    queryset, cursor=None, page_size=COURSES_PAGE_SIZE, base_url="", params=None
+):
+    return KeysetPage(
+        queryset,
+        COURSE_ORDERING,
+        cursor=cursor,
+        page_size=page_size,
+        base_url=base_url,
+        params=params,
+    )
+
+
+def paginate_lessons(queryset, cursor=None, page_size=LESSONS_PAGE_SIZE, base_url=""):
+    return KeysetPage(
+        queryset,
+        LESSON_ORDERING,
+        cursor=cursor,
+        page_size=page_size,
+        base_url=base_url,
+    )
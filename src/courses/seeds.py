@@ -0,0 +1,85 @@
+import math
+
+from helpers.batches import batched
+
+from .cache import bump_catalog_version
+from .models import (
+    AccessRequirement,
+    Course,
+    Lesson,
+    PublishStatus,
+    generate_public_id,
+)
+
+
+def build_course(index, **kwargs):
+    """
+    保存されていない Course を生成し、Course.save と同じ方式で public_id を設定します。
+    """
+    course = Course(
+        title=f"Course {index}",
+        status=PublishStatus.PUBLISHED,
+        access=AccessRequirement.ANYONE,
+        **kwargs,
+    )
+    course.public_id = generate_public_id(course)
+    return course
+
+
+def build_lesson(course, index, **kwargs):
+    """
+    保存されていない Lesson を生成します。
+
+    Lesson.save を通さずに bulk_create できるように、
+    public_id と親コースの非正規化フィールドもここで設定します。
+    """
+    lesson = Lesson(
+        course=course,
+        title=f"Lesson {index}",
+        order=index,
+        status=PublishStatus.PUBLISHED,
+        **kwargs,
+    )
+    lesson.public_id = generate_public_id(lesson)
+    lesson.course_public_id = course.public_id
+    lesson.course_access = course.access
+    lesson.url_path = lesson.get_course_path()
+    return lesson
+
+
+def seed_catalog(lessons, lessons_per_course=100, batch_size=1000, report=None):
+    """
+    公開済みのコースとレッスンを bulk_create で batch_size 件ずつ作成します。
+
+    コースも batch_size 件ずつ作成し、そのコースのレッスンを続けて作成するため、
+    何百万行でもメモリ使用量は batch_size に比例する分だけです。
+    画像や動画は設定しないため、Cloudinary へのアップロードは発生しません。
+
+    Args:
+        lessons: 作成するレッスンの数
+        lessons_per_course: 1コースあたりのレッスン数
+        batch_size: bulk_create の1回あたりの行数
+        report: 各 bulk_create の後に (モデル名, 行数) で呼び出される関数
+
+    Returns:
+        tuple: 作成されたコースとレッスンの数
+
+    bulk_create はシグナルを送信しないため、コースのバッチごとにカタログのバージョンを更新します。
+    """
+    report = report or (lambda name, rows: None)
+    course_count = max(1, math.ceil(lessons / lessons_per_course))
+    for indexes in batched(range(course_count), batch_size):
+        courses = Course.objects.bulk_create([build_course(i) for i in indexes])
+        report("course", len(courses))
+        lesson_objs = (
+            build_lesson(course, order)
+            for index, course in zip(indexes, courses)
+            for order in range(
+                min(lessons_per_course, lessons - index * lessons_per_course)
+            )
+        )
+        for batch in batched(lesson_objs, batch_size):
+            Lesson.objects.bulk_create(batch)
+            report("lesson", len(batch))
+        bump_catalog_version()
+    return course_count, lessons
@@ -1,15 +1,52 @@
 from .models import Course, PublishStatus, Lesson
-from django.db.models import Q
+from .negative_cache import (
+    ais_course_missing,
+    ais_lesson_missing,
+    aremember_missing_course,
+    aremember_missing_lesson,
+    is_course_missing,
+    is_lesson_missing,
+    remember_missing_course,
+    remember_missing_lesson,
+)
+from django.db.models import Count, Max, OuterRef, Q, Subquery
 
 
 def get_publish_courses():
     """
     公開されているコースオブジェクトのクエリセットを返します。
 
-    返されるクエリセットは、公開されているコースのみが含まれるようにフィルタリングされます。
+    返されるクエリセットは、公開されているコースのみが含まれるようにデータベース上でフィルタリングされ、
+    新しい順に並べられます。
     """
 
-    return Course.objects.filter(is_published=True)
+    return Course.published.all()
+
+
+def get_catalog_last_modified():
+    """
+    コース一覧の条件付き GET に使う、全コースの最終更新日時と件数を1回の集計クエリで返します。
+
+    件数を含めるのは、コースの削除では最終更新日時が変わらないためです。
+
+    :return: (最終更新日時, コース数) のタプル。
+    """
+    result = Course.objects.aggregate(updated=Max("updated"), count=Count("pk"))
+    return result["updated"], result["count"]
+
+
+def with_lessons_modified(queryset):
+    """
+    コースのクエリセットに、レッスンの最終更新日時 (`lessons_updated`) と
+    件数 (`lessons_count`) を相関サブクエリで追加します。
+
+    コース詳細の条件付き GET の検証子を、コースを取得するクエリだけで計算するために使います。
+    """
+    lessons = Lesson.objects.filter(course=OuterRef("pk")).order_by().values("course")
+    return queryset.annotate(
+        lessons_updated=Subquery(lessons.annotate(m=Max("updated")).values("m")),
+        lessons_count=Subquery(lessons.annotate(c=Count("pk")).values("c")),
+    )
 
 
 def get_course_detail(course_id=None):
@@ -19,20 +56,26 @@ def get_course_detail(course_id=None):
     course_idがNoneの場合、Noneを返します。
 
     返されるオブジェクトは、公開されているコースのみが表示されるようにフィルタリングされます。
+    条件付き GET のために、レッスンの最終更新日時と件数も同じクエリで取得します。
+
+    存在しない public_id はブルームフィルターと短時間のネガティブキャッシュで判定し、
+    データベースに問い合わせずに None を返します。
 
     :param course_id: 取得するコースのpublic_id。
     :return: 見つかった場合はコースオブジェクト、そうでない場合はNone。
     """
 
-    if course_id is None:
+    if course_id is None or is_course_missing(course_id):
         return None
     obj = None
     try:
-        obj = Course.objects.get(
+        obj = with_lessons_modified(Course.objects).get(
             status=PublishStatus.PUBLISHED,
             public_id=course_id,
         )
-    except:
+    except Course.DoesNotExist:
+        remember_missing_course(course_id)
+    except Course.MultipleObjectsReturned:
         pass
     return obj
 
@@ -52,10 +95,7 @@ def get_course_lessons(course_obj=None):
     lessons = Lesson.objects.none()
     if not isinstance(course_obj, Course):
         return lessons
-    lessons = course_obj.lesson_set.filter(
-        course__status=PublishStatus.PUBLISHED,
-        status__in=[PublishStatus.PUBLISHED, PublishStatus.COMING_SOON],
-    )
+    lessons = Lesson.objects.for_listing(course_obj)
     return lessons
 
 
@@ -66,6 +106,8 @@ def get_lesson_detail(course_id=None, lesson_id=None):
     指定されたcourse_idとlesson_idでデータベースからレッスンオブジェクトを取得します。
     レッスンオブジェクトは、公開されているコースに属している必要があり、
     レッスンオブジェクトのステータスは「公開済み」または「近日公開予定」のいずれかである必要があります。
+    条件付き GET でコースの更新日時も使うため、コースも同じクエリで読み込みます。
+    存在しない public_id は `get_course_detail` と同様にデータベースに問い合わせずに判定します。
 
     :param course_id: レッスンを取得するコースのpublic_id。
     :param lesson_id: 取得するレッスンのpublic_id。
@@ -73,15 +115,72 @@ def get_lesson_detail(course_id=None, lesson_id=None):
     """
     if lesson_id is None or course_id is None:
         return None
+    if is_lesson_missing(course_id, lesson_id):
+        return None
     obj = None
     try:
-        obj = Lesson.objects.get(
+        obj = Lesson.objects.select_related("course").get(
             course__public_id=course_id,
             course__status=PublishStatus.PUBLISHED,
             status__in=[PublishStatus.PUBLISHED, PublishStatus.COMING_SOON],
             public_id=lesson_id,
         )
-    except Exception as e:
-        print(e)
+    except Lesson.DoesNotExist:
+        remember_missing_lesson(course_id, lesson_id)
+    except Lesson.MultipleObjectsReturned:
         pass
     return obj
+
+
+async def aget_course_detail(course_id=None):
+    """
+    `get_course_detail` の非同期版です。Django の非同期 ORM でコースを取得します。
+
+    :param course_id: 取得するコースのpublic_id。
+    :return: 見つかった場合はコースオブジェクト、そうでない場合はNone。
+    """
+    if course_id is None or await ais_course_missing(course_id):
+        return None
+    obj = await with_lessons_modified(Course.objects).filter(
+        status=PublishStatus.PUBLISHED,
+        public_id=course_id,
+    ).afirst()
+    if obj is None:
+        await aremember_missing_course(course_id)
+    return obj
+
+
+async def aget_lesson_detail(course_id=None, lesson_id=None):
+    """
+    `get_lesson_detail` の非同期版です。Django の非同期 ORM でレッスンを取得します。
+
+    条件で既にコースを結合しているため、コースも同じクエリで読み込みます
+    (非同期ビューでは `lesson.course` の遅延読み込みができないためです)。
+
+    :param course_id: レッスンを取得するコースのpublic_id。
+    :param lesson_id: 取得するレッスンのpublic_id。
+    :return: 見つかった場合はレッスンオブジェクト、そうでない場合はNone。
+    """
+    if lesson_id is None or course_id is None:
+        return None
+    if await ais_lesson_missing(course_id, lesson_id):
+        return None
+    obj = await Lesson.objects.filter(
+        course__public_id=course_id,
+        course__status=PublishStatus.PUBLISHED,
+        status__in=[PublishStatus.PUBLISHED, PublishStatus.COMING_SOON],
+        public_id=lesson_id,
+    ).select_related("course").afirst()
+    if obj is None:
+        await aremember_missing_lesson(course_id, lesson_id)
+    return obj
+
+
+async def aget_catalog_last_modified():
+    """
+    `get_catalog_last_modified` の非同期版です。
+    """
+    result = await Course.objects.aaggregate(
+        updated=Max("updated"), count=Count("pk")
+    )
+    return result["updated"], result["count"]
@@ -0,0 +1,21 @@
+from django.core.signals import request_finished
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .models import Course, Lesson
+from .negative_cache import advance_known_public_ids, rebuild_pending_public_ids
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_catalog_cache(sender, instance, *args, **kwargs):
+    version = bump_catalog_version()
+    advance_known_public_ids(instance, version, saved="created" in kwargs)
+
+
+@receiver(request_finished)
+def rebuild_known_public_ids(sender, **kwargs):
+    rebuild_pending_public_ids()
@@ -0,0 +1,51 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+
+@register.simple_tag
+def srcset_img(image, sizes=None, loading="lazy", **attrs):
+    """
+    `get_cloudinary_image_srcset` の結果から、レスポンシブな <img> タグを出力します。
+
+    sizes を省略した場合は、表示幅を上限として画面幅いっぱいに表示する値を使います。
+    loading は既定で "lazy" です。最初の画面に表示される画像には loading="eager" を指定してください。
+    その他のキーワード引数 (class, alt など) はそのまま属性として出力されます。
+    アップロード時のプレースホルダーがある場合は、画像の読み込み前にぼかし画像と代表色を表示します。
+
+    例: {% srcset_img object.get_thumbnail_srcset class="rounded" alt=object.title %}
+    """
+    if not image:
+        return ""
+    width = image["width"]
+    if sizes is None:
+        sizes = f"(max-width: {width}px) 100vw, {width}px"
+    placeholder = image.get("placeholder")
+    if placeholder:
+        attrs = {**get_placeholder_attrs(width, placeholder), **attrs}
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" loading="{}"'
+        ' decoding="async"{} />',
+        image["src"],
+        image["srcset"],
+        sizes,
+        width,
+        loading,
+        format_html_join("", ' {}="{}"', attrs.items()),
+    )
+
+
+def get_placeholder_attrs(width, placeholder):
+    """
+    プレースホルダーから height と style 属性を返します。
+
+    元画像の縦横比から height を指定して読み込み前から場所を確保し、
+    代表色とぼかし画像 (data URI) を背景に表示します。追加のリクエストは発生しません。
+    """
+    height = round(width * placeholder["height"] / placeholder["width"])
+    style = (
+        f"background:{placeholder['color']} url({placeholder['src']})"
+        " center/cover no-repeat"
+    )
+    return {"height": height, "style": style}
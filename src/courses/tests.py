@@ -1,3 +1,1111 @@
-from django.test import TestCase
+import json
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from cloudinary import CloudinaryResource
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from emails import services as emails_services
+from emails.models import EmailVerificationEvent
+import helpers
+from helpers._cloudinary.cache import image_url_cache, video_url_cache
+from helpers.bloom import BloomFilter
+from helpers.metrics import RequestMetrics
+
+from .management.commands import benchmark_views
+from .models import (
+    AccessRequirement,
+    Course,
+    Lesson,
+    PublishStatus,
+    get_display_name,
+    get_public_id_prefix,
+)
+from .negative_cache import (
+    KnownPublicIds,
+    known_courses,
+    known_lessons,
+    load_known_public_ids,
+    warm_up_known_public_ids,
+)
+from .pagination import COURSES_PAGE_SIZE, paginate_courses, paginate_lessons
+from . import services, transfer
+from .seeds import seed_catalog
+
+
+class CourseDetailQueryCountTestCase(TestCase):
+    def create_course(self, lesson_count):
+        course = Course.objects.create(
+            title="Query Count Course",
+            status=PublishStatus.PUBLISHED,
+        )
+        for i in range(lesson_count):
+            Lesson.objects.create(course=course, title=f"Lesson {i}", order=i)
+        return course
+
+    def test_lesson_listing_query_count_is_constant(self):
+        for lesson_count in [1, 20]:
+            course = self.create_course(lesson_count)
+            load_known_public_ids()
+            with self.assertNumQueries(2):
+                response = self.client.get(course.get_absolute_url() + "/")
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, "/lessons/", count=lesson_count * 2)
+
+    def test_for_listing_excludes_draft_lessons(self):
+        course = self.create_course(2)
+        Lesson.objects.create(course=course, title="Draft", status=PublishStatus.DRAFT)
+        self.assertEqual(Lesson.objects.for_listing(course).count(), 2)
+
+
+class CloudinaryURLCacheTestCase(TestCase):
+    def setUp(self):
+        course = Course.objects.create(
+            title="Cached Image Course",
+            status=PublishStatus.PUBLISHED,
+            image="image/upload/v1/sample.jpg",
+        )
+        self.course = Course.objects.get(pk=course.pk)
+
+    def test_thumbnail_url_is_built_once(self):
+        with mock.patch.object(
+            CloudinaryResource, "build_url", return_value="https://cdn/a.jpg"
+        ) as build_url:
+            for _ in range(3):
+                self.assertEqual(self.course.get_thumbnail(), "https://cdn/a.jpg")
+        self.assertEqual(build_url.call_count, 1)
+
+    def test_save_invalidates_cached_url(self):
+        with mock.patch.object(
+            CloudinaryResource, "build_url", return_value="https://cdn/a.jpg"
+        ) as build_url:
+            self.course.get_thumbnail()
+            self.course.title = "Updated"
+            self.course.save()
+            self.course.get_thumbnail()
+        self.assertEqual(build_url.call_count, 2)
+
+    def build_url(self, **options):
+        return f"https://cdn/w_{options['width']},{options['fetch_format']}.jpg"
+
+    def test_srcset_is_built_once_per_image_version(self):
+        with mock.patch.object(
+            CloudinaryResource, "build_url", side_effect=self.build_url
+        ) as build_url:
+            for _ in range(2):
+                image = self.course.get_thumbnail_srcset()
+            self.assertEqual(build_url.call_count, 5)
+            self.assertEqual(image["src"], "https://cdn/w_382,auto.jpg")
+            self.assertIn("https://cdn/w_764,auto.jpg 764w", image["srcset"])
+            self.course.image.version = "2"
+            self.course.get_thumbnail_srcset()
+        self.assertEqual(build_url.call_count, 10)
+
+    def test_srcset_img_tag(self):
+        with mock.patch.object(
+            CloudinaryResource, "build_url", side_effect=self.build_url
+        ):
+            response = self.client.get("/courses/")
+        self.assertContains(response, 'srcset="https://cdn/w_320,auto.jpg 320w')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, 'sizes="(min-width: 1024px) 382px, 100vw"')
+
+
+class ImagePlaceholderTestCase(TestCase):
+    def setUp(self):
+        self.path = Path(self.enterContext(tempfile.TemporaryDirectory())) / "a.png"
+        Image.new("RGB", (64, 32), (255, 0, 0)).save(self.path)
+
+    def test_placeholder_from_local_file(self):
+        placeholder = helpers.get_image_placeholder(self.path)
+        self.assertEqual(placeholder["color"], "#ff0000")
+        self.assertEqual((placeholder["width"], placeholder["height"]), (64, 32))
+        self.assertTrue(placeholder["src"].startswith("data:image/"))
+        self.assertLess(len(placeholder["src"]), 400)
+        self.assertIsNone(helpers.get_image_placeholder(BytesIO(b"not an image")))
+
+    def test_decompression_bomb_has_no_placeholder(self):
+        for max_pixels in [64 * 32 - 1, 64 * 32 // 2 - 1]:
+            with mock.patch.object(Image, "MAX_IMAGE_PIXELS", max_pixels):
+                self.assertIsNone(helpers.get_image_placeholder(self.path))
+
+    def test_upload_stores_placeholder(self):
+        upload = SimpleUploadedFile("a.png", self.path.read_bytes())
+        resource = CloudinaryResource(
+            "courses/a", version="1", format="png", type="upload", resource_type="image"
+        )
+        with mock.patch(
+            "cloudinary.models.uploader.upload_resource", return_value=resource
+        ) as upload_resource:
+            course = Course.objects.create(
+                title="Placeholder", status=PublishStatus.PUBLISHED, image=upload
+            )
+        self.assertEqual(upload_resource.call_args.args[0].tell(), 0)
+        course = Course.objects.get(pk=course.pk)
+        self.assertEqual(course.image_placeholder["color"], "#ff0000")
+        with mock.patch.object(
+            CloudinaryResource, "build_url", return_value="https://cdn/a.png"
+        ):
+            response = self.client.get("/courses/")
+        self.assertContains(response, 'height="191"')
+        self.assertContains(response, "background:#ff0000 url(data:image/")
+
+    def test_placeholder_is_cleared_when_image_is_replaced(self):
+        placeholder = {"src": "data:image/png;base64,", "color": "#ff0000"}
+        course = Course.objects.create(title="Replaced", image="image/upload/v1/a.jpg")
+        Course.objects.filter(pk=course.pk).update(image_placeholder=placeholder)
+        course = Course.objects.get(pk=course.pk)
+        course.title = "Renamed"
+        course.save()
+        self.assertEqual(course.image_placeholder, placeholder)
+        course.image = "image/upload/v2/b.jpg"
+        course.save()
+        self.assertIsNone(Course.objects.get(pk=course.pk).image_placeholder)
+        course = Course.objects.create(
+            title="New", image="image/upload/v1/a.jpg", image_placeholder=placeholder
+        )
+        self.assertIsNone(course.image_placeholder)
+
+    def test_import_clears_placeholder_of_changed_images(self):
+        placeholder = {"src": "data:image/png;base64,", "color": "#ff0000"}
+        for public_id in ["same", "changed"]:
+            Course.objects.create(
+                title=public_id, public_id=public_id, image="image/upload/v1/a.jpg"
+            )
+        Course.objects.update(image_placeholder=placeholder)
+        rows = list(transfer.iter_catalog_rows())
+        rows[1]["image"] = "image/upload/v2/b.jpg"
+        stats = transfer.import_catalog(rows)
+        self.assertEqual(stats["course_updated"], 1)
+        self.assertEqual(
+            Course.objects.get(public_id="same").image_placeholder, placeholder
+        )
+        self.assertIsNone(Course.objects.get(public_id="changed").image_placeholder)
+
+
+class CloudinaryVideoCacheTestCase(TestCase):
+    def test_embed_html_is_reused(self):
+        course = Course.objects.create(title="Video Course")
+        lesson = Lesson.objects.create(
+            course=course, title="Video Lesson", video="video/private/v1/clip.mp4"
+        )
+        lesson = Lesson.objects.get(pk=lesson.pk)
+        video_url_cache.reset_stats()
+        with mock.patch.object(
+            CloudinaryResource, "build_url", return_value="https://cdn/clip.mp4"
+        ) as build_url:
+            for _ in range(3):
+                html = helpers.get_cloudinary_video_object(
+                    lesson, field_name="video", as_html=True, width=1250
+                )
+                self.assertIn("https://cdn/clip.mp4", html)
+        self.assertEqual(build_url.call_count, 1)
+        self.assertEqual(video_url_cache.stats()["hits"], 2)
+
+    def test_async_embed_uses_async_cache_api(self):
+        course = Course.objects.create(title="Async Video Course")
+        lesson = Lesson.objects.create(
+            course=course, title="Async Lesson", video="video/private/v1/clip.mp4"
+        )
+        lesson = Lesson.objects.get(pk=lesson.pk)
+        video_url_cache.local.clear()
+        with mock.patch.object(
+            CloudinaryResource, "build_url", return_value="https://cdn/clip.mp4"
+        ), mock.patch.object(
+            cache, "aget", wraps=cache.aget
+        ) as cache_aget, mock.patch.object(
+            cache, "aset", wraps=cache.aset
+        ) as cache_aset:
+            html = async_to_sync(helpers.aget_cloudinary_video_object)(
+                lesson, field_name="video", as_html=True, width=1250
+            )
+            # 同期版と同じキーで保存されます
+            video_url_cache.local.clear()
+            cached = async_to_sync(helpers.aget_cloudinary_video_object)(
+                lesson, field_name="video", as_html=True, width=1250
+            )
+        self.assertIn("https://cdn/clip.mp4", html)
+        self.assertEqual(cached, html)
+        self.assertEqual(cache_aget.call_count, 2)
+        self.assertEqual(cache_aset.call_count, 1)
+        self.assertEqual(
+            helpers.get_cloudinary_video_object(
+                lesson, field_name="video", as_html=True, width=1250
+            ),
+            html,
+        )
+
+
+class CoursePageCacheTestCase(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title="Cached Course", status=PublishStatus.PUBLISHED
+        )
+        Lesson.objects.create(course=self.course, title="First Lesson")
+        self.url = self.course.get_absolute_url() + "/"
+
+    def test_cached_detail_skips_lesson_query(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertContains(response, "First Lesson")
+
+    def test_lesson_save_invalidates_detail(self):
+        self.client.get(self.url)
+        Lesson.objects.create(course=self.course, title="Second Lesson")
+        response = self.client.get(self.url)
+        self.assertContains(response, "Second Lesson")
+
+    def test_detail_varies_on_hx_request(self):
+        response = self.client.get(self.url)
+        self.assertIn("HX-Request", response["Vary"])
+
+
+class PublishStatusIndexTestCase(TestCase):
+    def test_lesson_listing_uses_composite_index(self):
+        course = Course.objects.create(title="Indexed", status=PublishStatus.PUBLISHED)
+        plan = Lesson.objects.for_listing(course).explain()
+        self.assertIn("courses_les_course__02a641_idx", plan)
+        self.assertNotIn("TEMP B-TREE FOR ORDER BY", plan)
+
+    def test_course_detail_uses_composite_index(self):
+        plan = Course.objects.filter(
+            status=PublishStatus.PUBLISHED, public_id="missing"
+        ).explain()
+        self.assertIn("courses_cou_status_cbd215_idx", plan)
+
+
+class PublishedCourseManagerTestCase(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Course.objects.create(
+                title=f"Published {i}", status=PublishStatus.PUBLISHED
+            )
+        Course.objects.create(title="Draft", status=PublishStatus.DRAFT)
+
+    def test_published_filters_in_sql(self):
+        titles = [course.title for course in Course.published.all()]
+        self.assertEqual(len(titles), 5)
+        self.assertNotIn("Draft", titles)
+
+    def test_htmx_list_slices_with_limit(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/courses/", headers={"HX-Request": "true"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "<article", count=5)
+        sql = ctx.captured_queries[-1]["sql"]
+        self.assertIn(f"LIMIT {COURSES_PAGE_SIZE + 1}", sql)
+        self.assertNotIn('"description"', sql)
+
+    def test_full_list_renders(self):
+        response = self.client.get("/courses/")
+        self.assertContains(response, "<article", count=5)
+
+
+class KeysetPaginationTestCase(TestCase):
+    def collect(self, paginate, queryset, page_size):
+        seen = []
+        cursor = None
+        while True:
+            page = paginate(queryset, cursor=cursor, page_size=page_size)
+            seen.extend(obj.pk for obj in page)
+            cursor = page.next_cursor
+            if cursor is None:
+                return seen
+
+    def test_course_pages_cover_all_courses_once(self):
+        for i in range(7):
+            Course.objects.create(title=f"Course {i}", status=PublishStatus.PUBLISHED)
+        queryset = Course.published.all()
+        seen = self.collect(paginate_courses, queryset, 3)
+        self.assertEqual(seen, list(queryset.values_list("pk", flat=True)))
+
+    def test_lesson_pages_follow_lesson_ordering(self):
+        course = Course.objects.create(title="Paged", status=PublishStatus.PUBLISHED)
+        for i in range(5):
+            Lesson.objects.create(course=course, title=f"Lesson {i}", order=i % 2)
+        queryset = Lesson.objects.for_listing(course)
+        seen = self.collect(paginate_lessons, queryset, 2)
+        self.assertEqual(
+            seen,
+            list(
+                queryset.order_by("order", "-updated", "id").values_list(
+                    "pk", flat=True
+                )
+            ),
+        )
+
+    def test_invalid_cursor_returns_first_page(self):
+        Course.objects.create(title="Only", status=PublishStatus.PUBLISHED)
+        page = paginate_courses(Course.published.all(), cursor="not-a-cursor")
+        self.assertIsNone(page.cursor)
+        self.assertEqual(len(page), 1)
+
+    def test_htmx_load_more_returns_next_cards(self):
+        course = Course.objects.create(title="Paged", status=PublishStatus.PUBLISHED)
+        for i in range(3):
+            Lesson.objects.create(course=course, title=f"Lesson {i}", order=i)
+        url = course.get_absolute_url() + "/"
+        page = paginate_lessons(
+            Lesson.objects.for_listing(course), page_size=1, base_url=url
+        )
+        list(page)
+        response = self.client.get(page.next_url, headers={"HX-Request": "true"})
+        self.assertContains(response, "Lesson 1")
+        self.assertNotContains(response, "Lesson 0")
+        self.assertNotContains(response, "<html>")
+
+    def test_home_teaser_loads_more_only_on_click(self):
+        for i in range(COURSES_PAGE_SIZE * 2 + 1):
+            Course.objects.create(title=f"Course {i}", status=PublishStatus.PUBLISHED)
+        headers = {"HX-Request": "true"}
+        response = self.client.get("/courses/", headers=headers)
+        self.assertContains(response, 'hx-trigger="click, revealed"')
+        teaser = self.client.get("/courses/?teaser=1", headers=headers)
+        self.assertContains(teaser, 'hx-trigger="click"')
+        self.assertNotContains(teaser, "revealed")
+        # 続きのページでもティーザーのままです
+        next_url = teaser.context["queryset"].next_url
+        self.assertIn("teaser=1", next_url)
+        more = self.client.get(next_url, headers=headers)
+        self.assertContains(more, 'hx-trigger="click"')
+        self.assertNotContains(more, "revealed")
+
+    def test_course_page_uses_index_without_sort(self):
+        page = paginate_courses(Course.published.all(), cursor=None)
+        plan = page.queryset.explain()
+        self.assertNotIn("TEMP B-TREE FOR ORDER BY", plan)
+
+
+class LessonDenormalizedFieldsTestCase(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title="Denormalized", status=PublishStatus.PUBLISHED
+        )
+        self.lesson = Lesson.objects.create(course=self.course, title="Lesson")
+
+    def test_lesson_stores_course_fields(self):
+        lesson = Lesson.objects.get(pk=self.lesson.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                lesson.path,
+                f"/courses/{self.course.public_id}/lessons/{lesson.public_id}",
+            )
+            self.assertFalse(lesson.requires_email)
+
+    def test_upload_names_use_stored_course_public_id(self):
+        lesson = Lesson.objects.get(pk=self.lesson.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                get_public_id_prefix(lesson),
+                f"courses/{self.course.public_id}/lessons/{lesson.public_id}",
+            )
+            self.assertEqual(
+                get_display_name(lesson), f"Lesson - {self.course.public_id}"
+            )
+
+    def test_course_save_syncs_lessons(self):
+        self.course.public_id = "renamed"
+        self.course.access = AccessRequirement.EMAIL_REQUIRED
+        self.course.save()
+        lesson = Lesson.objects.get(pk=self.lesson.pk)
+        self.assertEqual(
+            lesson.url_path, f"/courses/renamed/lessons/{lesson.public_id}"
+        )
+        self.assertTrue(lesson.requires_email)
+
+    def test_sync_course_fields_after_bulk_update(self):
+        Course.objects.filter(pk=self.course.pk).update(public_id="bulk")
+        Lesson.objects.filter(course=self.course).sync_course_fields()
+        lesson = Lesson.objects.get(pk=self.lesson.pk)
+        self.assertEqual(lesson.course_public_id, "bulk")
+        self.assertTrue(lesson.url_path.startswith("/courses/bulk/lessons/"))
+
+
+class EmailRequiredSessionWriteTestCase(TestCase):
+    def setUp(self):
+        course = Course.objects.create(
+            title="Gated",
+            status=PublishStatus.PUBLISHED,
+            access=AccessRequirement.EMAIL_REQUIRED,
+        )
+        self.lesson = Lesson.objects.create(course=course, title="Gated Lesson")
+        self.url = self.lesson.path + "/"
+
+    def test_repeat_visit_does_not_rewrite_session(self):
+        self.client.get(self.url)
+        self.assertEqual(self.client.session["next_url"], self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertTemplateUsed(response, "courses/email-required.html")
+
+    @override_settings(EMAIL_ACCESS_COOKIE_ENABLED=True)
+    def test_cookie_mode_creates_no_session(self):
+        response = self.client.get(self.url)
+        self.assertIn("next_url", response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+
+class RequestMetricsMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title="Metrics", status=PublishStatus.PUBLISHED
+        )
+        for i in range(3):
+            Lesson.objects.create(
+                course=self.course,
+                title=f"Lesson {i}",
+                status=PublishStatus.PUBLISHED,
+                order=i,
+            )
+
+    def get_settings(self):
+        templates = [dict(settings.TEMPLATES[0])]
+        templates[0]["BACKEND"] = "helpers.metrics.InstrumentedDjangoTemplates"
+        return override_settings(
+            MIDDLEWARE=["cfehome.middleware.RequestMetricsMiddleware"]
+            + settings.MIDDLEWARE,
+            TEMPLATES=templates,
+        )
+
+    def test_server_timing_and_log(self):
+        with self.get_settings(), self.assertLogs("cfehome.metrics") as logs:
+            response = self.client.get(self.course.path + "/")
+        self.assertIn("Server-Timing", response)
+        self.assertIn("template;dur=", response["Server-Timing"])
+        data = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(data["view"], "courses.views.course_detail_view")
+        self.assertEqual(data["status"], 200)
+        self.assertGreater(data["queries"], 0)
+        self.assertEqual(data["duplicate_queries"], 0)
+        self.assertIn(f'desc="{data["queries"]} queries"', response["Server-Timing"])
+
+    def test_repeated_sql_is_flagged(self):
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics.record_query):
+            for lesson in Lesson.objects.all():
+                Course.objects.get(pk=lesson.course_id)
+        self.assertEqual(metrics.query_count, 4)
+        self.assertEqual(metrics.duplicate_count, 2)
+        self.assertEqual(metrics.get_repeated_sql(threshold=3)[0][1], 3)
+
+
+class SeedCatalogTestCase(TestCase):
+    def test_seed_catalog_fills_denormalized_fields(self):
+        counts = seed_catalog(25, lessons_per_course=10, batch_size=7)
+        self.assertEqual(counts, (3, 25))
+        self.assertEqual(Course.objects.count(), 3)
+        self.assertEqual(Lesson.objects.count(), 25)
+        lesson = Lesson.objects.select_related("course").first()
+        self.assertEqual(lesson.url_path, lesson.get_course_path())
+        self.assertEqual(lesson.course_public_id, lesson.course.public_id)
+
+    def test_benchmark_views_scenarios(self):
+        seed_catalog(30, lessons_per_course=10)
+        command = benchmark_views.Command()
+        command.cold = False
+        results = command.run_scenarios(repeat=2)
+        self.assertEqual(list(results), benchmark_views.SCENARIOS)
+        for stats in results.values():
+            self.assertEqual(stats["count"], 2)
+
+    def test_seed_catalog_command(self):
+        out = StringIO()
+        call_command(
+            "seed_catalog",
+            lessons=50,
+            lessons_per_course=20,
+            emails=5,
+            events_per_email=2,
+            batch_size=8,
+            stdout=out,
+        )
+        self.assertEqual(Course.objects.count(), 3)
+        self.assertEqual(Lesson.objects.count(), 50)
+        self.assertEqual(EmailVerificationEvent.objects.count(), 10)
+        self.assertIn("rows/s", out.getvalue())
+
+
+class CatalogTransferTestCase(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title="Transfer",
+            status=PublishStatus.PUBLISHED,
+            access=AccessRequirement.EMAIL_REQUIRED,
+            image="image/upload/v1/courses/transfer.jpg",
+        )
+        for i in range(3):
+            Lesson.objects.create(course=self.course, title=f"Lesson {i}", order=i)
+
+    def export(self, format_name):
+        serialize = transfer.FORMATS[format_name][0]
+        return "".join(serialize(transfer.iter_catalog_rows()))
+
+    def test_round_trip(self):
+        for format_name in transfer.FORMATS:
+            with self.subTest(format_name=format_name):
+                data = self.export(format_name)
+                Course.objects.all().delete()
+                read = transfer.FORMATS[format_name][1]
+                with self.assertNumQueries(4):
+                    stats = transfer.import_catalog(read(StringIO(data)))
+                self.assertEqual(stats["course_created"], 1)
+                self.assertEqual(stats["lesson_created"], 3)
+                course = Course.objects.get()
+                self.assertEqual(course.public_id, self.course.public_id)
+                self.assertEqual(course.image.public_id, "courses/transfer")
+                lesson = Lesson.objects.get(order=1)
+                self.assertEqual(lesson.url_path, lesson.get_course_path())
+                self.assertTrue(lesson.requires_email)
+                self.assertEqual(self.export(format_name), data)
+
+    def test_memory_is_bounded_to_one_batch(self):
+        rows = [
+            {"model": "course", "public_id": f"batch-{i}", "title": f"Batch {i}"}
+            for i in range(4)
+        ]
+        rows += [
+            {"model": "lesson", "course": "batch-0", "title": f"Late {i}"}
+            for i in range(3)
+        ]
+        importer = transfer.CatalogImporter(batch_size=2)
+        with mock.patch(
+            "courses.transfer.generate_public_id",
+            side_effect=["late-0", "late-0", "late-1", "late-0", "late-2"],
+        ):
+            stats = importer.run(rows)
+        self.assertEqual(stats["course_created"], 4)
+        self.assertEqual(stats["lesson_created"], 3)
+        self.assertLessEqual(len(importer.courses), 2)
+        self.assertLessEqual(len(importer.taken[Lesson]), 2)
+        self.assertEqual(
+            set(
+                Lesson.objects.filter(course__public_id="batch-0").values_list(
+                    "public_id", flat=True
+                )
+            ),
+            {"late-0", "late-1", "late-2"},
+        )
+
+    def test_existing_rows_are_updated(self):
+        rows = list(transfer.iter_catalog_rows())
+        rows[0]["access"] = AccessRequirement.ANYONE
+        rows[1]["title"] = "Renamed"
+        stats = transfer.import_catalog(rows)
+        self.assertEqual(stats["course_updated"], 1)
+        self.assertEqual(stats["lesson_updated"], 1)
+        self.assertEqual(stats["lesson_unchanged"], 2)
+        self.assertEqual(transfer.import_catalog(rows)["lesson_unchanged"], 3)
+        self.assertEqual(Course.objects.count(), 1)
+        lesson = Lesson.objects.get(title="Renamed")
+        self.assertFalse(lesson.requires_email)
+
+    def test_generated_public_id_collisions(self):
+        rows = [{"model": "course", "title": "Same"} for _ in range(3)]
+        rows.append({"model": "lesson", "course": "missing", "title": "Orphan"})
+        with mock.patch(
+            "courses.transfer.generate_public_id",
+            side_effect=[self.course.public_id, "same-1", "same-1", "same-2", "same-3"],
+        ):
+            stats = transfer.import_catalog(rows)
+        self.assertEqual(stats["course_created"], 3)
+        self.assertEqual(stats["skipped"], 1)
+        self.assertEqual(
+            set(Course.objects.values_list("public_id", flat=True)),
+            {self.course.public_id, "same-1", "same-2", "same-3"},
+        )
+
+    def test_media_upload_is_deferred(self):
+        rows = [
+            {
+                "model": "lesson",
+                "course": self.course.public_id,
+                "title": "Remote",
+                "thumbnail": "https://example.com/remote.jpg",
+            }
+        ]
+        importer = transfer.CatalogImporter()
+        importer.run(rows)
+        lesson = Lesson.objects.get(title="Remote")
+        self.assertIsNone(lesson.thumbnail)
+        self.assertEqual(
+            importer.pending_media,
+            [(Lesson, lesson.pk, "thumbnail", rows[0]["thumbnail"])],
+        )
+        resource = CloudinaryResource(
+            "lessons/remote",
+            version="2",
+            format="jpg",
+            type="upload",
+            resource_type="image",
+        )
+        with mock.patch(
+            "courses.transfer.uploader.upload_resource", return_value=resource
+        ) as upload:
+            self.assertEqual(importer.upload_media(), 1)
+        self.assertEqual(upload.call_args.args[0], rows[0]["thumbnail"])
+        options = upload.call_args.kwargs
+        self.assertEqual(options["public_id_prefix"], lesson.url_path[1:])
+        lesson = Lesson.objects.get(pk=lesson.pk)
+        self.assertEqual(lesson.thumbnail.public_id, "lessons/remote")
+
+    def test_skip_media_ignores_media_columns(self):
+        rows = list(transfer.iter_catalog_rows())
+        rows[0]["image"] = "https://example.com/new.jpg"
+        rows[1]["thumbnail"] = "https://example.com/remote.jpg"
+        rows.append(
+            {
+                "model": "lesson",
+                "course": self.course.public_id,
+                "title": "New",
+                "video": "video/upload/v1/lessons/new.mp4",
+            }
+        )
+        with mock.patch("courses.transfer.uploader.upload_resource") as upload:
+            stats = transfer.import_catalog(rows, skip_media=True)
+        upload.assert_not_called()
+        self.assertEqual(stats["media_skipped"], 3)
+        self.assertEqual(stats["course_unchanged"], 1)
+        self.assertEqual(stats["lesson_unchanged"], 3)
+        course = Course.objects.get()
+        self.assertEqual(course.image.public_id, "courses/transfer")
+        self.assertIsNone(Lesson.objects.get(title="New").video)
+
+    def test_commands(self):
+        path = Path(self.enterContext(tempfile.TemporaryDirectory())) / "catalog.csv"
+        call_command("export_catalog", output=str(path))
+        Course.objects.all().delete()
+        out = StringIO()
+        call_command("import_catalog", str(path), stdout=out)
+        self.assertEqual(Lesson.objects.count(), 3)
+        self.assertIn("lesson_created", out.getvalue())
+
+    def test_admin_import_view(self):
+        user = User.objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(user)
+        response = self.client.get("/admin/courses/course/")
+        self.assertContains(response, "/admin/courses/course/import/")
+        data = "".join(transfer.iter_csv(transfer.iter_catalog_rows()))
+        Course.objects.all().delete()
+        response = self.client.post(
+            "/admin/courses/course/import/",
+            {
+                "file": SimpleUploadedFile("catalog.csv", data.encode("utf-8")),
+                "skip_media": "on",
+            },
+        )
+        self.assertRedirects(response, "/admin/courses/course/")
+        self.assertEqual(Lesson.objects.count(), 3)
+        self.assertIsNone(Course.objects.get().image)
+        response = self.client.post(
+            "/admin/courses/course/import/",
+            {"file": SimpleUploadedFile("catalog.txt", b"model")},
+        )
+        self.assertContains(response, "Unknown format: txt")
+
+    def test_admin_export_action(self):
+        user = User.objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(user)
+        response = self.client.post(
+            "/admin/courses/course/",
+            {"action": "export_csv", "_selected_action": [self.course.pk]},
+        )
+        self.assertTrue(response.streaming)
+        rows = list(transfer.read_csv(StringIO(response.getvalue().decode())))
+        self.assertEqual([row["model"] for row in rows], ["course"] + ["lesson"] * 3)
+
+
+class CatalogExportViewTestCase(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title="Partner",
+            status=PublishStatus.PUBLISHED,
+            image="image/upload/v1/courses/partner.jpg",
+        )
+        Course.objects.create(title="Draft", status=PublishStatus.DRAFT)
+        for i in range(3):
+            Lesson.objects.create(course=self.course, title=f"Lesson {i}", order=i)
+        Lesson.objects.create(
+            course=self.course, title="Hidden", status=PublishStatus.DRAFT
+        )
+
+    def test_streams_published_catalog(self):
+        response = self.client.get("/courses/export.ndjson")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        build_url = mock.patch.object(
+            CloudinaryResource,
+            "build_url",
+            autospec=True,
+            side_effect=lambda resource, **options: f"https://cdn/{resource.public_id}",
+        )
+        image_url_cache.local.clear()
+        cache.clear()
+        # 予約されたフィルターの作り直しが request_finished で実行されないようにします
+        load_known_public_ids()
+        with build_url, self.assertNumQueries(2):
+            lines = list(response.streaming_content)
+        self.assertEqual(len(image_url_cache.local._data), 0)
+        self.assertFalse(any(key.startswith(":1:cloudinary:") for key in cache._cache))
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row["model"] for row in rows], ["course"] + ["lesson"] * 3)
+        self.assertIn("courses/partner", rows[0]["thumbnail"])
+        self.assertEqual(rows[1]["course"], self.course.public_id)
+        self.assertEqual(rows[1]["path"], Lesson.objects.get(title="Lesson 0").path)
+
+
+@override_settings(ADMIN_LESSONS_PER_PAGE=20)
+class CourseAdminPerformanceTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(user)
+        self.course = Course.objects.create(
+            title="Big", status=PublishStatus.PUBLISHED
+        )
+        seed_catalog(5, lessons_per_course=5)
+        Lesson.objects.bulk_create(
+            [
+                Lesson(course=self.course, title=f"Lesson {i}", order=i)
+                for i in range(45)
+            ]
+        )
+        self.url = f"/admin/courses/course/{self.course.pk}/change/"
+
+    def test_inline_is_paginated(self):
+        response = self.client.get(self.url)
+        formset = response.context["inline_admin_formsets"][0].formset
+        self.assertEqual(formset.total_form_count(), 20)
+        self.assertContains(response, "45 lessons")
+        response = self.client.get(self.url + "?lessons_page=3")
+        formset = response.context["inline_admin_formsets"][0].formset
+        self.assertEqual(formset.total_form_count(), 5)
+        self.assertNotContains(response, "<video")
+
+    def test_save_only_touches_current_page(self):
+        response = self.client.get(self.url + "?lessons_page=2")
+        formset = response.context["inline_admin_formsets"][0].formset
+        data = {
+            "title": "Big",
+            "status": PublishStatus.PUBLISHED,
+            "access": AccessRequirement.ANYONE,
+            "lesson_set-TOTAL_FORMS": 20,
+            "lesson_set-INITIAL_FORMS": 20,
+            "lesson_set-MIN_NUM_FORMS": 0,
+            "lesson_set-MAX_NUM_FORMS": 1000,
+        }
+        for i, form in enumerate(formset.forms):
+            lesson = form.instance
+            data.update(
+                {
+                    f"lesson_set-{i}-id": lesson.pk,
+                    f"lesson_set-{i}-course": self.course.pk,
+                    f"lesson_set-{i}-title": f"{lesson.title} edited",
+                    f"lesson_set-{i}-order": lesson.order,
+                    f"lesson_set-{i}-status": lesson.status,
+                }
+            )
+        Course.objects.filter(pk=self.course.pk).update(image="image/upload/v1/big.jpg")
+        with mock.patch.object(
+            CloudinaryResource, "build_url", return_value="https://cdn/big.jpg"
+        ):
+            response = self.client.post(self.url + "?lessons_page=2", data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Lesson.objects.filter(title__endswith="edited").count(), 20)
+        lesson = Lesson.objects.get(order=25, course=self.course)
+        self.assertEqual(lesson.title, "Lesson 25 edited")
+
+    def test_lesson_preview_view(self):
+        lesson = Lesson.objects.filter(course=self.course).first()
+        url = f"/admin/courses/course/{self.course.pk}/lessons/{lesson.pk}/preview/"
+        response = self.client.get(url)
+        self.assertContains(response, "No media")
+        other = Lesson.objects.exclude(course=self.course).first()
+        url = f"/admin/courses/course/{self.course.pk}/lessons/{other.pk}/preview/"
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_changelists(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/admin/courses/course/")
+        course = response.context["cl"].result_list.get(pk=self.course.pk)
+        self.assertEqual(course.lesson_count, 45)
+        sql = ctx.captured_queries[-1]["sql"]
+        self.assertIn('AS "lesson_count" FROM "courses_course"', sql)
+        response = self.client.get(
+            f"/admin/courses/lesson/?course__id__exact={self.course.pk}"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["cl"].result_list), 45)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title="Conditional Course", status=PublishStatus.PUBLISHED
+        )
+        self.lesson = Lesson.objects.create(course=self.course, title="First Lesson")
+        self.url = self.course.path + "/"
+
+    def assertNotModified(self, url, response, **headers):
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"], **headers)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.templates, [])
+        return cached
+
+    def test_detail_returns_304_with_one_query(self):
+        response = self.client.get(self.url)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-cache", response["Cache-Control"])
+        with self.assertNumQueries(1):
+            self.assertNotModified(self.url, response)
+        cached = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(cached.status_code, 304)
+
+    def test_lesson_changes_invalidate_detail(self):
+        response = self.client.get(self.url)
+        Lesson.objects.create(course=self.course, title="Second Lesson")
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertContains(changed, "Second Lesson")
+        self.lesson.delete()
+        deleted = self.client.get(self.url, HTTP_IF_NONE_MATCH=changed["ETag"])
+        self.assertEqual(deleted.status_code, 200)
+        self.assertNotEqual(deleted["ETag"], changed["ETag"])
+
+    def test_list_and_lesson_return_304(self):
+        for url in ["/courses/", self.lesson.path + "/"]:
+            self.assertNotModified(url, self.client.get(url))
+        response = self.client.get("/courses/")
+        Course.objects.create(title="New Course", status=PublishStatus.PUBLISHED)
+        changed = self.client.get("/courses/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertContains(changed, "New Course")
+
+    def test_video_lesson_304_skips_embed(self):
+        lesson = Lesson.objects.create(
+            course=self.course, title="Video Lesson", video="video/private/v1/clip.mp4"
+        )
+        url = lesson.path + "/"
+        with mock.patch.object(
+            CloudinaryResource, "build_url", return_value="https://cdn/clip.mp4"
+        ) as build_url:
+            response = self.client.get(url)
+            self.assertContains(response, "https://cdn/clip.mp4")
+            build_url.reset_mock()
+            video_url_cache.local.clear()
+            cache.clear()
+            self.assertNotModified(url, response)
+        build_url.assert_not_called()
+
+    def test_etag_varies_on_email_access_and_htmx(self):
+        response = self.client.get(self.url)
+        hx = self.client.get(self.url, HTTP_HX_REQUEST="true")
+        self.assertNotEqual(hx["ETag"], response["ETag"])
+        session = self.client.session
+        session["email_id"] = "1"
+        session.save()
+        verified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(verified.status_code, 200)
+
+
+class NegativeCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # public_id を固定し、フィルターの内容 (偽陽性の有無) を実行ごとに変えないようにします
+        self.course = Course.objects.create(
+            title="Known Course",
+            public_id="known-course",
+            status=PublishStatus.PUBLISHED,
+        )
+        self.lesson = Lesson.objects.create(
+            course=self.course, title="Known Lesson", public_id="known-lesson"
+        )
+        load_known_public_ids()
+
+    def test_unknown_slugs_skip_database(self):
+        self.assertNotIn("unknown-course", known_courses)
+        self.assertNotIn("unknown-lesson", known_lessons)
+        with self.assertNumQueries(0):
+            response = self.client.get("/courses/unknown-course/")
+        self.assertEqual(response.status_code, 404)
+        with self.assertNumQueries(0):
+            response = self.client.get(f"{self.course.path}/lessons/unknown-lesson/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_missing_result_is_cached_until_catalog_changes(self):
+        draft = Course.objects.create(title="Draft Course")
+        load_known_public_ids()
+        url = draft.path + "/"
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        draft.status = PublishStatus.PUBLISHED
+        draft.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_saved_slugs_are_found_without_rebuild(self):
+        course = Course.objects.create(title="New Course", status=PublishStatus.PUBLISHED)
+        lesson = Lesson.objects.create(course=course, title="New Lesson")
+        self.assertFalse(known_courses.is_stale())
+        self.assertEqual(self.client.get(course.path + "/").status_code, 200)
+        self.assertEqual(self.client.get(lesson.path + "/").status_code, 200)
+
+    def test_publishing_course_makes_its_lessons_known(self):
+        draft = Course.objects.create(title="Draft", public_id="draft-course")
+        lesson = Lesson.objects.create(
+            course=draft, title="Waiting", public_id="waiting-lesson"
+        )
+        # 下書きのレッスンを含まないフィルターをデータベースから作り直します
+        cache.clear()
+        load_known_public_ids()
+        self.assertNotIn("waiting-lesson", known_lessons)
+        draft.status = PublishStatus.PUBLISHED
+        draft.save()
+        self.assertFalse(known_lessons.is_stale())
+        self.assertEqual(self.client.get(draft.path + "/").status_code, 200)
+        self.assertEqual(self.client.get(lesson.path + "/").status_code, 200)
+
+    def test_stale_filter_is_rebuilt_after_the_request(self):
+        cache.clear()
+        with self.assertNumQueries(0):
+            self.assertIn("unknown-course", known_courses)
+        self.assertTrue(known_courses.needs_build)
+        # データベースで確認した後、レスポンスの送信後 (request_finished) にフィルターを作り直します
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/courses/unknown-course/")
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("unknown-course", queries[0]["sql"])
+        self.assertEqual(len(queries), 3)
+        self.assertFalse(known_courses.needs_build)
+        self.assertNotIn("unknown-course", known_courses)
+
+    def test_warm_up_ignores_missing_tables(self):
+        with mock.patch.object(
+            KnownPublicIds, "build", side_effect=DatabaseError("no such table")
+        ):
+            cache.clear()
+            warm_up_known_public_ids()
+        warm_up_known_public_ids()
+        self.assertFalse(known_courses.is_stale())
+
+    def test_rebuilds_after_cache_is_cleared(self):
+        cache.clear()
+        course = Course.objects.create(title="After Clear", status=PublishStatus.PUBLISHED)
+        self.assertTrue(known_courses.is_stale())
+        self.assertEqual(self.client.get(course.path + "/").status_code, 200)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        known_ids = KnownPublicIds(
+            lambda: Course.objects.order_by(), refresh=0
+        )
+        known_ids.build()
+        self.assertIn(self.course.public_id, known_ids.bloom)
+        self.assertTrue(known_ids.is_stale())
+
+    def test_async_lookups_use_negative_cache(self):
+        draft = Course.objects.create(title="Async Draft", public_id="async-draft")
+        load_known_public_ids()
+        self.assertIsNone(async_to_sync(services.aget_course_detail)(draft.public_id))
+        with self.assertNumQueries(0):
+            self.assertIsNone(
+                async_to_sync(services.aget_course_detail)(draft.public_id)
+            )
+            self.assertIsNone(
+                async_to_sync(services.aget_lesson_detail)(
+                    self.course.public_id, "unknown-lesson"
+                )
+            )
+
+    def test_small_bloom_filter_keeps_error_rate(self):
+        bloom = BloomFilter.from_values(["only-course"])
+        self.assertGreaterEqual(bloom.size, 64)
+        self.assertLess(bloom.hash_count, bloom.size // 4)
+        unknown = [f"unknown-{i}" for i in range(2000)]
+        false_positives = sum(value in bloom for value in unknown)
+        self.assertLess(false_positives, len(unknown) * 0.01)
+
+
+@override_settings(ROOT_URLCONF="cfehome.async_urls")
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title="Async Course",
+            status=PublishStatus.PUBLISHED,
+            access=AccessRequirement.EMAIL_REQUIRED,
+        )
+        for i in range(3):
+            Lesson.objects.create(course=self.course, title=f"Async {i}", order=i)
+        self.lesson = Lesson.objects.filter(course=self.course).first()
+
+    def count_queries(self, url):
+        cache.clear()
+        load_known_public_ids()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    async def test_course_pages_render(self):
+        response = await self.async_client.get("/courses/")
+        self.assertContains(response, "Async Course")
+        response = await self.async_client.get(self.course.path + "/")
+        self.assertContains(response, "/lessons/", count=6)
+        response = await self.async_client.get("/courses/missing/")
+        self.assertEqual(response.status_code, 404)
+
+    async def test_video_lesson_304_skips_embed(self):
+        course = await Course.objects.acreate(
+            title="Open Course", status=PublishStatus.PUBLISHED
+        )
+        lesson = await Lesson.objects.acreate(
+            course=course, title="Async Video", video="video/private/v1/clip.mp4"
+        )
+        url = lesson.path + "/"
+        with mock.patch.object(
+            CloudinaryResource, "build_url", return_value="https://cdn/clip.mp4"
+        ) as build_url:
+            response = await self.async_client.get(url)
+            self.assertContains(response, "https://cdn/clip.mp4")
+            build_url.reset_mock()
+            video_url_cache.local.clear()
+            await cache.aclear()
+            cached = await self.async_client.get(
+                url, headers={"if-none-match": response["ETag"]}
+            )
+        self.assertEqual(cached.status_code, 304)
+        build_url.assert_not_called()
+
+    async def test_export_streams_from_async_iterator(self):
+        response = await self.async_client.get("/courses/export.ndjson")
+        self.assertTrue(response.is_async)
+        rows = [json.loads(line) async for line in response.streaming_content]
+        self.assertEqual([row["model"] for row in rows], ["course"] + ["lesson"] * 3)
+        self.assertTrue(rows[0]["requires_email"])
+
+    def test_same_query_count_as_sync_views(self):
+        for url in ["/courses/", self.course.path + "/"]:
+            sync_queries = self.count_queries(url)
+            with self.settings(ROOT_URLCONF="cfehome.urls"):
+                self.assertEqual(self.count_queries(url), sync_queries)
+
+    async def test_email_gate_and_verification(self):
+        url = self.lesson.path + "/"
+        response = await self.async_client.get(url)
+        self.assertTemplateUsed(response, "courses/email-required.html")
+        verify_obj, _ = await sync_to_async(emails_services.start_verification_event)(
+            "async@example.com"
+        )
+        response = await self.async_client.get(f"/verify/{verify_obj.token}/")
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        response = await self.async_client.get(url)
+        self.assertTemplateUsed(response, "courses/lesson-coming-soon.html")
@@ -0,0 +1,529 @@
+import csv
+import json
+from collections import Counter
+
+from cloudinary import uploader
+from django.utils import timezone
+
+from helpers.batches import batched
+
+from .cache import bump_catalog_version
+from .models import AccessRequirement, Course, Lesson, generate_public_id
+
+COURSE_FIELDS = ["public_id", "title", "description", "access", "status", "image"]
+LESSON_FIELDS = [
+    "public_id",
+    "title",
+    "description",
+    "order",
+    "preview",
+    "can_preview",
+    "status",
+    "thumbnail",
+    "video",
+]
+CSV_FIELDS = [
+    "model",
+    "public_id",
+    "course",
+    "title",
+    "description",
+    "access",
+    "status",
+    "order",
+    "preview",
+    "can_preview",
+    "image",
+    "thumbnail",
+    "video",
+]
+# bulk_update は行数に比例した CASE 式を生成するため、小さいバッチで更新します
+UPDATE_BATCH_SIZE = 100
+MEDIA_FIELDS = {
+    Course: ["image"],
+    Lesson: ["thumbnail", "video"],
+}
+# 画像とプレースホルダーの列 (画像が変わった場合はプレースホルダーを削除します)
+PLACEHOLDER_FIELDS = {
+    Course: {"image": "image_placeholder"},
+    Lesson: {"thumbnail": "thumbnail_placeholder"},
+}
+
+
+def iter_catalog_rows(courses=None, chunk_size=2000):
+    """
+    コースとレッスンを1行ずつの辞書として返すジェネレーター。
+
+    先にすべてのコースを返し、その後にレッスンをコース順に返します。
+    `.values().iterator()` で読み込むため、件数に関係なくメモリ使用量は一定です。
+    Cloudinary のフィールドはデータベースに保存されている文字列のまま出力します。
+
+    Args:
+        courses: 出力する Course のクエリセット (省略時はすべてのコース)
+        chunk_size: データベースから一度に読み込む行数
+
+    Yields:
+        dict: "model" キーに "course" または "lesson" を持つ行
+    """
+    if courses is None:
+        courses = Course.objects.all()
+    image_field = Course._meta.get_field("image")
+    rows = courses.order_by("id").values(*COURSE_FIELDS)
+    for row in rows.iterator(chunk_size=chunk_size):
+        row["image"] = image_field.get_prep_value(row["image"])
+        yield {"model": "course", **row}
+    lessons = (
+        Lesson.objects.filter(course__in=courses)
+        .order_by("course_id", "order", "id")
+        .values("course_public_id", *LESSON_FIELDS)
+    )
+    for row in lessons.iterator(chunk_size=chunk_size):
+        for name in MEDIA_FIELDS[Lesson]:
+            row[name] = Lesson._meta.get_field(name).get_prep_value(row[name])
+        yield {"model": "lesson", "course": row.pop("course_public_id"), **row}
+
+
+def iter_published_catalog(chunk_size=2000):
+    """
+    公開済みのコースとレッスンを、パートナー向けの1行ずつの辞書として返すジェネレーター。
+
+    iter_catalog_rows と同様に `.values().iterator()` で読み込み、
+    サムネイルは Cloudinary の URL (get_thumbnail と同じ変換) で出力します。
+    URL の生成に必要なフィールドだけを持つインスタンスを作るため、追加のクエリは発生しません。
+    一度しか使わない URL で表示用の URL キャッシュを追い出さないよう、URL はキャッシュせずに生成します。
+
+    Args:
+        chunk_size: データベースから一度に読み込む行数
+
+    Yields:
+        dict: "model" キーに "course" または "lesson" を持つ行
+    """
+    for row in get_published_course_values().iterator(chunk_size=chunk_size):
+        yield get_published_course_row(row)
+    for row in get_published_lesson_values().iterator(chunk_size=chunk_size):
+        yield get_published_lesson_row(row)
+
+
+async def aiter_published_catalog(chunk_size=2000):
+    """
+    `iter_published_catalog` の非同期版です。`.aiterator()` で少しずつ読み込みます。
+
+    ASGI では同期イテレーターのストリーミングレスポンスは最初にすべて読み込まれてしまうため、
+    非同期ビューではこちらを使います。
+    """
+    async for row in get_published_course_values().aiterator(chunk_size=chunk_size):
+        yield get_published_course_row(row)
+    async for row in get_published_lesson_values().aiterator(chunk_size=chunk_size):
+        yield get_published_lesson_row(row)
+
+
+def get_published_course_values():
+    return Course.published.values(
+        "id", "public_id", "title", "description", "access", "image", "updated"
+    )
+
+
+def get_published_lesson_values():
+    return (
+        Lesson.objects.published()
+        .order_by("course_id", "order", "id")
+        .values(
+            "id",
+            "course_public_id",
+            "public_id",
+            "title",
+            "description",
+            "order",
+            "status",
+            "url_path",
+            "thumbnail",
+            "video",
+            "updated",
+        )
+    )
+
+
+def get_published_course_row(row):
+    course = Course(id=row["id"], image=row["image"], updated=row["updated"])
+    return {
+        "model": "course",
+        "public_id": row["public_id"],
+        "title": row["title"],
+        "description": row["description"],
+        "path": f"/courses/{row['public_id']}",
+        "requires_email": row["access"] == AccessRequirement.EMAIL_REQUIRED,
+        "thumbnail": course.get_thumbnail(cache=False),
+        "updated": row["updated"].isoformat(),
+    }
+
+
+def get_published_lesson_row(row):
+    lesson = Lesson(
+        id=row["id"],
+        thumbnail=row["thumbnail"],
+        video=row["video"],
+        updated=row["updated"],
+    )
+    return {
+        "model": "lesson",
+        "course": row["course_public_id"],
+        "public_id": row["public_id"],
+        "title": row["title"],
+        "description": row["description"],
+        "order": row["order"],
+        "status": row["status"],
+        "path": row["url_path"],
+        "thumbnail": lesson.get_thumbnail(cache=False),
+        "updated": row["updated"].isoformat(),
+    }
+
+
+class Echo:
+    """
+    書き込まれた値をそのまま返す疑似ファイル (csv.writer を1行ずつ使うため)。
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+async def aiter_jsonl(rows):
+    async for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def iter_csv(rows):
+    writer = csv.DictWriter(Echo(), fieldnames=CSV_FIELDS, extrasaction="ignore")
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def read_jsonl(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(lines):
+    for row in csv.DictReader(lines):
+        yield {key: value for key, value in row.items() if value != ""}
+
+
+FORMATS = {
+    "jsonl": (iter_jsonl, read_jsonl, "application/x-ndjson"),
+    "csv": (iter_csv, read_csv, "text/csv"),
+}
+
+
+def is_media_source(value):
+    return isinstance(value, str) and value.startswith(("http://", "https://"))
+
+
+class CatalogImporter:
+    """
+    iter_catalog_rows と同じ形式の行をストリームで読み込み、
+    Course と Lesson を batch_size 行ずつ bulk_create / bulk_update します。
+
+    - public_id が既存の行と一致する場合は値が変わったものだけ更新し、それ以外は作成します。
+      レッスンの public_id はコースごとに照合します。
+    - public_id がない行には Course.save と同じ方式で public_id を生成し、
+      同じバッチ内やデータベースの public_id と衝突した場合は再生成します。
+    - lesson 行の course 列はコースの public_id です。
+      見つからないコースのレッスンはスキップされます。
+    - メモリに保持するのは現在のバッチのコースと public_id だけです。
+      前のバッチで作成したコースや public_id はデータベースで照合するため、
+      メモリ使用量は行数ではなく batch_size に比例します
+      (URL のアップロード待ちの (モデル, pk, 列, URL) だけは件数分保持します)。
+    - Cloudinary のフィールドに http(s) の URL が指定された場合はアップロードせずに記録し、
+      `upload_media()` でデータベースへの書き込みが終わった後にまとめてアップロードします。
+    - skip_media=True の場合は画像・動画の列 (MEDIA_FIELDS) を無視します。
+      URL も保存済みの Cloudinary の値も読み込まないため、既存の行の画像・動画は変更されず、
+      新しい行は画像・動画なしで作成されます。無視した値の数は `media_skipped` に記録されます。
+    """
+
+    def __init__(self, batch_size=1000, skip_media=False):
+        self.batch_size = batch_size
+        self.skip_media = skip_media
+        self.courses = {}
+        self.taken = {Course: set(), Lesson: set()}
+        self.pending_media = []
+        self.stats = Counter()
+
+    def run(self, rows):
+        """
+        Returns:
+            Counter: 作成・更新・スキップした行の数
+        """
+        for batch in batched(rows, self.batch_size):
+            self.courses = {}
+            self.taken = {Course: set(), Lesson: set()}
+            course_rows = [row for row in batch if row.get("model") == "course"]
+            lesson_rows = [row for row in batch if row.get("model") == "lesson"]
+            self.stats["skipped"] += len(batch) - len(course_rows) - len(lesson_rows)
+            if course_rows:
+                self.import_courses(course_rows)
+            if lesson_rows:
+                self.import_lessons(lesson_rows)
+            # bulk_create はシグナルを送信しないため、バッチごとにキャッシュと public_id のフィルターを無効化します
+            bump_catalog_version()
+        return self.stats
+
+    def clean(self, model, row, field_names):
+        values = {}
+        media = {}
+        for name in field_names:
+            if name not in row:
+                continue
+            field = model._meta.get_field(name)
+            value = row[name]
+            if value is None or value == "":
+                value = None if field.null else field.get_default()
+            elif name in MEDIA_FIELDS[model]:
+                if is_media_source(value):
+                    media[name] = value
+                    continue
+            else:
+                value = field.to_python(value)
+            values[name] = value
+        return values, media
+
+    def generate_public_ids(self, model, objs):
+        """
+        public_id のないインスタンスに、使用済みの値と重複しない public_id を設定します。
+        """
+        pending = [obj for obj in objs if not obj.public_id]
+        while pending:
+            for obj in pending:
+                public_id = generate_public_id(obj)
+                while public_id in self.taken[model]:
+                    public_id = generate_public_id(obj)
+                obj.public_id = public_id
+                self.taken[model].add(public_id)
+            collisions = set(
+                model.objects.filter(
+                    public_id__in=[obj.public_id for obj in pending]
+                ).values_list("public_id", flat=True)
+            )
+            pending = [obj for obj in pending if obj.public_id in collisions]
+
+    def get_key(self, model, row, values):
+        """
+        既存の行と照合するキーを返します。public_id がない行は None です。
+
+        レッスンの public_id はコースごとに一意なので、(コースの pk, public_id) を使います。
+        """
+        public_id = values.get("public_id")
+        if not public_id:
+            return None
+        if model is Lesson:
+            return (self.courses[row["course"]][0], public_id)
+        return public_id
+
+    def get_existing(self, model, keys):
+        if not keys:
+            return {}
+        if model is Lesson:
+            qs = Lesson.objects.filter(
+                course_id__in={course_id for course_id, _ in keys},
+                public_id__in={public_id for _, public_id in keys},
+            )
+            objs = {(obj.course_id, obj.public_id): obj for obj in qs.order_by()}
+            return {key: objs[key] for key in keys if key in objs}
+        qs = model.objects.filter(public_id__in=keys)
+        return {obj.public_id: obj for obj in qs.order_by()}
+
+    def get_state(self, obj, field_names):
+        return [obj._meta.get_field(name).value_to_string(obj) for name in field_names]
+
+    def get_update_fields(self, model, field_names):
+        update_fields = [name for name in field_names if name != "public_id"]
+        update_fields += [
+            placeholder
+            for name, placeholder in PLACEHOLDER_FIELDS[model].items()
+            if name in field_names
+        ]
+        if model is Lesson:
+            update_fields += ["course", "course_public_id", "course_access", "url_path"]
+        return update_fields
+
+    def upsert(self, model, rows, field_names, prepare=None):
+        """
+        行を作成または更新し、(作成したインスタンス, 既存のインスタンス, 更新したインスタンス)
+        を返します。
+
+        既存の行は値が変わった場合だけ bulk_update します。
+        prepare は public_id が確定した後、保存前に (インスタンス, 行) で呼び出されます。
+        """
+        if self.skip_media:
+            media_fields = MEDIA_FIELDS[model]
+            self.stats["media_skipped"] += sum(
+                1 for row in rows for name in media_fields if row.get(name)
+            )
+            field_names = [name for name in field_names if name not in media_fields]
+        cleaned = []
+        for row in rows:
+            values, media_values = self.clean(model, row, field_names)
+            key = self.get_key(model, row, values)
+            cleaned.append((row, values, media_values, key))
+        existing = self.get_existing(
+            model, [key for *_, key in cleaned if key is not None]
+        )
+        update_fields = self.get_update_fields(model, field_names)
+        states = {
+            obj.pk: self.get_state(obj, update_fields) for obj in existing.values()
+        }
+        created = {}
+        new_objs = []
+        pairs = []
+        media = []
+        for row, values, media_values, key in cleaned:
+            obj = existing.get(key) or created.get(key)
+            if obj is None:
+                obj = model(**values)
+                new_objs.append(obj)
+                if key is not None:
+                    created[key] = obj
+                    self.taken[model].add(values["public_id"])
+            else:
+                for name, value in values.items():
+                    setattr(obj, name, value)
+            pairs.append((obj, row))
+            media.extend((obj, name, source) for name, source in media_values.items())
+        self.generate_public_ids(model, new_objs)
+        if prepare is not None:
+            for obj, row in pairs:
+                prepare(obj, row)
+        model.objects.bulk_create(new_objs)
+        changed = []
+        changed_fields = set()
+        for obj in existing.values():
+            state = self.get_state(obj, update_fields)
+            diff = {
+                name
+                for name, old, new in zip(update_fields, states[obj.pk], state)
+                if old != new
+            }
+            for name, placeholder in PLACEHOLDER_FIELDS[model].items():
+                if name in diff and getattr(obj, placeholder) is not None:
+                    setattr(obj, placeholder, None)
+                    diff.add(placeholder)
+            if diff:
+                changed.append(obj)
+                changed_fields |= diff
+        if changed:
+            now = timezone.now()
+            for obj in changed:
+                obj.updated = now
+            # 変更された列だけを更新します (bulk_update のコストは列数に比例します)
+            model.objects.bulk_update(
+                changed,
+                [name for name in update_fields if name in changed_fields]
+                + ["updated"],
+                batch_size=UPDATE_BATCH_SIZE,
+            )
+        self.pending_media.extend(
+            (model, obj.pk, name, source) for obj, name, source in media
+        )
+        name = model._meta.model_name
+        self.stats[f"{name}_created"] += len(new_objs)
+        self.stats[f"{name}_updated"] += len(changed)
+        self.stats[f"{name}_unchanged"] += len(existing) - len(changed)
+        return new_objs, list(existing.values()), changed
+
+    def import_courses(self, rows):
+        created, existing, changed = self.upsert(Course, rows, COURSE_FIELDS)
+        for course in created + existing:
+            self.courses[course.public_id] = (course.pk, course.access)
+        if changed:
+            Lesson.objects.filter(course__in=changed).sync_course_fields()
+
+    def import_lessons(self, rows):
+        missing = {row.get("course") for row in rows} - set(self.courses)
+        missing.discard(None)
+        if missing:
+            for public_id, pk, access in Course.objects.filter(
+                public_id__in=missing
+            ).values_list("public_id", "pk", "access"):
+                self.courses[public_id] = (pk, access)
+        known = [row for row in rows if row.get("course") in self.courses]
+        self.stats["skipped"] += len(rows) - len(known)
+        if known:
+            self.upsert(Lesson, known, LESSON_FIELDS, prepare=self.prepare_lesson)
+
+    def prepare_lesson(self, lesson, row):
+        """
+        レッスンに親コースと、非正規化したコースの public_id、access、path を設定します。
+        """
+        course_public_id = row["course"]
+        lesson.course_id, lesson.course_access = self.courses[course_public_id]
+        lesson.course_public_id = course_public_id
+        lesson.url_path = f"/courses/{course_public_id}/lessons/{lesson.public_id}"
+
+    def upload_media(self):
+        """
+        インポート中に記録した URL を Cloudinary にアップロードし、フィールドを更新します。
+
+        CloudinaryField.pre_save と同じアップロードオプション (public_id_prefix など) を使います。
+
+        Returns:
+            int: アップロードしたファイルの数
+        """
+        uploaded = 0
+        for batch in batched(self.pending_media, self.batch_size):
+            for model in MEDIA_FIELDS:
+                items = [item for item in batch if item[0] is model]
+                if not items:
+                    continue
+                queryset = model.objects.all()
+                if model is Lesson:
+                    queryset = queryset.select_related("course")
+                objs = queryset.in_bulk([pk for _, pk, _, _ in items])
+                changed = {}
+                names = set()
+                for _, pk, name, source in items:
+                    obj = objs[pk]
+                    field = model._meta.get_field(name)
+                    options = {"type": field.type, "resource_type": field.resource_type}
+                    options.update(
+                        {
+                            key: value(obj) if callable(value) else value
+                            for key, value in field.options.items()
+                        }
+                    )
+                    setattr(obj, name, uploader.upload_resource(source, **options))
+                    obj.updated = timezone.now()
+                    changed[pk] = obj
+                    names.add(name)
+                    placeholder = PLACEHOLDER_FIELDS[model].get(name)
+                    if placeholder is not None:
+                        setattr(obj, placeholder, None)
+                        names.add(placeholder)
+                model.objects.bulk_update(list(changed.values()), [*names, "updated"])
+                uploaded += len(items)
+        self.pending_media = []
+        return uploaded
+
+
+def import_catalog(rows, batch_size=1000, skip_media=False):
+    """
+    行をインポートし、その後に Cloudinary へのアップロードを行います。
+
+    skip_media=True の場合は画像・動画の列を無視します (CatalogImporter を参照)。
+    後から画像・動画だけを反映する場合は、同じファイルを skip_media なしでもう一度インポートしてください
+    (public_id が一致する行は変更された列だけが更新されます。public_id のない行は新しく作成されます)。
+
+    Returns:
+        Counter: 作成・更新・スキップした行とアップロード (または無視) したファイルの数
+    """
+    importer = CatalogImporter(batch_size=batch_size, skip_media=skip_media)
+    stats = importer.run(rows)
+    if importer.pending_media:
+        stats["media_uploaded"] = importer.upload_media()
+    return stats
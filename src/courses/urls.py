@@ -4,6 +4,7 @@ from . import views
 
 
 urlpatterns = [
+    path("export.ndjson", views.course_catalog_export_view),
     path("<slug:course_id>/lessons/<slug:lesson_id>/", views.lesson_detail_view),
     path("<slug:course_id>/", views.course_detail_view),
     path("", views.course_list_view),
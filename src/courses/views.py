@@ -1,33 +1,126 @@
+from django.core.cache import cache
 from django.shortcuts import render, redirect
-from django.http import Http404, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.views.decorators.vary import vary_on_headers
+from emails.access import (
+    aget_email_id,
+    aremember_next_url,
+    get_email_id,
+    remember_next_url,
+)
 from . import services
+from .conditional import (
+    get_last_modified,
+    get_not_modified_response,
+    get_page_validators,
+    set_page_validators,
+)
+from .cache import (
+    COURSES_CACHE_TIMEOUT,
+    aget_cache_context,
+    aget_cache_key,
+    get_cache_context,
+    get_cache_key,
+)
+from .pagination import paginate_courses, paginate_lessons
+from .transfer import (
+    aiter_jsonl,
+    aiter_published_catalog,
+    iter_jsonl,
+    iter_published_catalog,
+)
 import helpers
 
+# レッスンページの動画の埋め込みオプション (ETag の計算と埋め込み HTML の生成で共通です)
+LESSON_VIDEO_OPTIONS = {"field_name": "video", "as_html": True, "width": 1250}
+
 # Create your views here.
 
 
+def is_teaser_request(request):
+    """
+    ホームページのコース一覧 (`?teaser=1`) からのリクエストの場合に True を返します。
+
+    ティーザーでは「もっと見る」をクリックしたときだけ続きを読み込み、
+    スクロールしただけでカタログ全体を読み込まないようにします。
+    """
+    return request.GET.get("teaser") == "1"
+
+
+@vary_on_headers("HX-Request")
 def course_list_view(request):
     """
     このビューは、公開されているコースの一覧を表示するために使用されます.
 
-    ビューは、htmx リクエストかどうかをチェックし、
-    htmx リクエストの場合は少ない数のコースを取得して、
-    そうでない場合は全てのコースを取得します。
+    コースはカーソル (`?cursor=`) 方式でページ分割され、
+    htmx リクエストの場合は一覧の部分テンプレートだけを返します。
+    カーソル付きの htmx リクエスト (「もっと見る」) では、続きのカードだけを返します。
+    一覧ページでは「もっと見る」が表示されると自動で続きを読み込みますが、
+    ホームページのティーザー (`?teaser=1`) ではクリックしたときだけ読み込みます。
 
-    コースのクエリセットは、コースの一覧テンプレートに渡されます。
+    コースのページは、コースの一覧テンプレートに渡されます。
+    一覧部分はカタログのバージョンをキーにキャッシュされ、
+    htmx の部分レスポンスと通常のページは HX-Request ヘッダーで区別されます。
+    全コースの最終更新日時と件数から ETag / Last-Modified を計算し、
+    クライアントのキャッシュが最新の場合はテンプレートを描画せずに 304 を返します。
 
     :param request: リクエストオブジェクト
     :return: レンダリングされたコース一覧テンプレート
     """
+    validators = get_page_validators(
+        request, get_email_id(request), *services.get_catalog_last_modified()
+    )
+    response = get_not_modified_response(request, validators)
+    if response is not None:
+        return response
     queryset = services.get_publish_courses()
-    context = {"object_list": queryset}
+    teaser = is_teaser_request(request)
+    page = paginate_courses(
+        queryset,
+        cursor=request.GET.get("cursor"),
+        base_url=request.path,
+        params={"teaser": 1} if teaser else None,
+    )
+    context = {
+        "object_list": page,
+        "cursor": page.cursor or "",
+        "infinite_scroll": not teaser,
+        **get_cache_context(),
+    }
     template_name = "courses/list.html"
     if request.htmx:
         template_name = "courses/snippets/list-display.html"
-        context["queryset"] = queryset[:3]
-    return render(request, template_name, context)
+        if page.cursor:
+            template_name = "courses/snippets/list-items.html"
+        context["queryset"] = page
+        cache_key = get_cache_key("list-hx", teaser, page.cursor or "")
+        html = cache.get(cache_key)
+        if html is None:
+            html = render_to_string(template_name, context, request=request)
+            cache.set(cache_key, html, COURSES_CACHE_TIMEOUT)
+        return set_page_validators(request, HttpResponse(html), validators)
+    response = render(request, template_name, context)
+    return set_page_validators(request, response, validators)
+
+
+def course_catalog_export_view(request):
+    """
+    公開済みのカタログ全体を NDJSON (1行に1つの JSON) でストリーミングします。
+
+    コースとレッスンはデータベースから少しずつ読み込みながら送信されるため、
+    カタログの大きさに関係なくメモリ使用量は一定で、最初のバイトもすぐに返されます。
+
+    :param request: リクエストオブジェクト
+    :return: application/x-ndjson のストリーミングレスポンス
+    """
+    return StreamingHttpResponse(
+        iter_jsonl(iter_published_catalog()),
+        content_type="application/x-ndjson",
+    )
 
 
+@vary_on_headers("HX-Request")
 def course_detail_view(
     request,
     course_id=None,
@@ -42,6 +135,10 @@ def course_detail_view(
     コースオブジェクトとレッスンのクエリセットは、コースの詳細テンプレートに渡されます。
 
     コースオブジェクトが見つからない場合、ビューは 404 例外を発生させます。
+    レッスン一覧はコースの updated と公開状態をキーにキャッシュされます。
+    レッスンはカーソル方式でページ分割され、カーソル付きの htmx リクエストには続きのカードだけを返します。
+    コースとレッスンの最終更新日時 (コースと同じクエリで取得) から ETag / Last-Modified を計算し、
+    クライアントのキャッシュが最新の場合はテンプレートを描画せずに 304 を返します。
 
     :param request: リクエストオブジェクト
     :param course_id: 表示するコースの public_id
@@ -50,12 +147,38 @@ def course_detail_view(
     course_obj = services.get_course_detail(course_id=course_id)
     if course_obj is None:
         raise Http404
+    validators = get_page_validators(
+        request,
+        get_email_id(request),
+        get_last_modified(course_obj.updated, course_obj.lessons_updated),
+        course_obj.lessons_count,
+    )
+    response = get_not_modified_response(request, validators)
+    if response is not None:
+        return response
     lessons_queryset = services.get_course_lessons(course_obj=course_obj)
+    page = paginate_lessons(
+        lessons_queryset, cursor=request.GET.get("cursor"), base_url=request.path
+    )
     context = {
         "object": course_obj,
-        "lessons_queryset": lessons_queryset,
+        "lessons_queryset": page,
+        "cursor": page.cursor or "",
+        **get_cache_context(),
     }
-    return render(request, "courses/detail.html", context)
+    if request.htmx and page.cursor:
+        template_name = "courses/snippets/list-items.html"
+        context["queryset"] = page
+        cache_key = get_cache_key(
+            "lessons-hx", course_obj.public_id, course_obj.updated, page.cursor
+        )
+        html = cache.get(cache_key)
+        if html is None:
+            html = render_to_string(template_name, context, request=request)
+            cache.set(cache_key, html, COURSES_CACHE_TIMEOUT)
+        return set_page_validators(request, HttpResponse(html), validators)
+    response = render(request, "courses/detail.html", context)
+    return set_page_validators(request, response, validators)
 
 
 def lesson_detail_view(
@@ -80,27 +203,215 @@ def lesson_detail_view(
 
     1. コースIDとレッスンIDを使用して、レッスンの詳細を取得します。
     2. レッスンが存在しない場合は404エラーを発生させます。
-    3. レッスンがメールアドレスを必要とする場合、セッションにメールIDが存在しない場合は、メールアドレス入力ページにリダイレクトします。
-    4. レッスンが「Coming Soon」でないかつビデオがある場合は、ビデオの埋め込みHTMLを取得し、テンプレートを設定します。
-    5. レンダリングされたレスポンスを返します。
+    3. レッスンがメールアドレスを必要とする場合、セッション (Cookie モードでは署名付き Cookie) にメールIDが存在しない場合は、メールアドレス入力ページにリダイレクトします。
+    4. レッスンとコースの更新日時と、動画の public_id・バージョン・埋め込みオプションから ETag を計算し、
+       クライアントのキャッシュが最新の場合は 304 を返します (動画の埋め込みHTMLは生成しません)。
+    5. レッスンが「Coming Soon」でないかつビデオがある場合は、ビデオの埋め込みHTMLを取得し、テンプレートを設定します。
+    6. レンダリングされたレスポンスを返します。
     """
 
     lesson_obj = services.get_lesson_detail(course_id=course_id, lesson_id=lesson_id)
     if lesson_obj is None:
         raise Http404
-    email_id_exists = request.session.get("email_id")
+    email_id_exists = get_email_id(request)
     if lesson_obj.requires_email and not email_id_exists:
-        request.session["next_url"] = request.path
-        return render(request, "courses/email-required.html", {})
+        response = render(request, "courses/email-required.html", {})
+        return remember_next_url(request, response, request.path)
     template_name = "courses/lesson-coming-soon.html"
     context = {"object": lesson_obj}
-    if not lesson_obj.is_coming_soon and lesson_obj.has_video:
+    has_video = not lesson_obj.is_coming_soon and lesson_obj.has_video
+    video_key = ""
+    if has_video:
+        video_key = helpers.get_cloudinary_video_key(lesson_obj, **LESSON_VIDEO_OPTIONS)
+    validators = get_page_validators(
+        request,
+        email_id_exists,
+        get_last_modified(lesson_obj.updated, lesson_obj.course.updated),
+        video_key,
+    )
+    response = get_not_modified_response(request, validators)
+    if response is not None:
+        return response
+    if has_video:
+        template_name = "courses/lesson.html"
+        context["video_embed"] = helpers.get_cloudinary_video_object(
+            lesson_obj, **LESSON_VIDEO_OPTIONS
+        )
+    response = render(request, template_name, context)
+    return set_page_validators(request, response, validators)
+
+
+# 非同期ビュー (ASGI 用)。ASYNC_VIEWS_ENABLED が有効な場合に cfehome.async_urls から使用されます。
+# テンプレートの描画は同期処理のため、描画前にページの行とセッションを非同期 ORM で読み込み、
+# 描画中にクエリが発生しないようにします (`email_id` はコンテキストプロセッサより優先されます)。
+
+
+@vary_on_headers("HX-Request")
+async def acourse_list_view(request):
+    """
+    `course_list_view` の非同期版です。
+
+    :param request: リクエストオブジェクト
+    :return: レンダリングされたコース一覧テンプレート
+    """
+    email_id = await aget_email_id(request)
+    validators = get_page_validators(
+        request, email_id, *await services.aget_catalog_last_modified()
+    )
+    response = get_not_modified_response(request, validators)
+    if response is not None:
+        return response
+    queryset = services.get_publish_courses()
+    teaser = is_teaser_request(request)
+    page = paginate_courses(
+        queryset,
+        cursor=request.GET.get("cursor"),
+        base_url=request.path,
+        params={"teaser": 1} if teaser else None,
+    )
+    context = {
+        "object_list": page,
+        "cursor": page.cursor or "",
+        "infinite_scroll": not teaser,
+        **await aget_cache_context(),
+    }
+    template_name = "courses/list.html"
+    if request.htmx:
+        template_name = "courses/snippets/list-display.html"
+        if page.cursor:
+            template_name = "courses/snippets/list-items.html"
+        context["queryset"] = page
+        cache_key = await aget_cache_key("list-hx", teaser, page.cursor or "")
+        html = await cache.aget(cache_key)
+        if html is None:
+            await page.aload()
+            html = render_to_string(template_name, context, request=request)
+            await cache.aset(cache_key, html, COURSES_CACHE_TIMEOUT)
+        return set_page_validators(request, HttpResponse(html), validators)
+    await page.aload()
+    context["email_id"] = email_id
+    response = render(request, template_name, context)
+    return set_page_validators(request, response, validators)
+
+
+async def acourse_catalog_export_view(request):
+    """
+    `course_catalog_export_view` の非同期版です。
+
+    ASGI では同期イテレーターが最初にすべて読み込まれてしまうため、非同期ジェネレーターで
+    少しずつ読み込みながら送信します。
+
+    :param request: リクエストオブジェクト
+    :return: application/x-ndjson のストリーミングレスポンス
+    """
+    return StreamingHttpResponse(
+        aiter_jsonl(aiter_published_catalog()),
+        content_type="application/x-ndjson",
+    )
+
+
+@vary_on_headers("HX-Request")
+async def acourse_detail_view(
+    request,
+    course_id=None,
+    *args,
+    **kwargs,
+):
+    """
+    `course_detail_view` の非同期版です。
+
+    :param request: リクエストオブジェクト
+    :param course_id: 表示するコースの public_id
+    :return: レンダリングされたコース詳細テンプレート
+    """
+    course_obj = await services.aget_course_detail(course_id=course_id)
+    if course_obj is None:
+        raise Http404
+    email_id = await aget_email_id(request)
+    validators = get_page_validators(
+        request,
+        email_id,
+        get_last_modified(course_obj.updated, course_obj.lessons_updated),
+        course_obj.lessons_count,
+    )
+    response = get_not_modified_response(request, validators)
+    if response is not None:
+        return response
+    lessons_queryset = services.get_course_lessons(course_obj=course_obj)
+    page = paginate_lessons(
+        lessons_queryset, cursor=request.GET.get("cursor"), base_url=request.path
+    )
+    context = {
+        "object": course_obj,
+        "lessons_queryset": page,
+        "cursor": page.cursor or "",
+        **await aget_cache_context(),
+    }
+    if request.htmx and page.cursor:
+        template_name = "courses/snippets/list-items.html"
+        context["queryset"] = page
+        cache_key = await aget_cache_key(
+            "lessons-hx", course_obj.public_id, course_obj.updated, page.cursor
+        )
+        html = await cache.aget(cache_key)
+        if html is None:
+            await page.aload()
+            html = render_to_string(template_name, context, request=request)
+            await cache.aset(cache_key, html, COURSES_CACHE_TIMEOUT)
+        return set_page_validators(request, HttpResponse(html), validators)
+    await page.aload()
+    context["email_id"] = email_id
+    response = render(request, "courses/detail.html", context)
+    return set_page_validators(request, response, validators)
+
+
+async def alesson_detail_view(
+    request,
+    course_id=None,
+    lesson_id=None,
+    *args,
+    **kwargs,
+):
+    """
+    `lesson_detail_view` の非同期版です。
+
+    Args:
+        request (HttpRequest): リクエストオブジェクト。
+        course_id (str, optional): コースのID。デフォルトはNone。
+        lesson_id (str, optional): レッスンのID。デフォルトはNone。
+
+    Returns:
+        HttpResponse: レンダリングされたレスポンス。
+    """
+    lesson_obj = await services.aget_lesson_detail(
+        course_id=course_id, lesson_id=lesson_id
+    )
+    if lesson_obj is None:
+        raise Http404
+    email_id = await aget_email_id(request)
+    if lesson_obj.requires_email and not email_id:
+        context = {"email_id": email_id}
+        response = render(request, "courses/email-required.html", context)
+        return await aremember_next_url(request, response, request.path)
+    template_name = "courses/lesson-coming-soon.html"
+    context = {"object": lesson_obj, "email_id": email_id}
+    has_video = not lesson_obj.is_coming_soon and lesson_obj.has_video
+    video_key = ""
+    if has_video:
+        video_key = helpers.get_cloudinary_video_key(lesson_obj, **LESSON_VIDEO_OPTIONS)
+    validators = get_page_validators(
+        request,
+        email_id,
+        get_last_modified(lesson_obj.updated, lesson_obj.course.updated),
+        video_key,
+    )
+    response = get_not_modified_response(request, validators)
+    if response is not None:
+        return response
+    if has_video:
         template_name = "courses/lesson.html"
-        video_embed_html = helpers.get_cloudinary_video_object(
-            lesson_obj,
-            field_name="video",
-            as_html=True,
-            width=1250,
+        context["video_embed"] = await helpers.aget_cloudinary_video_object(
+            lesson_obj, **LESSON_VIDEO_OPTIONS
         )
-        context["video_embed"] = video_embed_html
-    return render(request, template_name, context)
+    response = render(request, template_name, context)
+    return set_page_validators(request, response, validators)
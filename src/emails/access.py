@@ -0,0 +1,166 @@
+from django.conf import settings
+from django.core import signing
+
+EMAIL_ACCESS_SESSION_KEY = "email_id"
+NEXT_URL_SESSION_KEY = "next_url"
+NEXT_URL_COOKIE_NAME = "next_url"
+
+
+def cookie_mode_enabled():
+    return getattr(settings, "EMAIL_ACCESS_COOKIE_ENABLED", False)
+
+
+def get_cookie_options():
+    return {
+        "name": getattr(settings, "EMAIL_ACCESS_COOKIE_NAME", "email_access"),
+        "salt": getattr(settings, "EMAIL_ACCESS_COOKIE_SALT", "emails.access"),
+        "max_age": getattr(settings, "EMAIL_ACCESS_COOKIE_MAX_AGE", 60 * 60 * 24 * 14),
+    }
+
+
+def get_email_id(request):
+    """
+    確認済みのメールIDをリクエストから取得します。
+
+    EMAIL_ACCESS_COOKIE_ENABLED が有効な場合は、署名付き Cookie をメモリ上で検証するだけで、
+    セッションを読み込みません (データベースへのクエリは発生しません)。
+    署名は SECRET_KEY と SECRET_KEY_FALLBACKS で検証されるため、鍵をローテーションしても
+    期限内の Cookie は有効なままです。
+
+    Args:
+        request (HttpRequest): リクエストオブジェクト
+
+    Returns:
+        str: メールID。存在しない、または無効な場合は None
+    """
+    if cookie_mode_enabled():
+        options = get_cookie_options()
+        try:
+            return request.get_signed_cookie(
+                options["name"],
+                default=None,
+                salt=options["salt"],
+                max_age=options["max_age"],
+            )
+        except signing.BadSignature:
+            return None
+    return request.session.get(EMAIL_ACCESS_SESSION_KEY)
+
+
+def grant_email_access(request, response, email_obj):
+    """
+    確認済みのメールIDを Cookie モードでは署名付き Cookie に、それ以外ではセッションに保存します。
+    """
+    if not cookie_mode_enabled():
+        request.session[EMAIL_ACCESS_SESSION_KEY] = f"{email_obj.id}"
+        return response
+    options = get_cookie_options()
+    response.set_signed_cookie(
+        options["name"],
+        f"{email_obj.id}",
+        salt=options["salt"],
+        max_age=options["max_age"],
+        secure=request.is_secure(),
+        httponly=True,
+        samesite="Lax",
+    )
+    response.delete_cookie(NEXT_URL_COOKIE_NAME, samesite="Lax")
+    return response
+
+
+def revoke_email_access(request, response):
+    """
+    セッションと Cookie の両方から確認済みのメールIDを削除します。
+    """
+    if EMAIL_ACCESS_SESSION_KEY in request.session:
+        del request.session[EMAIL_ACCESS_SESSION_KEY]
+    if cookie_mode_enabled():
+        response.delete_cookie(get_cookie_options()["name"], samesite="Lax")
+    return response
+
+
+def remember_next_url(request, response, next_url):
+    """
+    メール確認後に戻る URL を保存します。
+
+    Cookie モードでは署名付き Cookie に保存し、セッション行を作成しません。
+    セッションモードでは値が変わった場合にのみセッションに書き込み、
+    同じレッスンへの再訪問でセッションが保存されないようにします。
+    """
+    if cookie_mode_enabled():
+        if get_next_url(request) != next_url:
+            response.set_signed_cookie(
+                NEXT_URL_COOKIE_NAME,
+                next_url,
+                salt=get_cookie_options()["salt"],
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+    if request.session.get(NEXT_URL_SESSION_KEY) != next_url:
+        request.session[NEXT_URL_SESSION_KEY] = next_url
+    return response
+
+
+def get_next_url(request):
+    if cookie_mode_enabled():
+        try:
+            return request.get_signed_cookie(
+                NEXT_URL_COOKIE_NAME,
+                default=None,
+                salt=get_cookie_options()["salt"],
+            )
+        except signing.BadSignature:
+            return None
+    return request.session.get(NEXT_URL_SESSION_KEY)
+
+
+# 非同期ビュー用。セッションは Django の非同期セッション API で読み書きし、
+# 一度読み込んだ後はテンプレートからの同期的な参照でもクエリは発生しません。
+
+
+async def aget_email_id(request):
+    """
+    `get_email_id` の非同期版です。
+    """
+    if cookie_mode_enabled():
+        return get_email_id(request)
+    return await request.session.aget(EMAIL_ACCESS_SESSION_KEY)
+
+
+async def agrant_email_access(request, response, email_obj):
+    """
+    `grant_email_access` の非同期版です。
+    """
+    if not cookie_mode_enabled():
+        await request.session.aset(EMAIL_ACCESS_SESSION_KEY, f"{email_obj.id}")
+        return response
+    return grant_email_access(request, response, email_obj)
+
+
+async def arevoke_email_access(request, response):
+    """
+    `revoke_email_access` の非同期版です。
+    """
+    if await request.session.ahas_key(EMAIL_ACCESS_SESSION_KEY):
+        await request.session.apop(EMAIL_ACCESS_SESSION_KEY)
+    if cookie_mode_enabled():
+        response.delete_cookie(get_cookie_options()["name"], samesite="Lax")
+    return response
+
+
+async def aremember_next_url(request, response, next_url):
+    """
+    `remember_next_url` の非同期版です。
+    """
+    if cookie_mode_enabled():
+        return remember_next_url(request, response, next_url)
+    if await request.session.aget(NEXT_URL_SESSION_KEY) != next_url:
+        await request.session.aset(NEXT_URL_SESSION_KEY, next_url)
+    return response
+
+
+async def aget_next_url(request):
+    if cookie_mode_enabled():
+        return get_next_url(request)
+    return await request.session.aget(NEXT_URL_SESSION_KEY)
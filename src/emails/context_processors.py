@@ -0,0 +1,12 @@
+from functools import partial
+
+from .access import get_email_id
+
+
+def email_access(request):
+    """
+    テンプレートで使用する `email_id` を遅延評価で提供します。
+
+    テンプレートで参照された場合にのみ、Cookie またはセッションから読み込まれます。
+    """
+    return {"email_id": partial(get_email_id, request)}
@@ -0,0 +1,70 @@
+import random
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from emails import services
+from emails.models import Email, EmailVerificationEvent
+from helpers.benchmarks import benchmark_database, summarize, timed
+
+
+class Command(BaseCommand):
+    help = "ベンチマーク用データベースで Email / EmailVerificationEvent の検索速度を計測します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--lookups", type=int, default=1000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        lookups = options["lookups"]
+        with benchmark_database():
+            tokens = self.seed(rows, options["batch_size"])
+            emails = [
+                f"user{random.randrange(rows)}@example.com" for _ in range(lookups)
+            ]
+            tokens = random.choices(tokens, k=lookups)
+            results = {
+                "get_or_create(email)": self.run(
+                    lambda email: Email.objects.get_or_create(email=email), emails
+                ),
+                "verify_email(email)": self.run(services.verify_email, emails),
+                "filter(token).first()": self.run(
+                    lambda token: EmailVerificationEvent.objects.filter(
+                        token=token
+                    ).first(),
+                    tokens,
+                ),
+            }
+            plan = EmailVerificationEvent.objects.filter(token=tokens[0]).explain()
+        self.stdout.write(f"rows: {rows}, lookups: {lookups}")
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<24} p50 {stats['p50_ms']:.3f}ms  p95 {stats['p95_ms']:.3f}ms"
+            )
+        self.stdout.write(f"token lookup plan: {plan}")
+
+    def seed(self, rows, batch_size):
+        tokens = []
+        for start in range(0, rows, batch_size):
+            stop = min(start + batch_size, rows)
+            email_objs = Email.objects.bulk_create(
+                Email(email=f"user{i}@example.com", active=i % 2 == 0)
+                for i in range(start, stop)
+            )
+            events = [
+                EmailVerificationEvent(
+                    parent=email_obj, email=email_obj.email, token=uuid.uuid1()
+                )
+                for email_obj in email_objs
+            ]
+            EmailVerificationEvent.objects.bulk_create(events)
+            tokens.extend(event.token for event in events)
+        return tokens
+
+    def run(self, func, values):
+        samples = []
+        for value in values:
+            samples.extend(timed(lambda: func(value)))
+        return summarize(samples)
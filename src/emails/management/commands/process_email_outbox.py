@@ -0,0 +1,79 @@
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from emails import services
+
+
+class Command(BaseCommand):
+    help = "アウトボックスに登録された検証メールをスレッドプールで送信します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--max-attempts", type=int, default=5)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="送信待ちがない場合に次の確認までに待機する秒数",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="送信待ちがなくなったら終了します",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        self.batch_size = options["batch_size"]
+        self.max_attempts = options["max_attempts"]
+        self.interval = options["interval"]
+        self.once = options["once"]
+        # シグナルはメインスレッドにしか届かないため、停止はイベントでワーカーに伝えます
+        self.stop_event = threading.Event()
+        previous_handler = signal.signal(signal.SIGTERM, self.stop)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self.run_worker) for _ in range(workers)]
+                try:
+                    totals = [future.result() for future in futures]
+                except KeyboardInterrupt:
+                    self.stop()
+                    totals = [future.result() for future in futures]
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+        sent_count = sum(sent for sent, _ in totals)
+        failed_count = sum(failed for _, failed in totals)
+        self.stdout.write(
+            self.style.SUCCESS(f"sent: {sent_count}, failed: {failed_count}")
+        )
+
+    def stop(self, *args):
+        """
+        処理中のバッチが終わった時点で、すべてのワーカーを終了させます (SIGTERM / Ctrl-C)。
+        """
+        self.stop_event.set()
+
+    def run_worker(self):
+        sent_total = 0
+        failed_total = 0
+        try:
+            while not self.stop_event.is_set():
+                sent, failed = services.process_outbox_batch(
+                    batch_size=self.batch_size,
+                    max_attempts=self.max_attempts,
+                )
+                sent_total += sent
+                failed_total += failed
+                if sent or failed:
+                    continue
+                if self.once:
+                    break
+                self.stop_event.wait(self.interval)
+        finally:
+            connection.close()
+        return sent_total, failed_total
@@ -0,0 +1,26 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "期限切れのセッション行をバッチごとに削除します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        now = timezone.now()
+        deleted_total = 0
+        while True:
+            session_keys = list(
+                Session.objects.filter(expire_date__lt=now).values_list(
+                    "session_key", flat=True
+                )[:batch_size]
+            )
+            if not session_keys:
+                break
+            deleted, _ = Session.objects.filter(session_key__in=session_keys).delete()
+            deleted_total += deleted
+        self.stdout.write(self.style.SUCCESS(f"deleted sessions: {deleted_total}"))
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from emails import services
+from emails.models import EmailVerificationEvent
+
+
+class Command(BaseCommand):
+    help = "未使用の検証メールを1つの接続でまとめて再送信します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=float,
+            default=24,
+            help="再送信の対象とする検証イベントの作成からの時間",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=services.EMAIL_SEND_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options["hours"])
+        verify_obj_ids = EmailVerificationEvent.objects.filter(
+            timestamp__gte=since,
+            expired=False,
+            attempts=0,
+        ).values_list("id", flat=True)
+        stats = services.send_verification_emails(
+            verify_obj_ids,
+            batch_size=options["batch_size"],
+            report=self.report,
+        )
+        sent_count = sum(batch["sent"] for batch in stats)
+        self.stdout.write(self.style.SUCCESS(f"sent: {sent_count}"))
+
+    def report(self, batch_stats):
+        self.stdout.write(
+            "batch {batch}: {sent}/{messages} sent in {seconds:.2f}s "
+            "({per_second:.1f} msg/s)".format(**batch_stats)
+        )
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.15 on 2026-10-18 14:11
+
+import uuid
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_emails(apps, schema_editor):
+    """
+    一意制約を追加する前に、重複した Email を最も古い行にまとめます。
+    """
+    Email = apps.get_model("emails", "Email")
+    EmailVerificationEvent = apps.get_model("emails", "EmailVerificationEvent")
+    duplicates = (
+        Email.objects.values("email")
+        .annotate(total=Count("id"))
+        .filter(total__gt=1)
+        .values_list("email", flat=True)
+    )
+    for email in duplicates:
+        email_objs = list(Email.objects.filter(email=email).order_by("id"))
+        keep = email_objs[0]
+        others = [obj.id for obj in email_objs[1:]]
+        if any(not obj.active for obj in email_objs):
+            Email.objects.filter(id=keep.id).update(active=False)
+        EmailVerificationEvent.objects.filter(parent_id__in=others).update(
+            parent_id=keep.id
+        )
+        Email.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("emails", "0004_emailoutbox"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_emails, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="email",
+            name="email",
+            field=models.EmailField(max_length=254, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="emailverificationevent",
+            name="token",
+            field=models.UUIDField(default=uuid.uuid1, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="email",
+            index=models.Index(
+                fields=["email", "active"], name="emails_emai_email_e40b8b_idx"
+            ),
+        ),
+    ]
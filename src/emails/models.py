@@ -1,20 +1,24 @@
 import uuid
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 
 
 class Email(models.Model):
-    email = models.EmailField()
+    email = models.EmailField(unique=True)
     active = models.BooleanField(default=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["email", "active"])]
+
 
 class EmailVerificationEvent(models.Model):
     parent = models.ForeignKey(Email, on_delete=models.SET_NULL, null=True)
     email = models.EmailField()
-    token = models.UUIDField(default=uuid.uuid1)
+    token = models.UUIDField(default=uuid.uuid1, unique=True)
     attempts = models.IntegerField(default=0)
     last_attempt_at = models.DateTimeField(
         auto_now=False,
@@ -33,3 +37,29 @@ class EmailVerificationEvent(models.Model):
 
     def get_link(self):
         return f"{settings.BASE_URL}/verify/{self.token}/"
+
+
+class OutboxStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    SENDING = "sending", "Sending"
+    SENT = "sent", "Sent"
+    FAILED = "failed", "Failed"
+
+
+class EmailOutbox(models.Model):
+    event = models.ForeignKey(EmailVerificationEvent, on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=10,
+        choices=OutboxStatus.choices,
+        default=OutboxStatus.PENDING,
+    )
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    lock_id = models.UUIDField(blank=True, null=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "available_at"])]
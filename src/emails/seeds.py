@@ -0,0 +1,39 @@
+import uuid
+
+from helpers.batches import batched
+
+from .models import Email, EmailVerificationEvent
+
+
+def seed_emails(count, events_per_email=1, batch_size=1000, report=None):
+    """
+    Email と EmailVerificationEvent を bulk_create で batch_size 件ずつ作成します。
+
+    メールアドレスには実行ごとのプレフィックスを付けるため、
+    同じデータベースに何度実行しても一意制約に違反しません。
+
+    Args:
+        count: 作成する Email の数
+        events_per_email: Email ごとに作成する検証イベントの数
+        batch_size: bulk_create の1回あたりの行数
+        report: 各 bulk_create の後に (モデル名, 行数) で呼び出される関数
+
+    Returns:
+        tuple: 作成された Email と EmailVerificationEvent の数
+    """
+    report = report or (lambda name, rows: None)
+    prefix = uuid.uuid4().hex[:8]
+    for indexes in batched(range(count), batch_size):
+        email_objs = Email.objects.bulk_create(
+            [Email(email=f"seed-{prefix}-{i}@example.com") for i in indexes]
+        )
+        report("email", len(email_objs))
+        events = (
+            EmailVerificationEvent(parent=email_obj, email=email_obj.email)
+            for email_obj in email_objs
+            for _ in range(events_per_email)
+        )
+        for batch in batched(events, batch_size):
+            EmailVerificationEvent.objects.bulk_create(batch)
+            report("emailverificationevent", len(batch))
+    return count, count * events_per_email
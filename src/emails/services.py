@@ -1,9 +1,17 @@
+import time
+import uuid
+from datetime import timedelta
+
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F, Q
 from django.utils import timezone
-from .models import Email, EmailVerificationEvent
+from .models import Email, EmailOutbox, EmailVerificationEvent, OutboxStatus
 
 EMAIL_HOST_USER = settings.EMAIL_HOST_USER
+EMAIL_OUTBOX_RETRY_DELAY = getattr(settings, "EMAIL_OUTBOX_RETRY_DELAY", 30)
+EMAIL_OUTBOX_CLAIM_TIMEOUT = getattr(settings, "EMAIL_OUTBOX_CLAIM_TIMEOUT", 60 * 5)
+EMAIL_SEND_BATCH_SIZE = getattr(settings, "EMAIL_SEND_BATCH_SIZE", 100)
 
 
 def verify_email(email):
@@ -51,6 +59,8 @@ def start_verification_event(email):
     1. 指定されたメールアドレスのEmailインスタンスを取得または作成します。
     2. EmailインスタンスのEmailVerificationEventインスタンスを作成します。
     3. 検証IDを含む検証メールを送信します。
+       EMAIL_OUTBOX_ENABLED が有効な場合は送信せずにアウトボックスへ登録し、
+       `process_email_outbox` コマンドのワーカーが後で送信します。
     4. EmailVerificationEventインスタンスと、検証メールが正常に送信されたかどうかを示すブール値を返します。
 
     Args:
@@ -58,47 +68,248 @@ def start_verification_event(email):
 
     Returns:
         tuple: EmailVerificationEventインスタンスと、検証メールが正常に送信されたかどうかを示すブール値
+            (アウトボックスに登録した場合は False)
     """
     email_obj, created = Email.objects.get_or_create(email=email)
     obj = EmailVerificationEvent.objects.create(
         parent=email_obj,
         email=email,
     )
+    if getattr(settings, "EMAIL_OUTBOX_ENABLED", False):
+        enqueue_verification_email(obj)
+        return obj, False
     sent = send_verification_email(obj.id)
     return obj, sent
 
 
-def send_verification_email(verify_obj_id):
+def enqueue_verification_email(verify_obj):
     """
-    指定された検証IDを持つユーザーに検証メールを送信します。
+    検証メールをアウトボックスに登録します。
 
     Args:
-        verify_obj_id (int): 検証メールを送信するEmailVerificationEventインスタンスのID
+        verify_obj (EmailVerificationEvent): 送信するEmailVerificationEventインスタンス
 
     Returns:
-        bool: 検証メールが正常に送信されたかどうか
+        EmailOutbox: 作成されたアウトボックスのインスタンス
+    """
+    return EmailOutbox.objects.create(event=verify_obj)
+
+
+def claim_outbox_batch(batch_size=100):
+    """
+    送信待ちのアウトボックスをまとめて確保します。
+
+    確保は条件付きの UPDATE で行うため、複数のワーカーが同時に実行しても
+    同じ行を二重に送信することはありません。送信中のまま
+    EMAIL_OUTBOX_CLAIM_TIMEOUT 秒を過ぎた行 (ワーカーの停止など) も再度確保されます。
+
+    Args:
+        batch_size (int, optional): 一度に確保する最大件数. Defaults to 100.
+
+    Returns:
+        list: 確保したEmailOutboxインスタンスのリスト
+    """
+    now = timezone.now()
+    stale_at = now - timedelta(seconds=EMAIL_OUTBOX_CLAIM_TIMEOUT)
+    claimable = Q(status=OutboxStatus.PENDING, available_at__lte=now) | Q(
+        status=OutboxStatus.SENDING, claimed_at__lt=stale_at
+    )
+    ids = list(
+        EmailOutbox.objects.filter(claimable)
+        .order_by("available_at", "id")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    lock_id = uuid.uuid4()
+    EmailOutbox.objects.filter(claimable, id__in=ids).update(
+        status=OutboxStatus.SENDING,
+        lock_id=lock_id,
+        claimed_at=now,
+    )
+    return list(EmailOutbox.objects.filter(lock_id=lock_id).select_related("event"))
+
+
+def mark_outbox_sent(outbox_obj):
+    outbox_obj.status = OutboxStatus.SENT
+    outbox_obj.sent_at = timezone.now()
+    outbox_obj.lock_id = None
+    outbox_obj.save(update_fields=["status", "sent_at", "lock_id"])
+
+
+def mark_outbox_failed(outbox_obj, error, max_attempts=5):
+    """
+    送信に失敗したアウトボックスを記録します。
+
+    最大試行回数に達していない場合は、試行回数に応じて待機時間を延ばして再送待ちに戻します。
+    """
+    outbox_obj.attempts += 1
+    outbox_obj.last_error = f"{error}"
+    outbox_obj.lock_id = None
+    if outbox_obj.attempts >= max_attempts:
+        outbox_obj.status = OutboxStatus.FAILED
+    else:
+        delay = EMAIL_OUTBOX_RETRY_DELAY * (2 ** (outbox_obj.attempts - 1))
+        outbox_obj.status = OutboxStatus.PENDING
+        outbox_obj.available_at = timezone.now() + timedelta(seconds=delay)
+    outbox_obj.save(
+        update_fields=["attempts", "last_error", "lock_id", "status", "available_at"]
+    )
+
+
+def process_outbox_batch(batch_size=100, max_attempts=5):
+    """
+    アウトボックスから1バッチ分を確保して検証メールを送信します。
+
+    接続、メッセージの生成、送信のいずれかに失敗した行は `mark_outbox_failed` で記録するため、
+    確保した行が送信中のまま残ることはありません。
+
+    Args:
+        batch_size (int, optional): 一度に処理する最大件数. Defaults to 100.
+        max_attempts (int, optional): 失敗とみなすまでの最大試行回数. Defaults to 5.
+
+    Returns:
+        tuple: 送信に成功した件数と失敗した件数
+    """
+    sent_count = 0
+    failed_count = 0
+    outbox_objs = claim_outbox_batch(batch_size=batch_size)
+    if not outbox_objs:
+        return sent_count, failed_count
+    try:
+        connection = get_connection(fail_silently=False)
+        opened = connection.open()
+    except Exception as e:
+        # SMTP サーバーに接続できない場合は、確保した行をすべて失敗として再送待ちに戻します
+        for outbox_obj in outbox_objs:
+            mark_outbox_failed(outbox_obj, e, max_attempts=max_attempts)
+        return sent_count, len(outbox_objs)
+    try:
+        for outbox_obj in outbox_objs:
+            try:
+                message = get_verification_email_message(
+                    outbox_obj.event, connection=connection
+                )
+                connection.send_messages([message])
+            except Exception as e:
+                mark_outbox_failed(outbox_obj, e, max_attempts=max_attempts)
+                failed_count += 1
+                continue
+            mark_outbox_sent(outbox_obj)
+            sent_count += 1
+    finally:
+        if opened:
+            connection.close()
+    return sent_count, failed_count
+
+
+def get_verification_email_message(verify_obj, connection=None):
+    """
+    検証メールのメッセージ (テキストとHTMLの両方を含む) を生成します。
+
+    Args:
+        verify_obj (EmailVerificationEvent): 検証メールを送信するEmailVerificationEventインスタンス
+        connection (optional): 送信に使用するメールバックエンドの接続
+
+    Returns:
+        EmailMultiAlternatives: 検証メールのメッセージ
     """
-    verify_obj = EmailVerificationEvent.objects.get(id=verify_obj_id)
-    email = verify_obj.email
     subject = "メールアドレスを確認してください"
     text_msg = get_verification_email_msg(verify_obj, as_html=False)
     text_html = get_verification_email_msg(verify_obj, as_html=True)
-    from_user_email_address = EMAIL_HOST_USER
-    to_user_email_address = email
-    return send_mail(
+    message = EmailMultiAlternatives(
         subject,
         text_msg,
-        from_user_email_address,
-        [to_user_email_address],
-        fail_silently=False,
-        html_message=text_html,
+        EMAIL_HOST_USER,
+        [verify_obj.email],
+        connection=connection,
     )
+    message.attach_alternative(text_html, "text/html")
+    return message
+
+
+def send_verification_email(verify_obj_id):
+    """
+    指定された検証IDを持つユーザーに検証メールを送信します。
+
+    Args:
+        verify_obj_id (int): 検証メールを送信するEmailVerificationEventインスタンスのID
+
+    Returns:
+        bool: 検証メールが正常に送信されたかどうか
+    """
+    verify_obj = EmailVerificationEvent.objects.get(id=verify_obj_id)
+    message = get_verification_email_message(verify_obj)
+    return message.send(fail_silently=False)
+
+
+def send_verification_emails(
+    verify_obj_ids,
+    batch_size=EMAIL_SEND_BATCH_SIZE,
+    connection=None,
+    fail_silently=False,
+    report=None,
+):
+    """
+    複数のEmailVerificationEventの検証メールを、1つの接続を再利用してまとめて送信します。
+
+    メッセージは batch_size 件ごとにデータベースから取得・生成され、
+    同じ接続の `send_messages` で送信されるため、TLS ハンドシェイクは1回で済みます。
+
+    Args:
+        verify_obj_ids (iterable): 送信するEmailVerificationEventインスタンスのIDのリスト
+        batch_size (int, optional): 1バッチの件数. Defaults to EMAIL_SEND_BATCH_SIZE.
+        connection (optional): 使用するメールバックエンドの接続。None の場合は新しく作成します。
+        fail_silently (bool, optional): 送信エラーを無視するかどうか. Defaults to False.
+        report (callable, optional): バッチごとの統計 (辞書) を受け取るコールバック
+
+    Returns:
+        list: バッチごとの統計 (batch, messages, sent, seconds, per_second) のリスト
+    """
+    verify_obj_ids = list(verify_obj_ids)
+    if connection is None:
+        connection = get_connection(fail_silently=fail_silently)
+    stats = []
+    opened = connection.open()
+    try:
+        for batch_number, start in enumerate(
+            range(0, len(verify_obj_ids), batch_size), start=1
+        ):
+            started = time.perf_counter()
+            batch_ids = verify_obj_ids[start : start + batch_size]
+            qs = EmailVerificationEvent.objects.filter(id__in=batch_ids).only(
+                "id", "email", "token"
+            )
+            messages = [
+                get_verification_email_message(verify_obj, connection=connection)
+                for verify_obj in qs
+            ]
+            sent = connection.send_messages(messages) or 0
+            seconds = time.perf_counter() - started
+            batch_stats = {
+                "batch": batch_number,
+                "messages": len(messages),
+                "sent": sent,
+                "seconds": seconds,
+                "per_second": sent / seconds if seconds else 0.0,
+            }
+            stats.append(batch_stats)
+            if report is not None:
+                report(batch_stats)
+    finally:
+        if opened:
+            connection.close()
+    return stats
 
 
 def verify_token(token, max_attempts=5):
     """
     指定された検証トークンを持つEmailVerificationEventインスタンスを検証し、検証結果を返します。
 
+    試行回数の加算は `attempts < max_attempts` を条件とした1回の UPDATE で行うため、
+    同じリンクが同時にクリックされても最大試行回数を超えることはありません。
+    成功時のクエリは UPDATE と、親の Email を結合した SELECT の2回だけです。
+
     Args:
         token (str): 検証トークン
         max_attempts (int, optional): 最大の検証回数. Defaults to 5.
@@ -107,20 +318,35 @@ def verify_token(token, max_attempts=5):
         tuple: 検証結果を示すブール値、メッセージ、EmailVerificationEventインスタンス
     """
     qs = EmailVerificationEvent.objects.filter(token=token)
-    if not qs.exists() and not qs.count() == 1:
-        return False, "検証トークンが正しくありません。", None
-    has_email_expired = qs.filter(expired=True)
-    if has_email_expired.exists():
-        return False, "メールアドレスが期限切れです。", None
-    max_attempts_reached = qs.filter(attempts__gte=max_attempts)
-    if max_attempts_reached.exists():
-        return False, "最大の検証回数が超過です。", None
-    obj = qs.first()
-    obj.attempts += 1
-    obj.last_attempt_at = timezone.now()
-    if obj.attempts > max_attempts:
-        obj.expired = True
-        obj.expired_at = timezone.now()
-    obj.save()
+    updated = qs.filter(expired=False, attempts__lt=max_attempts).update(
+        attempts=F("attempts") + 1,
+        last_attempt_at=timezone.now(),
+    )
+    if not updated:
+        return get_verify_failure(qs.only("expired", "attempts").first())
+    obj = qs.select_related("parent").first()
     email_obj = obj.parent
     return True, "検証成功！", email_obj
+
+
+async def averify_token(token, max_attempts=5):
+    """
+    `verify_token` の非同期版です。Django の非同期 ORM で同じ2回のクエリを実行します。
+    """
+    qs = EmailVerificationEvent.objects.filter(token=token)
+    updated = await qs.filter(expired=False, attempts__lt=max_attempts).aupdate(
+        attempts=F("attempts") + 1,
+        last_attempt_at=timezone.now(),
+    )
+    if not updated:
+        return get_verify_failure(await qs.only("expired", "attempts").afirst())
+    obj = await qs.select_related("parent").afirst()
+    return True, "検証成功！", obj.parent
+
+
+def get_verify_failure(obj):
+    if obj is None:
+        return False, "検証トークンが正しくありません。", None
+    if obj.expired:
+        return False, "メールアドレスが期限切れです。", None
+    return False, "最大の検証回数が超過です。", None
@@ -1,3 +1,234 @@
-from django.test import TestCase
+import os
+import signal
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from courses.models import AccessRequirement, Course, Lesson, PublishStatus
+from courses.negative_cache import load_known_public_ids
+
+from . import access, services
+from .models import Email, EmailOutbox, EmailVerificationEvent, OutboxStatus
+
+
+@override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    EMAIL_OUTBOX_ENABLED=True,
+)
+class EmailOutboxTestCase(TestCase):
+    def test_start_verification_event_queues_email(self):
+        obj, sent = services.start_verification_event("hello@example.com")
+        self.assertFalse(sent)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertTrue(EmailOutbox.objects.filter(event=obj).exists())
+
+    def test_process_outbox_batch_sends_pending_emails(self):
+        services.start_verification_event("one@example.com")
+        services.start_verification_event("two@example.com")
+        self.assertEqual(services.process_outbox_batch(batch_size=10), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            EmailOutbox.objects.filter(status=OutboxStatus.SENT).count(), 2
+        )
+        self.assertEqual(services.process_outbox_batch(batch_size=10), (0, 0))
+
+    def test_failed_send_is_retried_later(self):
+        services.start_verification_event("retry@example.com")
+        with mock.patch.object(
+            locmem.EmailBackend, "send_messages", side_effect=OSError("down")
+        ):
+            self.assertEqual(services.process_outbox_batch(), (0, 1))
+        outbox_obj = EmailOutbox.objects.get()
+        self.assertEqual(outbox_obj.status, OutboxStatus.PENDING)
+        self.assertEqual(outbox_obj.attempts, 1)
+        self.assertGreater(outbox_obj.available_at, timezone.now())
+        self.assertEqual(services.process_outbox_batch(), (0, 0))
+
+    def test_connection_failure_releases_claimed_rows(self):
+        services.start_verification_event("a@example.com")
+        services.start_verification_event("b@example.com")
+        with mock.patch.object(
+            locmem.EmailBackend, "open", side_effect=OSError("smtp down")
+        ):
+            self.assertEqual(services.process_outbox_batch(), (0, 2))
+        self.assertEqual(
+            EmailOutbox.objects.filter(
+                status=OutboxStatus.PENDING, attempts=1, last_error="smtp down"
+            ).count(),
+            2,
+        )
+
+    def test_message_build_failure_is_recorded_per_row(self):
+        services.start_verification_event("ok@example.com")
+        services.start_verification_event("bad@example.com")
+        build = services.get_verification_email_message
+
+        def get_message(verify_obj, connection=None):
+            if verify_obj.email == "bad@example.com":
+                raise ValueError("broken template")
+            return build(verify_obj, connection=connection)
+
+        with mock.patch.object(
+            services, "get_verification_email_message", side_effect=get_message
+        ):
+            self.assertEqual(services.process_outbox_batch(), (1, 1))
+        failed = EmailOutbox.objects.get(event__email="bad@example.com")
+        self.assertEqual(failed.status, OutboxStatus.PENDING)
+        self.assertEqual(failed.last_error, "broken template")
+
+
+
+class ProcessEmailOutboxCommandTestCase(TestCase):
+    def test_sigterm_stops_workers(self):
+        def process_outbox_batch(**kwargs):
+            os.kill(os.getpid(), signal.SIGTERM)
+            return 1, 0
+
+        out = StringIO()
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        with mock.patch.object(
+            services, "process_outbox_batch", side_effect=process_outbox_batch
+        ):
+            call_command(
+                "process_email_outbox", "--workers=2", "--interval=0.01", stdout=out
+            )
+        self.assertIn("failed: 0", out.getvalue())
+        self.assertEqual(signal.getsignal(signal.SIGTERM), previous_handler)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class SendVerificationEmailsTestCase(TestCase):
+    def test_sends_batches_over_one_connection(self):
+        ids = [
+            EmailVerificationEvent.objects.create(email=f"user{i}@example.com").id
+            for i in range(5)
+        ]
+        reports = []
+        with mock.patch.object(
+            locmem.EmailBackend, "open", autospec=True, return_value=True
+        ) as open_connection:
+            stats = services.send_verification_emails(
+                ids, batch_size=2, report=reports.append
+            )
+        self.assertEqual(open_connection.call_count, 1)
+        self.assertEqual([batch["sent"] for batch in stats], [2, 2, 1])
+        self.assertEqual(reports, stats)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], "text/html")
+
+
+class VerifyTokenTestCase(TestCase):
+    def setUp(self):
+        obj, _ = services.start_verification_event("verify@example.com")
+        self.verify_obj = obj
+
+    def test_valid_token_uses_two_queries(self):
+        with self.assertNumQueries(2):
+            did_verify, msg, email_obj = services.verify_token(self.verify_obj.token)
+        self.assertTrue(did_verify)
+        self.assertEqual(email_obj, self.verify_obj.parent)
+        self.verify_obj.refresh_from_db()
+        self.assertEqual(self.verify_obj.attempts, 1)
+        self.assertIsNotNone(self.verify_obj.last_attempt_at)
+
+    def test_unknown_token(self):
+        did_verify, msg, email_obj = services.verify_token(uuid.uuid4())
+        self.assertFalse(did_verify)
+        self.assertIsNone(email_obj)
+
+    def test_max_attempts(self):
+        for _ in range(2):
+            self.assertTrue(services.verify_token(self.verify_obj.token, 2)[0])
+        did_verify, msg, email_obj = services.verify_token(self.verify_obj.token, 2)
+        self.assertFalse(did_verify)
+        self.verify_obj.refresh_from_db()
+        self.assertEqual(self.verify_obj.attempts, 2)
+
+    def test_expired_token(self):
+        EmailVerificationEvent.objects.update(expired=True)
+        did_verify, msg, email_obj = services.verify_token(self.verify_obj.token)
+        self.assertFalse(did_verify)
+        self.assertEqual(msg, "メールアドレスが期限切れです。")
+
+    def test_async_verify_token_uses_two_queries(self):
+        averify_token = async_to_sync(services.averify_token)
+        with self.assertNumQueries(2):
+            did_verify, msg, email_obj = averify_token(self.verify_obj.token)
+        self.assertTrue(did_verify)
+        self.assertEqual(email_obj, self.verify_obj.parent)
+        did_verify, msg, email_obj = averify_token(uuid.uuid4())
+        self.assertFalse(did_verify)
+        self.assertEqual(msg, "検証トークンが正しくありません。")
+
+
+class EmailLookupIndexTestCase(TestCase):
+    def test_token_lookup_uses_index(self):
+        plan = EmailVerificationEvent.objects.filter(token=uuid.uuid1()).explain()
+        self.assertIn("USING INDEX", plan)
+
+    def test_verify_email_uses_index(self):
+        plan = Email.objects.filter(email="a@example.com", active=False).explain()
+        self.assertIn("USING INDEX", plan)
+
+
+@override_settings(EMAIL_ACCESS_COOKIE_ENABLED=True)
+class EmailAccessCookieTestCase(TestCase):
+    def setUp(self):
+        course = Course.objects.create(
+            title="Gated",
+            status=PublishStatus.PUBLISHED,
+            access=AccessRequirement.EMAIL_REQUIRED,
+        )
+        self.lesson = Lesson.objects.create(course=course, title="Gated Lesson")
+        self.verify_obj, _ = services.start_verification_event("cookie@example.com")
+
+    def test_verified_cookie_unlocks_lesson_without_session(self):
+        response = self.client.get(f"/verify/{self.verify_obj.token}/")
+        self.assertIn("email_access", response.cookies)
+        self.assertNotIn(access.EMAIL_ACCESS_SESSION_KEY, self.client.session)
+        # public_id のブルームフィルターを作成するクエリ (プロセスごとに1回) は数えません
+        load_known_public_ids()
+        with self.assertNumQueries(1):
+            response = self.client.get(self.lesson.path + "/")
+        self.assertTemplateUsed(response, "courses/lesson-coming-soon.html")
+
+    def test_tampered_cookie_is_rejected(self):
+        self.client.cookies["email_access"] = "1:forged:signature"
+        response = self.client.get(self.lesson.path + "/")
+        self.assertTemplateUsed(response, "courses/email-required.html")
+
+    def test_rotated_secret_key_is_still_accepted(self):
+        self.client.get(f"/verify/{self.verify_obj.token}/")
+        with self.settings(
+            SECRET_KEY="rotated-secret-key", SECRET_KEY_FALLBACKS=[settings.SECRET_KEY]
+        ):
+            response = self.client.get(self.lesson.path + "/")
+        self.assertTemplateUsed(response, "courses/lesson-coming-soon.html")
+
+
+class PruneSessionsCommandTestCase(TestCase):
+    def test_deletes_only_expired_sessions(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(
+                session_key=f"expired{i}",
+                session_data="",
+                expire_date=now - timedelta(days=1),
+            )
+        Session.objects.create(
+            session_key="active", session_data="", expire_date=now + timedelta(days=1)
+        )
+        call_command("prune_sessions", batch_size=2, stdout=StringIO())
+        self.assertEqual(
+            list(Session.objects.values_list("session_key", flat=True)), ["active"]
+        )
@@ -1,10 +1,11 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
 from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django_htmx.http import HttpResponseClientRedirect
 
-from . import services
+from . import access, services
 from .forms import EmailForm
 
 EMAIL_ADDRESS = settings.EMAIL_ADDRESS
@@ -15,9 +16,8 @@ def logout_btn_hx_view(request):
     HTMXリクエストに応じて、ログアウトボタンを提供します。
 
     1. HTMXリクエストでない場合は、 "/" へリダイレクトします。
-    2. POSTリクエストの場合は、セッションからメールIDを削除します。
-    3. メールIDが存在しない場合は、 "/" へリダイレクトします。
-    4. それ以外の場合は、ログアウトボタンを出力します。
+    2. POSTリクエストの場合は、セッションと Cookie からメールIDを削除し、 "/" へリダイレクトします。
+    3. それ以外の場合は、ログアウトボタンを出力します。
 
     :param request: リクエストオブジェクト
     :type request: django.http.request.HttpRequest
@@ -27,13 +27,8 @@ def logout_btn_hx_view(request):
     if not request.htmx:
         return redirect("/")
     if request.method == "POST":
-        try:
-            del request.session["email_id"]
-        except:
-            pass
-        email_id_in_session = request.session.get("email_id")
-        if not email_id_in_session:
-            return HttpResponseClientRedirect("/")
+        response = HttpResponseClientRedirect("/")
+        return access.revoke_email_access(request, response)
     return render(request, "emails/hx/logout-btn.html", {})
 
 
@@ -54,7 +49,7 @@ def email_token_login_view(request):
     """
     if not request.htmx:
         return redirect("/")
-    email_id_in_session = request.session.get("email_id")
+    email_id_in_session = access.get_email_id(request)
     template_name = "emails/hx/form.html"
     form = EmailForm(request.POST or None)
     context = {
@@ -81,7 +76,8 @@ def verify_email_token_view(request, token, *args, **kwargs):
 
     1. 検証トークンを持つEmailVerificationEventインスタンスを検証します。
     2. 検証が失敗した場合は、エラーメッセージを出力し、 "/" へリダイレクトします。
-    3. 検証が成功した場合は、ログイン状態を設定し、次のURL(ない場合は "/" )へリダイレクトします。
+    3. 検証が成功した場合は、ログイン状態 (セッション、または Cookie モードでは署名付き Cookie) を設定し、
+       次のURL(ない場合は "/" )へリダイレクトします。
 
     :param request: リクエストオブジェクト
     :param token: 検証トークン
@@ -92,15 +88,65 @@ def verify_email_token_view(request, token, *args, **kwargs):
     """
     did_verify, msg, email_obj = services.verify_token(token)
     if not did_verify:
-        try:
-            del request.session["email_id"]
-        except:
-            pass
         messages.error(request, msg)
-        return redirect("/login/")
+        return access.revoke_email_access(request, redirect("/login/"))
     messages.success(request, msg)
-    request.session["email_id"] = f"{email_obj.id}"
-    next_url = request.session.get("next_url") or "/"
+    next_url = access.get_next_url(request) or "/"
     if not next_url.startswith("/"):
         next_url = "/"
-    return redirect(next_url)
+    return access.grant_email_access(request, redirect(next_url), email_obj)
+
+
+# 非同期ビュー (ASGI 用)。ASYNC_VIEWS_ENABLED が有効な場合に cfehome.async_urls から使用されます。
+
+
+async def aemail_token_login_view(request):
+    """
+    `email_token_login_view` の非同期版です。
+
+    メールの送信はブロッキング処理のため、検証の開始だけをスレッドで実行します。
+
+    :param request: リクエストオブジェクト
+    :type request: django.http.request.HttpRequest
+    :return:
+    :rtype:
+    """
+    if not request.htmx:
+        return redirect("/")
+    email_id_in_session = await access.aget_email_id(request)
+    template_name = "emails/hx/form.html"
+    form = EmailForm(request.POST or None)
+    context = {
+        "form": form,
+        "message": "",
+        "show_form": not email_id_in_session,
+        "email_id": email_id_in_session,
+    }
+    if form.is_valid():
+        email_val = form.cleaned_data.get("email")
+        await sync_to_async(services.start_verification_event)(email_val)
+        context["form"] = EmailForm()
+        context["message"] = (
+            f"Success! Check your email for verification from {EMAIL_ADDRESS}"
+        )
+    return render(request, template_name, context)
+
+
+async def averify_email_token_view(request, token, *args, **kwargs):
+    """
+    `verify_email_token_view` の非同期版です。
+
+    :param request: リクエストオブジェクト
+    :param token: 検証トークン
+    :return: 302リダイレクト
+    :rtype: django.http.response.HttpResponse
+    """
+    did_verify, msg, email_obj = await services.averify_token(token)
+    if not did_verify:
+        messages.error(request, msg)
+        return await access.arevoke_email_access(request, redirect("/login/"))
+    messages.success(request, msg)
+    next_url = await access.aget_next_url(request) or "/"
+    if not next_url.startswith("/"):
+        next_url = "/"
+    return await access.agrant_email_access(request, redirect(next_url), email_obj)
@@ -1,11 +1,23 @@
 from ._cloudinary import (
+    aget_cloudinary_video_object,
     cloudinary_init,
+    get_cloudinary_cache_stats,
     get_cloudinary_image_object,
+    get_cloudinary_image_srcset,
+    get_cloudinary_video_key,
     get_cloudinary_video_object,
+    invalidate_cloudinary_cache,
 )
+from .images import get_image_placeholder
 
 
 __all__ = [
+    "aget_cloudinary_video_object",
     "cloudinary_init",
+    "get_cloudinary_cache_stats",
     "get_cloudinary_image_object",
+    "get_cloudinary_image_srcset",
+    "get_cloudinary_video_key",
+    "get_image_placeholder",
+    "invalidate_cloudinary_cache",
 ]
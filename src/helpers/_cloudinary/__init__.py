@@ -1,9 +1,21 @@
+from .cache import get_cloudinary_cache_stats, invalidate_cloudinary_cache
 from .config import cloudinary_init
-from .services import get_cloudinary_image_object, get_cloudinary_video_object
+from .services import (
+    aget_cloudinary_video_object,
+    get_cloudinary_image_object,
+    get_cloudinary_image_srcset,
+    get_cloudinary_video_key,
+    get_cloudinary_video_object,
+)
 
 
 __all__ = [
+    "aget_cloudinary_video_object",
     "cloudinary_init",
+    "get_cloudinary_cache_stats",
     "get_cloudinary_image_object",
+    "get_cloudinary_image_srcset",
+    "get_cloudinary_video_key",
     "get_cloudinary_video_object",
+    "invalidate_cloudinary_cache",
 ]
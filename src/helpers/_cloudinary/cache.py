@@ -0,0 +1,218 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from helpers.metrics import record_cloudinary_build
+
+CLOUDINARY_URL_CACHE_SIZE = getattr(settings, "CLOUDINARY_URL_CACHE_SIZE", 2048)
+CLOUDINARY_URL_CACHE_TIMEOUT = getattr(
+    settings, "CLOUDINARY_URL_CACHE_TIMEOUT", 60 * 60 * 24
+)
+CLOUDINARY_SIGNED_URL_CACHE_TIMEOUT = getattr(
+    settings, "CLOUDINARY_SIGNED_URL_CACHE_TIMEOUT", 60 * 5
+)
+
+
+class LRUCache:
+    """
+    スレッドセーフなプロセス内 LRU キャッシュ。
+
+    キーはタプルで、先頭要素 (インスタンスのラベル) ごとにまとめて削除できます。
+    timeout (秒) を指定した場合、期限切れのエントリは返されません。
+    """
+
+    def __init__(self, maxsize=1024, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value, expires_at = self._data[key]
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = None
+        if self.timeout is not None:
+            expires_at = time.monotonic() + self.timeout
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == prefix]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CloudinaryCache:
+    """
+    Cloudinary の URL などの生成結果をキャッシュします。
+
+    プロセス内の LRU を前段に置き、その後ろに Django のキャッシュフレームワークを使います。
+    キーにはモデルの `updated` を含めるため、保存されたインスタンスは自動的に新しいキーになります。
+    """
+
+    def __init__(self, namespace, maxsize=1024, timeout=None):
+        self.namespace = namespace
+        self.timeout = timeout
+        self.local = LRUCache(maxsize=maxsize, timeout=timeout)
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def make_key(self, instance, field_name, resource, options):
+        """
+        インスタンスとフィールド、画像のバージョン、変換オプションからキャッシュキーを生成します。
+
+        保存されていないインスタンスの場合は None を返します。
+        """
+        if getattr(instance, "pk", None) is None:
+            return None
+        label = f"{instance._meta.label_lower}:{instance.pk}"
+        public_id = getattr(resource, "public_id", None) or f"{resource}"
+        version = getattr(resource, "version", None) or ""
+        updated = getattr(instance, "updated", None)
+        updated = updated.isoformat() if updated else ""
+        return (
+            label,
+            field_name,
+            public_id,
+            version,
+            tuple(sorted(options.items())),
+            updated,
+        )
+
+    def get_cache_key(self, key):
+        digest = hashlib.md5(repr(key).encode("utf-8")).hexdigest()
+        return f"cloudinary:{self.namespace}:{digest}"
+
+    def get_or_build(self, key, build):
+        """
+        キャッシュから値を返し、存在しない場合は `build()` で生成して保存します。
+
+        key が None の場合はキャッシュせずに `build()` の結果を返します。
+        """
+        if key is None:
+            self.record(hit=False)
+            record_cloudinary_build()
+            return build()
+        value = self.local.get(key)
+        if value is not None:
+            self.record(hit=True)
+            return value
+        cache_key = self.get_cache_key(key)
+        value = cache.get(cache_key)
+        self.record(hit=value is not None)
+        if value is None:
+            record_cloudinary_build()
+            value = build()
+            cache.set(cache_key, value, self.timeout)
+        self.local.set(key, value)
+        return value
+
+    async def aget_or_build(self, key, build):
+        """
+        `get_or_build` の非同期版です。Django のキャッシュには非同期 API (aget / aset) を使います。
+
+        プロセス内の LRU と `build()` (URL の生成とテンプレートの描画) はブロックしません。
+        """
+        if key is None:
+            self.record(hit=False)
+            record_cloudinary_build()
+            return build()
+        value = self.local.get(key)
+        if value is not None:
+            self.record(hit=True)
+            return value
+        cache_key = self.get_cache_key(key)
+        value = await cache.aget(cache_key)
+        self.record(hit=value is not None)
+        if value is None:
+            record_cloudinary_build()
+            value = build()
+            await cache.aset(cache_key, value, self.timeout)
+        self.local.set(key, value)
+        return value
+
+    def record(self, hit=True):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """
+        ヒット数、ミス数、ヒット率を辞書で返します。
+        """
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.hits = 0
+            self.misses = 0
+
+    def invalidate(self, instance):
+        """
+        インスタンスに紐づくプロセス内キャッシュを削除します。
+        """
+        if getattr(instance, "pk", None) is None:
+            return
+        self.local.delete_prefix(f"{instance._meta.label_lower}:{instance.pk}")
+
+
+image_url_cache = CloudinaryCache(
+    "image-url",
+    maxsize=CLOUDINARY_URL_CACHE_SIZE,
+    timeout=CLOUDINARY_URL_CACHE_TIMEOUT,
+)
+
+# 署名付き URL の有効期間より短い timeout を設定してください。
+video_url_cache = CloudinaryCache(
+    "video",
+    maxsize=CLOUDINARY_URL_CACHE_SIZE,
+    timeout=CLOUDINARY_SIGNED_URL_CACHE_TIMEOUT,
+)
+
+
+def invalidate_cloudinary_cache(instance):
+    """
+    モデルの保存時に呼び出し、インスタンスのキャッシュ済み URL と動画埋め込み HTML を破棄します。
+    """
+    image_url_cache.invalidate(instance)
+    video_url_cache.invalidate(instance)
+
+
+def get_cloudinary_cache_stats():
+    """
+    各 Cloudinary キャッシュのヒット率などの統計を返します。
+    """
+    return {
+        image_url_cache.namespace: image_url_cache.stats(),
+        video_url_cache.namespace: video_url_cache.stats(),
+    }
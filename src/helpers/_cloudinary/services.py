@@ -1,9 +1,15 @@
 from django.conf import settings
 from django.template.loader import get_template
 
+from .cache import image_url_cache, video_url_cache
+
+CLOUDINARY_SRCSET_WIDTHS = getattr(
+    settings, "CLOUDINARY_SRCSET_WIDTHS", [320, 480, 640, 768, 1024, 1280, 1600]
+)
+
 
 def get_cloudinary_image_object(
-    instance, field_name="image", as_html=False, format=None, width=1200
+    instance, field_name="image", as_html=False, format=None, width=1200, cache=True
 ):
     """
     インスタンスとフィールド名を受け取り、Cloudinaryの画像オブジェクトを返します。
@@ -13,9 +19,12 @@ def get_cloudinary_image_object(
     - as_html: Trueの場合、画像オブジェクトをHTML（<img>タグ）として返します。
     - format: 画像のフォーマット（例： "jpg"、 "png"など）。
     - width: 画像の幅（ピクセル単位）。
+    - cache: Falseの場合、URL をキャッシュせずに生成します (エクスポートなど、一度しか使わない場合)。
 
     指定されたフィールドがインスタンスに存在しない場合、またはフィールドにCloudinaryの画像オブジェクトが関連付けられていない場合、空の文字列を返します。
 
+    URL はインスタンスの `updated` と変換オプションごとにキャッシュされます。
+
     """
 
     if not hasattr(instance, field_name):
@@ -28,10 +37,84 @@ def get_cloudinary_image_object(
         image_options["format"] = format
     if as_html:
         return image_object.image(**image_options)
-    url = image_object.build_url(**image_options)
+    cache_key = None
+    if cache:
+        cache_key = image_url_cache.make_key(
+            instance, field_name, image_object, image_options
+        )
+    url = image_url_cache.get_or_build(
+        cache_key, lambda: image_object.build_url(**image_options)
+    )
     return url
 
 
+def get_srcset_widths(width, widths=None):
+    """
+    表示幅 width の画像に使う srcset の幅のリストを返します。
+
+    表示幅の 1x と 2x に加えて、2x 以下の共通の幅 (CLOUDINARY_SRCSET_WIDTHS) を含めます。
+    共通の幅を使うことで、異なるページでも同じ URL が CDN とブラウザのキャッシュに当たります。
+    """
+    if widths is None:
+        widths = CLOUDINARY_SRCSET_WIDTHS
+    return sorted({w for w in widths if w <= width * 2} | {width, width * 2})
+
+
+def get_cloudinary_image_srcset(
+    instance,
+    field_name="image",
+    width=1200,
+    format=None,
+    widths=None,
+    placeholder=None,
+):
+    """
+    インスタンスとフィールド名を受け取り、レスポンシブ画像用の src と srcset を返します。
+
+    各 URL は `f_auto` (ブラウザが対応する最小のフォーマット) と `q_auto` で変換され、
+    元の画像より大きく拡大しないように `c_limit` を使います。
+
+    - width: 表示幅 (ピクセル単位)。src の幅と srcset の基準になります。
+    - format: 画像のフォーマット (動画から切り出すサムネイルでは "jpg")。
+    - widths: srcset の候補の幅。省略した場合は CLOUDINARY_SRCSET_WIDTHS。
+    - placeholder: アップロード時に計算したプレースホルダー (helpers.get_image_placeholder)。
+
+    画像がない場合は None を返します。結果は画像のバージョン (と `updated`) ごとにまとめてキャッシュされます。
+
+    Returns:
+        dict: {"src": URL, "srcset": "URL 320w, ...", "width": width,
+            "placeholder": placeholder}
+    """
+    if not hasattr(instance, field_name):
+        return None
+    image_object = getattr(instance, field_name)
+    if not image_object:
+        return None
+    image_options = {"fetch_format": "auto", "quality": "auto", "crop": "limit"}
+    if format is not None:
+        image_options["format"] = format
+    srcset_widths = get_srcset_widths(width, widths)
+    cache_key = image_url_cache.make_key(
+        instance,
+        field_name,
+        image_object,
+        {**image_options, "width": width, "srcset": tuple(srcset_widths)},
+    )
+
+    def build():
+        urls = {
+            w: image_object.build_url(width=w, **image_options) for w in srcset_widths
+        }
+        return {
+            "src": urls[width],
+            "srcset": ", ".join(f"{url} {w}w" for w, url in urls.items()),
+            "width": width,
+        }
+
+    image = image_url_cache.get_or_build(cache_key, build)
+    return {**image, "placeholder": placeholder}
+
+
 def get_cloudinary_video_object(
     instance,
     field_name="video",
@@ -60,12 +143,96 @@ def get_cloudinary_video_object(
 
     指定されたフィールドがインスタンスに存在しない場合、またはフィールドにCloudinaryの動画オブジェクトが関連付けられていない場合、空の文字列を返します。
 
+    署名付き URL とレンダリング済みの HTML は、署名の有効期間より短い
+    CLOUDINARY_SIGNED_URL_CACHE_TIMEOUT 秒の間キャッシュされます。
+
     """
-    if not hasattr(instance, field_name):
+    video = _prepare_video(
+        instance,
+        field_name,
+        as_html,
+        width,
+        height,
+        sign_url,
+        fetch_format,
+        quality,
+        controls,
+        autoplay,
+    )
+    if video is None:
         return ""
+    cache_key, build = video
+    return video_url_cache.get_or_build(cache_key, build)
+
+
+async def aget_cloudinary_video_object(
+    instance,
+    field_name="video",
+    as_html=False,
+    width=None,
+    height=None,
+    sign_url=True,  # for private videos
+    fetch_format="auto",
+    quality="auto",
+    controls=True,
+    autoplay=True,
+):
+    """
+    `get_cloudinary_video_object` の非同期版です。キャッシュの読み書きでイベントループをブロックしません。
+    """
+    video = _prepare_video(
+        instance,
+        field_name,
+        as_html,
+        width,
+        height,
+        sign_url,
+        fetch_format,
+        quality,
+        controls,
+        autoplay,
+    )
+    if video is None:
+        return ""
+    cache_key, build = video
+    return await video_url_cache.aget_or_build(cache_key, build)
+
+
+def get_cloudinary_video_key(instance, **options):
+    """
+    動画と変換オプション (`get_cloudinary_video_object` と同じ引数) を識別する文字列を返します。
+
+    URL や埋め込み HTML を生成せずに、ページの ETag などに使えます。動画がない場合は空の文字列を返します。
+    """
+    video = _prepare_video(instance, **options)
+    if video is None:
+        return ""
+    cache_key, _ = video
+    if cache_key is None:
+        return ""
+    return video_url_cache.get_cache_key(cache_key)
+
+
+def _prepare_video(
+    instance,
+    field_name="video",
+    as_html=False,
+    width=None,
+    height=None,
+    sign_url=True,
+    fetch_format="auto",
+    quality="auto",
+    controls=True,
+    autoplay=True,
+):
+    """
+    動画のキャッシュキーと、URL (または HTML) を生成する関数を返します。動画がない場合は None です。
+    """
+    if not hasattr(instance, field_name):
+        return None
     video_object = getattr(instance, field_name)
     if not video_object:
-        return ""
+        return None
     video_options = {
         "sign_url": sign_url,
         "fetch_format": fetch_format,
@@ -79,6 +246,13 @@ def get_cloudinary_video_object(
         video_options["height"] = height
     if height and width:
         video_options["crop"] = "limit"
+    cache_key = video_url_cache.make_key(
+        instance, field_name, video_object, {**video_options, "as_html": as_html}
+    )
+    return cache_key, lambda: _build_video(video_object, video_options, as_html=as_html)
+
+
+def _build_video(video_object, video_options, as_html=False):
     url = video_object.build_url(**video_options)
     if as_html:
         template_name = "videos/snippets/embed.html"
@@ -0,0 +1,12 @@
+from itertools import islice
+
+
+def batched(iterable, size):
+    """
+    iterable を size 件ずつのリストに分割して返すジェネレーター。
+
+    全体をメモリに展開しないため、大量の行の bulk_create / bulk_update に使えます。
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
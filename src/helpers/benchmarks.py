@@ -0,0 +1,61 @@
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+def percentile(samples, pct):
+    """
+    サンプルのパーセンタイル値 (最近傍法) を返します。
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """
+    秒単位のサンプルから件数、平均、p50、p95 (ミリ秒) を返します。
+    """
+    count = len(samples)
+    return {
+        "count": count,
+        "mean_ms": (sum(samples) / count * 1000) if count else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+    }
+
+
+def timed(func, repeat=1):
+    """
+    func を repeat 回実行し、各実行の所要時間 (秒) のリストを返します。
+    """
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """
+    テストランナーと同じ方法でベンチマーク用のデータベースを作成し、終了時に破棄します。
+
+    開発用のデータベースにはデータを書き込みません。
+    テスト環境も設定されるため、`django.test.Client` でビューを呼び出せます。
+    """
+    old_name = connection.settings_dict["NAME"]
+    setup_test_environment()
+    connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False
+    )
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
@@ -0,0 +1,65 @@
+import hashlib
+import math
+
+MIN_SIZE = 64
+
+
+class BloomFilter:
+    """
+    文字列の集合を少ないメモリで表すブルームフィルター。
+
+    `in` が False の場合、その値は確実に追加されていません。
+    True の場合は追加されている可能性があり、error_rate の確率で誤検知 (偽陽性) になります。
+    値を削除することはできないため、削除を反映するには作り直してください。
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        # 小さな集合でもビットの位置が重ならないよう、最低 MIN_SIZE ビットにします
+        self.size = max(MIN_SIZE, bits)
+        # サイズを切り上げた分だけハッシュ数が増えすぎないよう、error_rate の最適値で抑えます
+        self.hash_count = max(
+            1,
+            min(
+                round(self.size / capacity * math.log(2)),
+                math.ceil(-math.log2(error_rate)),
+            ),
+        )
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    @classmethod
+    def from_values(cls, values, error_rate=0.01, headroom=1.5):
+        """
+        values から作成します。作成後に追加される値のために、容量に headroom 倍の余裕を持たせます。
+        """
+        values = list(values)
+        bloom = cls(len(values) * headroom, error_rate=error_rate)
+        for value in values:
+            bloom.add(value)
+        return bloom
+
+    def get_positions(self, value):
+        # 1つのダイジェストから2つのハッシュを取り出し、k 個の位置を生成します
+        # (enhanced double hashing: 増分も変化させ、size が小さくても位置が周期的に重ならないようにします)
+        digest = hashlib.blake2b(f"{value}".encode("utf-8"), digest_size=16).digest()
+        position = int.from_bytes(digest[:8], "little") % self.size
+        step = int.from_bytes(digest[8:], "little") % self.size
+        positions = []
+        for i in range(self.hash_count):
+            positions.append(position)
+            position = (position + step) % self.size
+            step = (step + i + 1) % self.size
+        return positions
+
+    def add(self, value):
+        for position in self.get_positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.get_positions(value)
+        )
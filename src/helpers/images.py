@@ -0,0 +1,57 @@
+import base64
+import io
+import warnings
+
+from django.conf import settings
+from PIL import Image, ImageFilter, ImageOps, UnidentifiedImageError, features
+
+IMAGE_PLACEHOLDER_SIZE = getattr(settings, "IMAGE_PLACEHOLDER_SIZE", 16)
+PLACEHOLDER_FORMAT = "WEBP" if features.check("webp") else "PNG"
+
+
+def get_image_placeholder(file, size=IMAGE_PLACEHOLDER_SIZE):
+    """
+    画像ファイルから、ページにインラインで埋め込める小さなぼかし画像と代表色を計算します。
+
+    Cloudinary を使わずにローカルのファイルだけで計算するため、アップロード前
+    (CloudinaryField.pre_save の前) に呼び出します。ファイルオブジェクトの位置は先頭に戻されます。
+
+    Args:
+        file: 画像ファイルのパス、またはファイルオブジェクト
+        size (int, optional): ぼかし画像の長辺のピクセル数. Defaults to 16.
+
+    Returns:
+        dict: {"src": data URI, "color": "#rrggbb", "width": 元の幅, "height": 元の高さ}。
+            画像として読み込めない場合や、大きすぎる場合 (Image.MAX_IMAGE_PIXELS 超) は None
+    """
+    try:
+        with warnings.catch_warnings():
+            # MAX_IMAGE_PIXELS を超える画像 (展開するとメモリを使い切る画像) は読み込みません
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            with Image.open(file) as image:
+                image = ImageOps.exif_transpose(image)
+                width, height = image.size
+                image = image.convert("RGB")
+                image.thumbnail((size, size))
+    except (
+        UnidentifiedImageError,
+        OSError,
+        Image.DecompressionBombError,
+        Image.DecompressionBombWarning,
+    ):
+        return None
+    finally:
+        if hasattr(file, "seek"):
+            file.seek(0)
+    red, green, blue = image.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+    buffer = io.BytesIO()
+    image.filter(ImageFilter.GaussianBlur(1)).save(
+        buffer, PLACEHOLDER_FORMAT, quality=40
+    )
+    data = base64.b64encode(buffer.getvalue()).decode("ascii")
+    return {
+        "src": f"data:image/{PLACEHOLDER_FORMAT.lower()};base64,{data}",
+        "color": f"#{red:02x}{green:02x}{blue:02x}",
+        "width": width,
+        "height": height,
+    }
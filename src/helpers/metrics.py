@@ -0,0 +1,105 @@
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import Template as DjangoTemplate
+from django.template.backends.django import reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+_request_metrics = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """
+    1つのリクエストで発生したクエリ、テンプレートのレンダリング時間、
+    Cloudinary の URL 生成回数を記録します。
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.cloudinary_builds = 0
+        self._template_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        """
+        `connection.execute_wrapper` に渡すラッパー。
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries.append((sql, repr(params)))
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    @property
+    def duplicate_count(self):
+        """
+        同じ SQL とパラメーターで繰り返し実行されたクエリの数。
+        """
+        return sum(count - 1 for count in Counter(self.queries).values() if count > 1)
+
+    def get_repeated_sql(self, threshold=5):
+        """
+        パラメーターだけが異なる同じ SQL が threshold 回以上実行された場合、
+        (SQL, 回数) のリストを返します (N+1 クエリの兆候)。
+        """
+        counter = Counter(sql for sql, _ in self.queries)
+        return [(sql, count) for sql, count in counter.most_common() if count >= threshold]
+
+
+def start_request_metrics():
+    metrics = RequestMetrics()
+    return metrics, _request_metrics.set(metrics)
+
+
+def stop_request_metrics(token):
+    _request_metrics.reset(token)
+
+
+def get_request_metrics():
+    return _request_metrics.get()
+
+
+def record_cloudinary_build():
+    metrics = get_request_metrics()
+    if metrics is not None:
+        metrics.cloudinary_builds += 1
+
+
+class InstrumentedTemplate(DjangoTemplate):
+    def render(self, context=None, request=None):
+        metrics = get_request_metrics()
+        if metrics is None:
+            return super().render(context=context, request=request)
+        metrics._template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context=context, request=request)
+        finally:
+            metrics._template_depth -= 1
+            if metrics._template_depth == 0:
+                metrics.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    レンダリング時間をリクエストのメトリクスに記録する Django テンプレートバックエンド。
+
+    REQUEST_METRICS_ENABLED が有効な場合に TEMPLATES の BACKEND として使用されます。
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)